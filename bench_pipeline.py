@@ -0,0 +1,128 @@
+import argparse
+import contextlib
+import io
+import json
+import time
+
+import numpy as np
+
+import camera_classifier as cc
+import metrics
+from datasets import iter_frames
+from frame import Frame
+from mock_ollama import MockOllama, DEFAULT_LATENCY
+
+# -------------------------------------
+# End-to-end latency benchmark against a local Ollama stand-in.
+# Runs the real stage functions (encode, food-only call, CV stain check,
+# flags call, parse + decide) and the full classify path on frames from
+# images/, then reports p50/p95/p99 per stage and items/minute.
+#
+#   python bench_pipeline.py --items 50
+#   python bench_pipeline.py --flags-latency lognormal:2.5:0.4 --mode single_pass
+#   python bench_pipeline.py --save baseline.json
+#   python bench_pipeline.py --compare baseline.json      # exit 1 on a p95 regression
+# -------------------------------------
+PERCENTILES = (50, 95, 99)
+
+
+def timed(samples, name, fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    result = fn(*args, **kwargs)
+    samples.setdefault(name, []).append(time.perf_counter() - t0)
+    return result
+
+
+def bench_item(source, samples, mode, concurrent):
+    # a fresh Frame per item so the upload encode is measured, not served from cache
+    frame = Frame(source.image, source=source.source)
+    timed(samples, "encode", lambda: frame.b64)
+
+    timed(samples, "food_only", cc.call_llava_food_only, frame)
+    _paper_like, paper_stained, _info = timed(samples, "cv_stain", cc.cv_detect_paper_and_stains,
+                                              frame, debug=False)
+    raw = timed(samples, "flags", cc.call_llava_flags, frame)
+    timed(samples, "decide", lambda: cc.decide_bin(cc.parse_flags(raw), paper_stained=paper_stained))
+
+    # end-to-end in the configured mode, again from a cold frame
+    frame = Frame(source.image, source=source.source)
+    label, _flags = timed(samples, "end_to_end", cc.classify_frame_with_flags, frame, mode=mode,
+                          concurrent=concurrent, use_cache=False, use_fast_tier=False)
+    return label
+
+
+def summarise(samples):
+    return {name: {f"p{p}": float(np.percentile(values, p)) for p in PERCENTILES}
+            for name, values in samples.items()}
+
+
+def compare(summary, baseline, tolerance):
+    regressions = []
+    for name, stats in summary.items():
+        old = baseline.get(name)
+        if old and stats["p95"] > old["p95"] * (1 + tolerance):
+            regressions.append((name, old["p95"], stats["p95"]))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the classify pipeline against a mock Ollama.")
+    parser.add_argument("folder", nargs="?", default="images")
+    parser.add_argument("--items", type=int, default=20, help="items to run (images are cycled)")
+    parser.add_argument("--mode", default=cc.CLASSIFY_MODE, choices=["two_stage", "single_pass", "chat"])
+    parser.add_argument("--sequential", action="store_true", help="run two_stage without concurrent stages")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="show the pipeline's own output")
+    parser.add_argument("--save", help="write the summary to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON from --save; exit 1 if any stage p95 regresses")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed p95 slowdown vs baseline")
+    for kind in DEFAULT_LATENCY:
+        parser.add_argument(f"--{kind}-latency", default=DEFAULT_LATENCY[kind])
+    args = parser.parse_args()
+
+    images = list(iter_frames(args.folder))
+    if not images:
+        print("No images found.")
+        raise SystemExit(0)
+
+    latency = {kind: getattr(args, f"{kind}_latency") for kind in DEFAULT_LATENCY}
+    mock = MockOllama(latency, seed=args.seed).start()
+    cc.configure(ollama=mock.url)
+    concurrent = not args.sequential
+    print(f"\n🧪 {args.items} item(s) from {len(images)} image(s), mode={args.mode}"
+          f"{' (concurrent)' if concurrent and args.mode == 'two_stage' else ''}, mock at {mock.url}")
+
+    samples = {}
+    labels = {}
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with quiet:
+        cc.warmup()
+        for i in range(args.items):
+            label = bench_item(images[i % len(images)], samples, args.mode, concurrent)
+            labels[label] = labels.get(label, 0) + 1
+    mock.stop()
+
+    summary = summarise(samples)
+    print(f"\n{'stage':<12}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for name, stats in summary.items():
+        print(f"{name:<12}" + "".join(f"{stats[f'p{p}'] * 1000:>7.1f}ms" for p in PERCENTILES))
+
+    end_to_end = samples["end_to_end"]
+    print(f"\nThroughput: {60.0 * len(end_to_end) / sum(end_to_end):.1f} items/min (end-to-end, one at a time)")
+    print("Decisions: " + ", ".join(f"{k}={v}" for k, v in sorted(labels.items())))
+    print(f"Mock calls: {mock.calls}, streams hung up early: {mock.aborted}, "
+          f"chat turns reusing the image: {mock.context_reused}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        print(f"✅ Summary written to {args.save}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(summary, json.load(f), args.tolerance)
+        for name, old, new in regressions:
+            print(f"❌ {name}: p95 {old * 1000:.1f}ms -> {new * 1000:.1f}ms")
+        if regressions:
+            raise SystemExit(1)
+        print("✅ No stage regressed beyond tolerance")
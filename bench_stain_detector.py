@@ -0,0 +1,79 @@
+import os
+import sys
+import time
+
+import cv2
+
+from stain_detector import StainDetector, load_stain_config
+from camera_classifier import cv_detect_paper_and_stains_reference, STAIN_RATIO_THRESHOLD
+
+# -------------------------------------
+# Micro-benchmark: reference vs fast-path stain detector.
+# Frames come from images/ (or a folder given on the command line),
+# upscaled to a typical camera resolution for the full-res case.
+# -------------------------------------
+CAMERA_RESOLUTION = (1920, 1080)   # (width, height)
+REPEATS = 50
+
+
+def load_frames(folder):
+    frames = []
+    for filename in sorted(os.listdir(folder)):
+        if filename.lower().endswith((".jpg", ".jpeg", ".png")):
+            img = cv2.imread(os.path.join(folder, filename))
+            if img is not None:
+                frames.append(cv2.resize(img, CAMERA_RESOLUTION, interpolation=cv2.INTER_LINEAR))
+    return frames
+
+
+def time_per_frame(fn, frames, repeats=REPEATS):
+    fn(frames[0])  # warm caches / allocate buffers
+    t0 = time.perf_counter()
+    for _ in range(repeats):
+        for img in frames:
+            fn(img)
+    return (time.perf_counter() - t0) / (repeats * len(frames)) * 1000
+
+
+if __name__ == "__main__":
+    folder = sys.argv[1] if len(sys.argv) > 1 else "images"
+    frames = load_frames(folder)
+    if not frames:
+        print("No images found.")
+        raise SystemExit(0)
+
+    # the settings the sorter uses (stain_config.json when present); the
+    # reference is run with each detector's own settings
+    settings = {"ratio_threshold": STAIN_RATIO_THRESHOLD, **load_stain_config()}
+    fast_700 = StainDetector(**settings)
+    fast_700_int = StainDetector(**settings, fast_resize=True)
+    fast_full = StainDetector(**settings, max_side=None)
+
+    def reference_700(img):
+        return cv_detect_paper_and_stains_reference(img, fast_700)
+
+    def reference_full_res(img):
+        return cv_detect_paper_and_stains_reference(img, fast_full)
+
+    # same answers as the reference on every frame (fast_resize: same decisions)
+    agree = 0
+    for img in frames:
+        for ref, fast in [(reference_700(img), fast_700.detect(img)),
+                          (reference_full_res(img), fast_full.detect(img))]:
+            assert ref[:2] == fast[:2] and ref[2]["paper_pixels"] == fast[2]["paper_pixels"] \
+                and ref[2]["stain_pixels"] == fast[2]["stain_pixels"], (ref, fast)
+        ref = reference_700(img)
+        agree += fast_700_int.detect(img)[:2] == ref[:2]
+
+    w, h = CAMERA_RESOLUTION
+    print(f"\n {len(frames)} frame(s) at {w}x{h}, {REPEATS} repeats, cv2 threads={cv2.getNumThreads()}\n")
+    print(f"{'case':<28}{'reference':>12}{'fast path':>12}{'speedup':>10}")
+    for name, ref_fn, fast_fn in [
+        ("downscaled to 700px", reference_700, fast_700.detect),
+        ("700px, fast_resize", reference_700, fast_700_int.detect),
+        (f"full resolution {w}x{h}", reference_full_res, fast_full.detect),
+    ]:
+        ref_ms = time_per_frame(ref_fn, frames)
+        fast_ms = time_per_frame(fast_fn, frames)
+        print(f"{name:<28}{ref_ms:>10.2f}ms{fast_ms:>10.2f}ms{ref_ms / fast_ms:>9.2f}x")
+    print(f"\nfast_resize decisions match the reference on {agree}/{len(frames)} frame(s)")
@@ -0,0 +1,95 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+# -------------------------------------
+# Cold-start budget check. Every measurement runs in a fresh interpreter
+# (nothing already imported), with fake hardware and a local mock Ollama:
+#
+#   import    `import <module>` for the entry scripts
+#   startup   camera_classifier_led's parallel start-up (camera, LEDs,
+#             pipeline import + warmup) from launch to ready
+#
+# Exits 1 when a median is over its budget. On the Pi, run with the real
+# hardware backend (--hardware real) to include camera open and GPIO.
+# For a per-module import breakdown: python -X importtime -c "import camera_classifier"
+#
+#   python bench_startup.py
+#   python bench_startup.py --runs 10 --startup-budget 3
+# -------------------------------------
+IMPORT_BUDGETS = {
+    "camera_classifier_led": 0.1,      # light: no cv2 / numpy / requests / gpiozero
+    "camera_classifier": None,         # reference only (the heavy pipeline)
+}
+STARTUP_BUDGET_SECONDS = 2.0       # fake hardware + mock model; the Pi's real budget is in camera_classifier_led
+
+IMPORT_SNIPPET = """
+import time
+t0 = time.perf_counter()
+import {module}
+print(time.perf_counter() - t0)
+"""
+
+STARTUP_SNIPPET = """
+import json, time
+t0 = time.perf_counter()
+import ollama_client
+from mock_ollama import MockOllama
+mock = MockOllama(load_seconds=0.0, vision_load_seconds=0.0).start()   # budget our overhead, not model loading
+_make_client = ollama_client.make_client
+ollama_client.make_client = lambda urls, **kwargs: _make_client([mock.url], **kwargs)
+import camera_classifier_led as led
+startup = led.StartupJobs(started=t0)
+startup.start("camera", led.make_camera)
+startup.start("leds", led.get_leds)
+startup.start("pipeline", led.load_pipeline)
+startup.wait()
+mock.stop()
+print(json.dumps(dict(startup.seconds, errors=sorted(startup.errors))))
+"""
+
+
+def run_snippet(code, hardware):
+    env = dict(os.environ, SORTER_HARDWARE=hardware)
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env,
+                         cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+    return out.stdout.strip().splitlines()[-1]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure import and start-up time against a budget.")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per measurement")
+    parser.add_argument("--hardware", default="fake", choices=["fake", "real"])
+    parser.add_argument("--startup-budget", type=float, default=STARTUP_BUDGET_SECONDS)
+    args = parser.parse_args()
+
+    over = []
+    print(f"\n⏱️ Median of {args.runs} fresh interpreter(s), hardware={args.hardware}\n")
+    for module, budget in IMPORT_BUDGETS.items():
+        times = [float(run_snippet(IMPORT_SNIPPET.format(module=module), args.hardware))
+                 for _ in range(args.runs)]
+        median = float(np.median(times))
+        verdict = "" if budget is None else f"  (budget {budget * 1000:.0f}ms)"
+        print(f"import {module:<24}{median * 1000:>8.1f}ms{verdict}")
+        if budget is not None and median > budget:
+            over.append(f"import {module}")
+
+    runs = [json.loads(run_snippet(STARTUP_SNIPPET, args.hardware)) for _ in range(args.runs)]
+    errors = sorted({e for r in runs for e in r.pop("errors")})
+    print(f"\n{'startup job':<31}{'median':>10}")
+    for name in runs[0]:
+        print(f"{name:<31}{np.median([r[name] for r in runs]) * 1000:>8.1f}ms")
+    total = float(np.median([r["total"] for r in runs]))
+    if errors:
+        print(f"⚠️ Start-up job(s) failed: {', '.join(errors)}")
+    if total > args.startup_budget:
+        over.append("startup")
+
+    if over:
+        print(f"\n❌ Over budget: {', '.join(over)}")
+        raise SystemExit(1)
+    print(f"\n✅ Within budget (start-up {total:.2f}s <= {args.startup_budget:.1f}s)")
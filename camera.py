@@ -1,23 +1,22 @@
 import cv2
-import time
 
-# Open your Mac's built-in camera (0 = default)
-camera = cv2.VideoCapture(0)
+from camera_stream import CameraStream
 
-if not camera.isOpened():
+# Open your Mac's built-in camera (0 = default) and keep it streaming
+try:
+    camera = CameraStream(0).start()
+except RuntimeError:
     print("❌ Could not access the camera.")
     exit()
 
-print("📷 Starting camera... capturing in 1 second.")
-time.sleep(1)  # wait for camera to adjust lighting
-
-ret, frame = camera.read()
-if not ret:
+print("📷 Starting camera... capturing once exposure settles.")
+_ts, frame = camera.wait_for_frame()
+if frame is None:
     print("❌ Failed to capture image.")
 else:
     filename = "capture.jpg"
     cv2.imwrite(filename, frame)
     print(f"✅ Image saved as {filename}")
 
-camera.release()
+camera.stop()
 cv2.destroyAllWindows()
\ No newline at end of file
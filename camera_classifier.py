@@ -1,8 +1,22 @@
+import re
 import cv2
-import time
-import base64
-import requests
+import threading
+import contextvars
 import numpy as np
+import requests
+from concurrent.futures import Future
+
+from hardware import make_camera
+from frame import Frame, as_frame, load_upload_config
+from ollama_client import make_client, timings, backend_clients, CancelEvent
+from frame_cache import ResultCache, dhash
+from stain_detector import StainDetector, load_stain_config
+from fast_classifier import load_if_present
+from model_keeper import ModelKeeper
+import metrics
+from metrics import span, inc, observe, trace, current_trace
+from results_store import ResultStore
+from decision_engine import FLAG_KEYS, engine_from_config
 
 # ============================================================
 # CONFIG
@@ -10,86 +24,237 @@ import numpy as np
 # If Ollama is running on another device, change this to:
 # OLLAMA_API_URL = "http://<YOUR_MAC_IP>:11434/api/generate"
 OLLAMA_API_URL = "http://localhost:11434/api/generate"
+# Several Ollama hosts: calls go to the fastest healthy one (ollama_client.OllamaPool), e.g.
+# OLLAMA_API_URLS = [OLLAMA_API_URL, "http://<OTHER_MAC_IP>:11434/api/generate"]
+OLLAMA_API_URLS = [OLLAMA_API_URL]
+HEDGE_REQUESTS = True              # duplicate a call to a 2nd host once it passes the 1st host's p95
 
 MODEL = "llava:7b"                 # faster than 13b
 TIMEOUT = (5, 25)                  # (connect_timeout, read_timeout)
 KEEP_ALIVE = "10m"                 # keep model in RAM between runs
-
-# CV stain detector threshold (paper/cardboard only)
+KEEPER_INTERVAL = 30.0             # long-running scripts: /api/ps residency check period (0 = off)
+COLD_LOAD_SECONDS = 0.5            # a call whose load_duration exceeds this counts as cold
+COLD_FIRST_TOKEN_SECONDS = 5.0     # early-stopped streams (no load_duration): first token later than this = cold
+RETRIES = 2                        # retries for connection errors / 5xx
+BREAKER_FAILURES = 3               # consecutive failures before failing fast
+BREAKER_RESET_SECONDS = 15.0       # how long to fail fast before re-trying the server
+
+# CV stain detector threshold (paper/cardboard only). stain_config.json from
+# tune_stain_detector.py overrides it and the HSV ranges of the fast path.
 STAIN_RATIO_THRESHOLD = 0.012      # tune up/down
+CV_FAST_PATH = True                # single-pass LUT detector with reused buffers (stain_detector.py)
+# At the 700px working size the LUT pass alone is no faster than the reference
+# (1.00x in bench_stain_detector.py); the win is the resize. The integer-factor
+# downscale measured 1.8x with the same stained/not-stained decisions on every
+# test frame, though pixel counts differ slightly. False = identical counts.
+CV_FAST_RESIZE = True
+
+# "two_stage"  : food-only call, then flags call (default)
+# "single_pass": one call returns the food answer + all 8 flags
+# "chat"       : both questions as turns of one /api/chat conversation,
+#                so the image is only processed once
+CLASSIFY_MODE = "two_stage"
+
+# Run CV + speculative Stage 2 alongside Stage 1 (False = strictly sequential)
+CONCURRENT_STAGES = True
+
+# Stream tokens and hang up as soon as the bin is determined
+STREAM_RESPONSES = True
+
+# Perceptual-hash cache: reuse the last result for a near-identical frame
+RESULT_CACHE_ENABLED = True
+CACHE_MAX_DISTANCE = 4             # Hamming bits out of 64 (item region, per station); see RESULT_CACHE.stats()
+CACHE_TTL_SECONDS = 120.0
+
+# On-device fast tier (train with train_fast_classifier.py). Missing file -> disabled.
+FAST_TIER_MODEL = "fast_classifier.npz"
+FAST_TIER_THRESHOLD = 0.9          # confidence needed to skip LLaVA
+
+# Frames stay in memory; set to a path to also write each capture to disk
+SAVE_CAPTURE_PATH = None           # e.g. "capture.jpg"
+
+# Per-site bin policy (see decision_engine.py); missing file -> built-in default rules
+DECISION_RULES_PATH = "decision_rules.json"
+
+# Every decision (flags, CV metrics, timings, frame hash) is appended to
+# SQLite by a background writer; frames are kept content-addressed. None = off.
+RESULTS_DB = "results.db"
+RESULTS_FRAMES_DIR = "frames"
+
+# Shared pooled client: keep-alive connections, retries, circuit breaker.
+# While the breaker is open every call raises immediately -> TRASH fallback.
+# With several URLs this is an OllamaPool (routing, failover, hedging).
+OLLAMA = make_client(
+    OLLAMA_API_URLS,
+    timeout=TIMEOUT,
+    retries=RETRIES,
+    hedge=HEDGE_REQUESTS,
+    breaker_failures=BREAKER_FAILURES,
+    breaker_reset_seconds=BREAKER_RESET_SECONDS,
+)
+
+# Upload size/quality picked by tune_upload_size.py (frame.py defaults otherwise)
+load_upload_config()
+
+STAIN_DETECTOR = StainDetector(**{"ratio_threshold": STAIN_RATIO_THRESHOLD, "fast_resize": CV_FAST_RESIZE,
+                                  **load_stain_config()})
+RESULT_CACHE = ResultCache(max_distance=CACHE_MAX_DISTANCE, ttl_seconds=CACHE_TTL_SECONDS)
+FAST_TIER = load_if_present(FAST_TIER_MODEL)   # .stats() -> fraction served without LLaVA
+DECISION_ENGINE = engine_from_config(DECISION_RULES_PATH)
+RESULTS = ResultStore(RESULTS_DB, RESULTS_FRAMES_DIR) if RESULTS_DB else None
+
+
+def configure(ollama=None, results=None, trace_path=None):
+    """
+    Set up the pipeline for a benchmark / evaluation script instead of the live sorter.
+    ollama: client to use (OllamaClient, pool, RecordedOllama) or URL(s) of a mock or
+    test server, called with no retries; None keeps OLLAMA.
+    results: ResultStore for the decisions, None to record nothing.
+    trace_path: per-item trace file (metrics.configure), None for no traces.
+    """
+    global OLLAMA, RESULTS
+    if isinstance(ollama, (str, list)):
+        ollama = make_client(ollama, timeout=TIMEOUT, retries=0)
+    if ollama is not None:
+        OLLAMA = ollama
+    if RESULTS is not None and RESULTS is not results:
+        RESULTS.close()
+    RESULTS = results
+    metrics.configure(trace_path=trace_path, station=metrics.STATION)
+
 
 # ============================================================
 # CAPTURE IMAGE (USB CAM / OPENCV)
 # ============================================================
-def capture_image():
-    camera = cv2.VideoCapture(0)
-    if not camera.isOpened():
-        print("❌ Could not access camera.")
-        return None
-
-    print("📷 Starting camera... capturing in 1 second.")
-    time.sleep(1)
-
-    ret, frame = camera.read()
-    camera.release()
-    cv2.destroyAllWindows()
-
-    if not ret:
+def capture_image(camera, save_path=SAVE_CAPTURE_PATH):
+    """
+    Grab the freshest frame from an already-open CameraStream as an in-memory Frame.
+    """
+    with span("capture"):
+        ts, image = camera.wait_for_frame()
+    if image is None:
+        inc("capture_failures_total")
         print("❌ Failed to capture image.")
         return None
 
-    filename = "capture.jpg"
-    cv2.imwrite(filename, frame)
-    print(f"✅ Image saved as {filename}")
-    return filename
+    frame = Frame(image, timestamp=ts, source=camera.source)
+    print(f"✅ Captured {image.shape[1]}x{image.shape[0]} frame")
+    if save_path:
+        frame.save(save_path)
+        print(f"💾 Image saved as {save_path}")
+    return frame
 
 
 # ============================================================
 # OPTIONAL: WARMUP (reduces first-call lag)
+# A tiny image goes along with the prompt: a text-only call loads the
+# language model but leaves the vision projector for the first real item.
 # ============================================================
-def warmup():
+WARMUP_IMAGE = Frame(np.full((32, 32, 3), 128, np.uint8))
+
+
+def warmup(client=None):
+    """
+    Load the model through the image path on `client`, or on every Ollama
+    backend at once. Returns True when the model answered (on any backend).
+    """
+    if client is not None:
+        return _warm(client)
+    clients = backend_clients(OLLAMA)
+    if len(clients) == 1:
+        return _warm(clients[0])
+    # each backend loads its own copy; in parallel start-up costs the slowest one
+    futures = [_run_async(_warm, c) for c in clients]
+    return any([f.result() for f in futures])
+
+
+def _warm(client):
+    payload = {
+        "model": MODEL,
+        "prompt": "Reply with OK.",
+        "images": [WARMUP_IMAGE.b64],
+        "stream": False,
+        "keep_alive": KEEP_ALIVE,
+        "options": {"temperature": 0.0, "num_predict": 1},
+    }
+    where = f" on {client.url}" if client is not OLLAMA else ""
     try:
-        payload = {
-            "model": MODEL,
-            "prompt": "Reply with OK.",
-            "stream": False,
-            "keep_alive": KEEP_ALIVE,
-            "options": {"temperature": 0.0, "num_predict": 4},
-        }
-        requests.post(OLLAMA_API_URL, json=payload, timeout=TIMEOUT).raise_for_status()
-    except Exception:
-        pass
+        with span("warmup"):
+            body = client.generate(payload)
+    except Exception as e:
+        _count_error("warmup", e)
+        print(f"⚠️ Model warmup failed{where} (first item will be slow):", e)
+        return False
+    load = body.get("load_duration", 0) / 1e9
+    print(f"🔥 Model warm{where}{f' (loaded in {load:.1f}s)' if load >= COLD_LOAD_SECONDS else ''}")
+    return True
+
+
+def start_model_keeper():
+    """Background residency keeper for long-running scripts (see model_keeper.py), or None."""
+    if not KEEPER_INTERVAL:
+        return None
+    return ModelKeeper(OLLAMA, MODEL, KEEP_ALIVE, warm=warmup, interval=KEEPER_INTERVAL).start()
 
 
 # ============================================================
 # FAST CV STAIN DETECTOR (paper/cardboard)
 # ============================================================
-def cv_detect_paper_and_stains(image_path, debug=True):
+def cv_detect_paper_and_stains(frame, debug=True):
     """
     Detect paper-like area and obvious orange/brown/red-ish stains on it.
+    frame: Frame, BGR ndarray or image path.
     Returns: (paper_like_present, stained, info_dict)
     """
-    img = cv2.imread(image_path)
-    if img is None:
-        return False, False, {"reason": "cv2.imread failed"}
+    frame = as_frame(frame)
+    if frame is None:
+        return False, False, {"reason": "image decode failed"}
+
+    with span("cv_stain"):
+        if CV_FAST_PATH:
+            paper_like_present, stained, info = STAIN_DETECTOR.detect(frame.image)
+        else:
+            paper_like_present, stained, info = cv_detect_paper_and_stains_reference(frame.image)
+
+    item = current_trace()
+    if item is not None:
+        item.fields["cv"] = dict(info, paper_like=paper_like_present, paper_stained=stained)
+
+    if debug:
+        print(f"🧪 CV paper_pixels={info['paper_pixels']}, stain_pixels={info['stain_pixels']}, "
+              f"ratio={info['stain_ratio']:.4f} (thresh={info['threshold']})")
+
+    return paper_like_present, stained, info
+
+
+def cv_detect_paper_and_stains_reference(img, settings=None):
+    """
+    Original step-by-step implementation (resize, HSV, inRange x3, bitwise,
+    morphology). Kept as the reference the fast path is checked against.
+    Thresholds, HSV ranges and working size come from `settings`, a
+    StainDetector (default STAIN_DETECTOR, so stain_config.json applies to
+    both paths); its fast_resize is a fast-path shortcut and is ignored here.
+    """
+    d = settings or STAIN_DETECTOR
 
     # Downscale for speed
     h, w = img.shape[:2]
-    scale = 700 / max(h, w)
+    scale = 1.0 if d.max_side is None else d.max_side / max(h, w)
     if scale < 1.0:
         img = cv2.resize(img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
 
     hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
 
     # Paper-like: low saturation + bright
-    paper_mask = cv2.inRange(hsv, (0, 0, 120), (179, 70, 255))
+    paper_mask = cv2.inRange(hsv, (0, 0, d.paper_v_min), (179, d.paper_s_max, 255))
     paper_pixels = int(np.count_nonzero(paper_mask))
-    paper_like_present = paper_pixels > 2500
+    paper_like_present = paper_pixels > d.min_paper_pixels
 
     # Stain-like: orange/brown/red-ish
-    stain_mask1 = cv2.inRange(hsv, (0, 60, 50), (25, 255, 255))
-    stain_mask2 = cv2.inRange(hsv, (160, 60, 50), (179, 255, 255))
-    stain_mask = cv2.bitwise_or(stain_mask1, stain_mask2)
+    stain_mask = np.zeros_like(paper_mask)
+    for lo, hi in d.stain_h_ranges:
+        in_range = cv2.inRange(hsv, (lo, d.stain_s_min, d.stain_v_min), (hi, 255, 255))
+        stain_mask = cv2.bitwise_or(stain_mask, in_range)
 
     stain_on_paper = cv2.bitwise_and(stain_mask, paper_mask)
 
@@ -100,30 +265,21 @@ def cv_detect_paper_and_stains(image_path, debug=True):
     stain_pixels = int(np.count_nonzero(stain_on_paper))
     ratio = stain_pixels / max(paper_pixels, 1)
 
-    stained = paper_like_present and (ratio >= STAIN_RATIO_THRESHOLD)
+    stained = paper_like_present and (ratio >= d.ratio_threshold)
 
     info = {
         "paper_pixels": paper_pixels,
         "stain_pixels": stain_pixels,
         "stain_ratio": ratio,
-        "threshold": STAIN_RATIO_THRESHOLD,
+        "threshold": d.ratio_threshold,
     }
-
-    if debug:
-        print(f"🧪 CV paper_pixels={paper_pixels}, stain_pixels={stain_pixels}, "
-              f"ratio={ratio:.4f} (thresh={STAIN_RATIO_THRESHOLD})")
-
     return paper_like_present, stained, info
 
 
 # ============================================================
 # STAGE 1: FOOD-ONLY CHECK (makes fruit almost impossible to miss)
 # ============================================================
-def call_llava_food_only(image_path):
-    with open(image_path, "rb") as f:
-        img_b64 = base64.b64encode(f.read()).decode("utf-8")
-
-    prompt = """
+FOOD_ONLY_PROMPT = """
 Answer with EXACTLY ONE WORD: YES or NO.
 
 Question: Is there edible food (fruit/vegetables/leftovers) as the main object?
@@ -133,32 +289,161 @@ Rules:
 - Do NOT guess. If unsure -> NO
 """.strip()
 
+FOOD_ONLY_OPTIONS = {"temperature": 0.0, "top_p": 0.1, "num_predict": 5}
+
+
+def call_llava_food_only(frame, cancel=None, stats=None):
+    img_b64 = as_frame(frame).b64
+
     payload = {
         "model": MODEL,
-        "prompt": prompt,
+        "prompt": FOOD_ONLY_PROMPT,
         "images": [img_b64],
         "stream": False,
         "keep_alive": KEEP_ALIVE,
-        "options": {"temperature": 0.0, "top_p": 0.1, "num_predict": 5},
+        "options": FOOD_ONLY_OPTIONS,
     }
 
-    r = requests.post(OLLAMA_API_URL, json=payload, timeout=TIMEOUT)
-    r.raise_for_status()
-    return r.json().get("response", "").strip().upper()
+    stats = {} if stats is None else stats
+    with span("food_only"):
+        if STREAM_RESPONSES:
+            text, early = OLLAMA.generate_stream(payload, stop=_food_answer_stop(cancel), stats=stats, cancel=cancel)
+            if early and _cancelled("food_only", cancel):
+                return _food_answer(text)
+        else:
+            body = OLLAMA.generate(payload)
+            stats.update(timings(body))
+            text = body.get("response", "")
+    _record_prompt_eval("food_only", stats)
+    return _food_answer(text)
+
+
+def _food_answer(text):
+    answer = text.strip().upper()
+    m = _FOOD_ANSWER.match(answer)
+    return m.group(1) if m else answer
 
 
 # ============================================================
 # STAGE 2: MATERIAL/CONTAINS FLAGS
 # ============================================================
-def call_llava_flags(image_path):
-    with open(image_path, "rb") as f:
-        img_b64 = base64.b64encode(f.read()).decode("utf-8")
+FLAGS_PROMPT = """
+You are a waste-sorting detector.
+
+Output EXACTLY these 8 lines, nothing else. Use only YES or NO:
+
+FOOD_PRESENT=<YES|NO>
+GLASS_PRESENT=<YES|NO>
+METAL_PRESENT=<YES|NO>
+PAPER_PRESENT=<YES|NO>
+PLASTIC_BOTTLE_OR_TUB_PRESENT=<YES|NO>
+WRAPPER_OR_FILM_PRESENT=<YES|NO>
+SMALL_RIGID_PLASTIC_PRESENT=<YES|NO>
+CONTAINS_OTHER_ITEM=<YES|NO>
+
+Definitions (do NOT guess):
+- FOOD_PRESENT = visible food scraps (fruit/vegetables/leftovers).
+- PAPER_PRESENT = paper/cardboard item (box, paper bag, napkin/tissue/paper towel).
+- GLASS_PRESENT = glass cup/bottle/jar.
+- METAL_PRESENT = metal can/foil/metal piece.
+- PLASTIC_BOTTLE_OR_TUB_PRESENT = plastic bottle/jug/tub/cup (packaging).
+- WRAPPER_OR_FILM_PRESENT = plastic wrapper/bag/cling film.
+- SMALL_RIGID_PLASTIC_PRESENT = floss pick, utensil, toothbrush, small plastic parts.
+- CONTAINS_OTHER_ITEM = YES if a container is holding other discardable items inside it.
+
+Ignore people/hands/background. Focus only on discardable items.
+""".strip()
+
+FLAGS_OPTIONS = {"temperature": 0.0, "top_p": 0.1, "num_predict": 120}
+
+
+def call_llava_flags(frame, cancel=None, stats=None):
+    img_b64 = as_frame(frame).b64
+
+    payload = {
+        "model": MODEL,
+        "prompt": FLAGS_PROMPT,
+        "images": [img_b64],
+        "stream": False,
+        "keep_alive": KEEP_ALIVE,
+        "options": FLAGS_OPTIONS,
+    }
+
+    stats = {} if stats is None else stats
+    with span("flags"):
+        if STREAM_RESPONSES:
+            text, early = OLLAMA.generate_stream(payload, stop=_flags_stop(cancel), stats=stats, cancel=cancel)
+            if early and _cancelled("flags", cancel):
+                return text.strip()
+            if early:
+                inc("early_stops_total", stage="flags")
+                print("⏹️ Stage 2 stopped early: bin already determined")
+        else:
+            body = OLLAMA.generate(payload)
+            stats.update(timings(body))
+            text = body.get("response", "")
+    _record_prompt_eval("flags", stats)
+    return text.strip()
+
+
+def _cancelled(stage, cancel):
+    """
+    True when a stream was hung up because its caller abandoned it (e.g. the
+    speculative Stage 2 after Stage 1 said YES), not because the bin was
+    determined. Counted on its own; the result was already reported, so
+    nothing is printed and the cut-short timings are not recorded.
+    """
+    if cancel is None or not cancel.is_set():
+        return False
+    inc("cancelled_calls_total", stage=stage)
+    return True
+
+
+def _record_prompt_eval(stage, stats):
+    """
+    Timings per stage: prompt eval (image + prompt prefill) when Ollama
+    reported it, time to first token for streamed calls, and call time
+    split by whether the call had to wait for a model load (start="cold")
+    or not (start="warm"). A stream that was stopped early has no server
+    timings; its client-side times are used instead.
+    """
+    if "prompt_eval_duration" in stats:
+        observe(stage, stats["prompt_eval_duration"] / 1e9, name="prompt_eval_seconds")
+        inc("prompt_eval_tokens_total", stats.get("prompt_eval_count", 0), stage=stage)
+    if "first_token_seconds" in stats:
+        observe(stage, stats["first_token_seconds"], name="first_token_seconds")
+    if "total_duration" in stats:
+        seconds = stats["total_duration"] / 1e9
+        load = stats.get("load_duration", 0) / 1e9
+        cold = load >= COLD_LOAD_SECONDS
+        why = f"waited {load:.1f}s for the model to load"
+    elif "call_seconds" in stats:
+        seconds = stats["call_seconds"]
+        first = stats.get("first_token_seconds", 0.0)
+        cold = first >= COLD_FIRST_TOKEN_SECONDS
+        why = f"first token after {first:.1f}s (model load)"
+    else:
+        return
+    start = "cold" if cold else "warm"
+    observe(stage, seconds, name="model_call_seconds", start=start)
+    if cold:
+        inc("cold_calls_total", stage=stage)
+        print(f"🥶 {stage}: {why}")
+
+
+# ============================================================
+# SINGLE-PASS: FOOD ANSWER + ALL 8 FLAGS IN ONE CALL
+# The image goes through the vision tower once per item instead of twice.
+# ============================================================
+def call_llava_single_pass(frame, cancel=None, stats=None):
+    img_b64 = as_frame(frame).b64
 
     prompt = """
 You are a waste-sorting detector.
 
-Output EXACTLY these 8 lines, nothing else. Use only YES or NO:
+Output EXACTLY these 9 lines, nothing else. Use only YES or NO:
 
+FOOD_MAIN_OBJECT=<YES|NO>
 FOOD_PRESENT=<YES|NO>
 GLASS_PRESENT=<YES|NO>
 METAL_PRESENT=<YES|NO>
@@ -169,6 +454,7 @@ SMALL_RIGID_PLASTIC_PRESENT=<YES|NO>
 CONTAINS_OTHER_ITEM=<YES|NO>
 
 Definitions (do NOT guess):
+- FOOD_MAIN_OBJECT = YES only if you clearly see edible food (an orange/apple/banana, vegetables, leftovers) as the main object. If unsure -> NO.
 - FOOD_PRESENT = visible food scraps (fruit/vegetables/leftovers).
 - PAPER_PRESENT = paper/cardboard item (box, paper bag, napkin/tissue/paper towel).
 - GLASS_PRESENT = glass cup/bottle/jar.
@@ -187,38 +473,113 @@ Ignore people/hands/background. Focus only on discardable items.
         "images": [img_b64],
         "stream": False,
         "keep_alive": KEEP_ALIVE,
-        "options": {"temperature": 0.0, "top_p": 0.1, "num_predict": 120},
+        "options": {"temperature": 0.0, "top_p": 0.1, "num_predict": 140},
     }
 
-    r = requests.post(OLLAMA_API_URL, json=payload, timeout=TIMEOUT)
-    r.raise_for_status()
-    return r.json().get("response", "").strip()
+    stats = {} if stats is None else stats
+    with span("single_pass"):
+        if STREAM_RESPONSES:
+            text, early = OLLAMA.generate_stream(payload, stop=_flags_stop(cancel, food_main_object=True),
+                                                 stats=stats, cancel=cancel)
+            if early and _cancelled("single_pass", cancel):
+                return text.strip()
+            if early:
+                inc("early_stops_total", stage="single_pass")
+                print("⏹️ Single-pass call stopped early: bin already determined")
+        else:
+            body = OLLAMA.generate(payload)
+            stats.update(timings(body))
+            text = body.get("response", "")
+    _record_prompt_eval("single_pass", stats)
+    return text.strip()
 
 
-def parse_flags(raw: str):
+# ============================================================
+# CHAT MODE: BOTH QUESTIONS AS TURNS OF ONE /api/chat CONVERSATION
+# Turn 1 sends the image with the food question; turn 2 appends the flags
+# question to the same message history without re-sending the image. The
+# conversation prefix (image tokens included) is identical, so Ollama
+# reuses its KV cache and only prefills the new turn instead of running
+# the vision encoder and image prefill a second time.
+# Needs OLLAMA_NUM_PARALLEL=1 or enough slots for the cache to survive
+# between the two turns. compare_context_reuse.py measures the saving.
+# ============================================================
+def chat_food_turn(frame, cancel=None, stats=None):
+    """Returns (YES/NO, message history to continue from)."""
+    messages = [{"role": "user", "content": FOOD_ONLY_PROMPT, "images": [as_frame(frame).b64]}]
+    text = _chat(messages, FOOD_ONLY_OPTIONS, "food_only", _food_answer_stop(cancel), stats, cancel)
+    return _food_answer(text), messages + [{"role": "assistant", "content": text}]
+
+
+def chat_flags_turn(frame, history=None, cancel=None, stats=None):
+    """Flags question as the next turn of `history` (or a fresh conversation if there is none)."""
+    if history:
+        messages = history + [{"role": "user", "content": FLAGS_PROMPT}]
+    else:
+        messages = [{"role": "user", "content": FLAGS_PROMPT, "images": [as_frame(frame).b64]}]
+    text = _chat(messages, FLAGS_OPTIONS, "flags", _flags_stop(cancel), stats, cancel)
+    return text.strip()
+
+
+def _chat(messages, options, stage, stop, stats, cancel=None):
+    payload = {
+        "model": MODEL,
+        "messages": messages,
+        "stream": False,
+        "keep_alive": KEEP_ALIVE,
+        "options": options,
+    }
+
+    stats = {} if stats is None else stats
+    with span(stage):
+        if STREAM_RESPONSES:
+            text, early = OLLAMA.chat_stream(payload, stop=stop, stats=stats, cancel=cancel)
+            if early and _cancelled(stage, cancel):
+                return text
+            if early and stage == "flags":
+                inc("early_stops_total", stage=stage)
+                print("⏹️ Stage 2 stopped early: bin already determined")
+        else:
+            body = OLLAMA.chat(payload)
+            stats.update(timings(body))
+            text = (body.get("message") or {}).get("content", "")
+    _record_prompt_eval(stage, stats)
+    return text
+
+
+
+def _parse_lines(lines):
     flags = {}
-    for line in raw.splitlines():
+    for line in lines:
         if "=" in line:
             k, v = line.split("=", 1)
             key = k.strip().upper()
             val = v.strip().upper().replace("<", "").replace(">", "").strip()
             flags[key] = val
+    return flags
+
 
-    keys = [
-        "FOOD_PRESENT",
-        "GLASS_PRESENT",
-        "METAL_PRESENT",
-        "PAPER_PRESENT",
-        "PLASTIC_BOTTLE_OR_TUB_PRESENT",
-        "WRAPPER_OR_FILM_PRESENT",
-        "SMALL_RIGID_PLASTIC_PRESENT",
-        "CONTAINS_OTHER_ITEM",
-    ]
-    for k in keys:
+def parse_flags(raw: str):
+    flags = _parse_lines(raw.splitlines())
+    missing = [k for k in FLAG_KEYS if k not in flags]
+    item = current_trace()
+    if item is not None and missing:
+        # an early-stopped stream never answered these; they read as NO below
+        item.fields["flags_unanswered"] = missing
+    for k in FLAG_KEYS:
         flags.setdefault(k, "NO")
     return flags
 
 
+def parse_flags_partial(text: str):
+    """
+    Incremental form of parse_flags for a response that is still streaming:
+    only complete lines count and missing flags stay missing (not "NO").
+    """
+    complete = text.split("\n")[:-1]
+    return {k: v for k, v in _parse_lines(complete).items() if v in ("YES", "NO")}
+
+
 # ============================================================
 # DECISION LOGIC (3-bin)
 # Rules you wanted:
@@ -230,37 +591,63 @@ def parse_flags(raw: str):
 # - If nothing detected => TRASH (your "NONE -> TRASH" policy)
 # ============================================================
 def decide_bin(flags, paper_stained=False):
-    # packed container rule
-    if flags.get("CONTAINS_OTHER_ITEM") == "YES":
-        return "TRASH"
+    """
+    Bin for parsed flags under the compiled rule set (decision_engine.py):
+    packed container => TRASH, any mix of recycling / trash / compost
+    signals => TRASH, no signal => NONE.
+    """
+    return DECISION_ENGINE.decide(flags, paper_stained)
 
-    has_recycling = any(flags.get(k) == "YES" for k in [
-        "GLASS_PRESENT",
-        "METAL_PRESENT",
-        "PAPER_PRESENT",
-        "PLASTIC_BOTTLE_OR_TUB_PRESENT",
-    ])
 
-    has_trash_signal = (flags.get("WRAPPER_OR_FILM_PRESENT") == "YES") or (flags.get("SMALL_RIGID_PLASTIC_PRESENT") == "YES")
+# ============================================================
+# STREAMING EARLY-STOP
+# While tokens arrive, check whether every possible completion of the
+# still-missing flags leads to the same bin (a slice of the compiled
+# lookup table). If so, decide_bin's answer is already known and the
+# stream is closed (e.g. CONTAINS_OTHER_ITEM=YES or a wrapper flag
+# forces TRASH whatever comes next).
+# ============================================================
+_FOOD_ANSWER = re.compile(r"(YES|NO)\b")
+_FOOD_ANSWER_DONE = re.compile(r"\s*(YES|NO)[^A-Z]")
 
-    # Compost signal from stage2 is mostly redundant (stage1 is primary),
-    # but keep it for cases where stage1 says NO but there are scraps visible.
-    has_compost_signal = (flags.get("FOOD_PRESENT") == "YES") or paper_stained
 
-    categories_present = sum([has_recycling, has_trash_signal, has_compost_signal])
+def determined_bin(partial, paper_like=None, paper_stained=None):
+    """
+    Bin decided by `partial` flags regardless of the missing ones, or None.
+    paper_like / paper_stained = None means the CV result is not known yet.
+    NONE and TRASH go to the same physical bin and count as one outcome.
+    """
+    return DECISION_ENGINE.determined(partial, paper_like, paper_stained)
 
-    if categories_present == 0:
-        return "NONE"
 
-    # any mix => trash
-    if categories_present >= 2:
-        return "TRASH"
+def _food_answer_stop(cancel=None):
+    def stop(text):
+        if cancel is not None and cancel.is_set():
+            return True
+        return _FOOD_ANSWER_DONE.match(text.upper()) is not None
+    return stop
 
-    if has_trash_signal:
-        return "TRASH"
-    if has_compost_signal:
-        return "COMPOST"
-    return "RECYCLING"
+
+def _flags_stop(cancel=None, food_main_object=False):
+    seen_lines = [0]
+
+    def stop(text):
+        if cancel is not None and cancel.is_set():
+            return True
+        lines = text.count("\n")
+        if lines == seen_lines[0]:
+            return False        # only re-check when a new line has completed
+        seen_lines[0] = lines
+
+        partial = parse_flags_partial(text)
+        if food_main_object:
+            food = partial.pop("FOOD_MAIN_OBJECT", None)
+            if food == "YES":
+                return True     # COMPOST, nothing else matters
+            if food is None:
+                return False
+        return determined_bin(partial) is not None
+    return stop
 
 
 def pretty(label):
@@ -273,45 +660,245 @@ def pretty(label):
 
 
 # ============================================================
-# MAIN
+# PIPELINE (sequential or concurrent)
+# Concurrent mode runs the CV detector alongside the model calls and
+# issues Stage 2 speculatively while Stage 1 is in flight; if Stage 1
+# says YES the Stage 2 result is abandoned. Non-food items then cost
+# roughly max(stage) instead of sum(stages) — as long as Ollama is
+# allowed to serve two requests at once (OLLAMA_NUM_PARALLEL >= 2).
 # ============================================================
-if __name__ == "__main__":
-    print("🚀 Starting camera capture and classification...")
-    warmup()
+def _run_async(fn, *args, **kwargs):
+    """
+    Run fn on a daemon thread and return a Future. Daemon threads mean an
+    abandoned request never holds up process exit. The caller's context
+    (the current metrics trace) is carried over to the thread.
+    """
+    future = Future()
+    context = contextvars.copy_context()
+
+    def runner():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(context.run(fn, *args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=runner, name=f"stage-{fn.__name__}", daemon=True).start()
+    return future
+
+
+def _decide_with_stain(flags, paper_like, paper_stained):
+    # Only apply stain logic if paper-like OR model says paper present
+    use_stain = paper_stained if (paper_like or flags.get("PAPER_PRESENT") == "YES") else False
+    print(f"\n🧪 CV_PAPER_STAINED={use_stain}")
+    with span("decide"):
+        return decide_bin(flags, paper_stained=use_stain), flags
+
+
+def _count_error(stage, e):
+    inc("stage_errors_total", stage=stage, error=type(e).__name__)
+    if isinstance(e, requests.Timeout):
+        inc("timeouts_total", stage=stage)
 
-    image_path = capture_image()
-    if not image_path:
-        raise SystemExit(0)
 
+def classify_frame_sequential(frame):
     # ---- Stage 1: Food-only (fast, reliable for fruit)
     try:
-        food_yesno = call_llava_food_only(image_path)
+        food_yesno = call_llava_food_only(frame)
         print(f"🥕 FOOD_ONLY={food_yesno}")
         if food_yesno == "YES":
-            final = "COMPOST"
-            print(f"\n🔎 Classification result → {pretty(final)}")
-            raise SystemExit(0)
+            return "COMPOST", {"FOOD_ONLY": "YES"}
     except Exception as e:
+        _count_error("food_only", e)
         print("❌ Food-only check failed:", e)
         # continue rather than dying
 
     # ---- CV stain detection (paper/cardboard only)
-    paper_like, paper_stained, _info = cv_detect_paper_and_stains(image_path, debug=True)
+    paper_like, paper_stained, _info = cv_detect_paper_and_stains(frame, debug=True)
 
     # ---- Stage 2: General flags
     try:
-        raw = call_llava_flags(image_path)
+        raw = call_llava_flags(frame)
         print(f"🧩 Raw response:\n{raw}")
         flags = parse_flags(raw)
     except Exception as e:
+        _count_error("flags", e)
         print("❌ LLaVA error/timeout:", e)
-        print("\n🔎 Classification result → 🗑️ Trash")
+        return "TRASH", None
+
+    return _decide_with_stain(flags, paper_like, paper_stained)
+
+
+def classify_frame_concurrent(frame):
+    cancel_flags = CancelEvent()
+    food_future = _run_async(call_llava_food_only, frame)
+    flags_future = _run_async(call_llava_flags, frame, cancel=cancel_flags)      # speculative
+
+    # ---- CV runs on this thread while both model calls are in flight
+    paper_like, paper_stained, _info = cv_detect_paper_and_stains(frame, debug=True)
+
+    # ---- Stage 1 decides whether Stage 2 is needed at all
+    try:
+        food_yesno = food_future.result()
+        print(f"🥕 FOOD_ONLY={food_yesno}")
+        if food_yesno == "YES":
+            cancel_flags.set()      # shuts a streaming Stage 2's connection, even mid-prefill
+            flags_future.cancel()   # abandon the speculative Stage 2
+            return "COMPOST", {"FOOD_ONLY": "YES"}
+    except Exception as e:
+        _count_error("food_only", e)
+        print("❌ Food-only check failed:", e)
+
+    try:
+        raw = flags_future.result()
+        print(f"🧩 Raw response:\n{raw}")
+        flags = parse_flags(raw)
+    except Exception as e:
+        _count_error("flags", e)
+        print("❌ LLaVA error/timeout:", e)
+        return "TRASH", None
+
+    return _decide_with_stain(flags, paper_like, paper_stained)
+
+
+def classify_frame_single_pass(frame):
+    paper_like, paper_stained, _info = cv_detect_paper_and_stains(frame, debug=True)
+
+    try:
+        raw = call_llava_single_pass(frame)
+        print(f"🧩 Raw response:\n{raw}")
+        flags = parse_flags(raw)
+    except Exception as e:
+        _count_error("single_pass", e)
+        print("❌ LLaVA error/timeout:", e)
+        return "TRASH", None
+
+    # same precedence as the two-stage flow: a food main object wins outright
+    print(f"🥕 FOOD_ONLY={flags.get('FOOD_MAIN_OBJECT', 'NO')}")
+    if flags.get("FOOD_MAIN_OBJECT") == "YES":
+        return "COMPOST", flags
+
+    return _decide_with_stain(flags, paper_like, paper_stained)
+
+
+def classify_frame_chat(frame):
+    # ---- CV runs on this thread while turn 1 is in flight
+    food_future = _run_async(chat_food_turn, frame)
+    paper_like, paper_stained, _info = cv_detect_paper_and_stains(frame, debug=True)
+
+    history = None
+    try:
+        food_yesno, history = food_future.result()
+        print(f"🥕 FOOD_ONLY={food_yesno}")
+        if food_yesno == "YES":
+            return "COMPOST", {"FOOD_ONLY": "YES"}
+    except Exception as e:
+        _count_error("food_only", e)
+        print("❌ Food-only check failed:", e)
+
+    # ---- turn 2 reuses the processed image (fresh conversation if turn 1 failed)
+    try:
+        raw = chat_flags_turn(frame, history)
+        print(f"🧩 Raw response:\n{raw}")
+        flags = parse_flags(raw)
+    except Exception as e:
+        _count_error("flags", e)
+        print("❌ LLaVA error/timeout:", e)
+        return "TRASH", None
+
+    return _decide_with_stain(flags, paper_like, paper_stained)
+
+
+def _classify_uncached(frame, mode, concurrent):
+    if mode == "single_pass":
+        return classify_frame_single_pass(frame)
+    if mode == "chat":
+        return classify_frame_chat(frame)
+    if mode != "two_stage":
+        raise ValueError(f"Unknown CLASSIFY_MODE {mode!r} (use 'two_stage', 'single_pass' or 'chat')")
+    if concurrent:
+        return classify_frame_concurrent(frame)
+    return classify_frame_sequential(frame)
+
+
+def classify_frame_with_flags(frame, mode=CLASSIFY_MODE, concurrent=CONCURRENT_STAGES,
+                              use_cache=RESULT_CACHE_ENABLED, use_fast_tier=True):
+    """
+    Returns (bin_label, flags). flags is None when the model could not be
+    reached and the TRASH fallback was used; those results are never cached.
+    Order: result cache -> on-device fast tier -> LLaVA.
+    Each call is one metrics trace (or joins the caller's).
+    """
+    frame = as_frame(frame)
+    with trace(source=frame.source, mode=mode) as item, span("classify"):
+        label, flags, tier = _classify_tiers(frame, mode, concurrent, use_cache, use_fast_tier)
+        item.fields.update(label=label, tier=tier)
+    inc("decisions_total", bin=label, tier=tier)
+    if RESULTS is not None:
+        RESULTS.record_item(frame, label, flags, tier, mode, item, station=metrics.STATION)
+    return label, flags
+
+
+def _classify_tiers(frame, mode, concurrent, use_cache, use_fast_tier):
+    key = None
+    if use_cache:
+        # the item region only (gate box) and per station: background and other cameras never match
+        key = dhash(frame.item_image)
+        item = current_trace()
+        station = (item.fields.get("station_name") if item is not None else None) or metrics.STATION
+        hit = RESULT_CACHE.get(key, station)
+        if hit is not None:
+            inc("cache_hits_total")
+            print(f"⚡ Cache hit (near-duplicate frame) → {hit['label']}")
+            return hit["label"], hit["flags"], "cache"
+        inc("cache_misses_total")
+
+    if use_fast_tier and FAST_TIER is not None:
+        label, confidence = FAST_TIER.try_classify(frame.image, FAST_TIER_THRESHOLD)
+        if label is not None:
+            inc("fast_tier_total", outcome="served")
+            print(f"⚡ Fast tier → {label} (confidence {confidence:.2f})")
+            return label, {"FAST_TIER": "YES"}, "fast_tier"
+        inc("fast_tier_total", outcome="deferred")
+
+    with span("encode"):
+        frame.b64
+    label, flags = _classify_uncached(frame, mode, concurrent)
+    if flags is None:
+        inc("fallbacks_total", reason="model_error")
+    elif key is not None:
+        RESULT_CACHE.put(key, {"label": label, "flags": flags}, station)
+    return label, flags, "llava"
+
+
+def classify_frame(frame, mode=CLASSIFY_MODE, concurrent=CONCURRENT_STAGES, use_cache=RESULT_CACHE_ENABLED,
+                   use_fast_tier=True):
+    return classify_frame_with_flags(frame, mode, concurrent, use_cache, use_fast_tier)[0]
+
+
+# ============================================================
+# MAIN
+# ============================================================
+if __name__ == "__main__":
+    print("🚀 Starting camera capture and classification...")
+    # open the camera first so exposure settles while the model warms up
+    try:
+        camera = make_camera()
+    except RuntimeError as e:
+        print("❌ Could not access camera:", e)
         raise SystemExit(0)
 
-    # Only apply stain logic if paper-like OR model says paper present
-    use_stain = paper_stained if (paper_like or flags.get("PAPER_PRESENT") == "YES") else False
+    warmup()
 
-    final = decide_bin(flags, paper_stained=use_stain)
+    # capture + classify land in one JSONL trace (metrics.TRACE_PATH)
+    with trace(script="camera_classifier"):
+        try:
+            frame = capture_image(camera)
+        finally:
+            camera.stop()
+        if frame is None:
+            raise SystemExit(0)
 
-    print(f"\n🧪 CV_PAPER_STAINED={use_stain}")
+        final = classify_frame(frame)
     print(f"🔎 Classification result → {pretty(final)}")
\ No newline at end of file
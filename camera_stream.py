@@ -0,0 +1,116 @@
+import cv2
+import time
+import threading
+from collections import deque
+
+# ============================================================
+# PERSISTENT CAMERA STREAM (USB CAM / OPENCV)
+# Keeps the device open and drains frames on a background thread,
+# so a fresh frame is available in milliseconds instead of paying
+# open + 1 s exposure settle + release for every item.
+# ============================================================
+CAMERA_INDEX = 0                   # 0 = default camera
+BUFFER_SIZE = 4                    # frames kept in the ring buffer
+SETTLE_SECONDS = 1.0               # exposure/white-balance settle after open
+
+
+class CameraStream:
+    """
+    Long-lived capture component.
+
+    latest_frame()            -> (timestamp, frame) newest frame, or (None, None)
+    wait_for_frame(after=ts)  -> (timestamp, frame) first frame newer than ts
+
+    Timestamps come from time.monotonic().
+    """
+
+    def __init__(self, source=CAMERA_INDEX, buffer_size=BUFFER_SIZE, settle_seconds=SETTLE_SECONDS):
+        self.source = source
+        self.settle_seconds = settle_seconds
+        self._frames = deque(maxlen=buffer_size)
+        self._cond = threading.Condition()
+        self._camera = None
+        self._thread = None
+        self._running = False
+        self.ready_at = None
+        self.frames_read = 0
+        self.read_failures = 0
+
+    # ---- lifecycle
+    def start(self):
+        if self._running:
+            return self
+
+        self._camera = cv2.VideoCapture(self.source)
+        if not self._camera.isOpened():
+            self._camera.release()
+            self._camera = None
+            raise RuntimeError(f"Could not access camera {self.source!r}")
+
+        self.ready_at = time.monotonic() + self.settle_seconds
+        self._running = True
+        self._thread = threading.Thread(target=self._drain, name="camera-stream", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+        if self._camera is not None:
+            self._camera.release()
+            self._camera = None
+        with self._cond:
+            self._cond.notify_all()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def running(self):
+        return self._running
+
+    # ---- background reader
+    def _drain(self):
+        while self._running:
+            ret, frame = self._camera.read()
+            if not ret:
+                self.read_failures += 1
+                time.sleep(0.01)
+                continue
+
+            ts = time.monotonic()
+            with self._cond:
+                self._frames.append((ts, frame))
+                self.frames_read += 1
+                self._cond.notify_all()
+
+    # ---- consumer API
+    def latest_frame(self):
+        with self._cond:
+            if not self._frames:
+                return None, None
+            return self._frames[-1]
+
+    def wait_for_frame(self, after=None, timeout=3.0):
+        """
+        Block until a frame captured strictly after `after` is available.
+        after=None means "after the camera has settled" (replaces the old sleep(1)).
+        Returns (None, None) on timeout or if the stream is stopped.
+        """
+        if after is None:
+            after = self.ready_at if self.ready_at is not None else 0.0
+
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if self._frames and self._frames[-1][0] > after:
+                    return self._frames[-1]
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._running:
+                    return None, None
+                self._cond.wait(remaining)
@@ -1,57 +1,67 @@
-import requests
-import base64
+import argparse
+import asyncio
+import csv
+import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from frame import Frame, load_upload_config
+from ollama_client import make_client
 
 # -------------------------------------
 # CONFIGURATION
 # -------------------------------------
 OLLAMA_API_URL = "http://localhost:11434/api/generate"
+OLLAMA_API_URLS = [OLLAMA_API_URL]   # several hosts -> routed + hedged (ollama_client.OllamaPool)
 MODEL = "llava"
+TIMEOUT = (5, 60)   # (connect_timeout, read_timeout)
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+# pooled keep-alive client with retries + circuit breaker
+OLLAMA = make_client(OLLAMA_API_URLS, timeout=TIMEOUT)
+
+# images are downsized before upload (see frame.py / tune_upload_size.py)
+load_upload_config()
+
+PROMPT = (
+    "You are an expert in waste management and sustainability. "
+    "Classify the item in the image as one of these categories: 'trash', 'recycling', or 'compost'.\n\n"
+    "- 'compost' → all fruits, vegetable scraps, peels, coffee grounds, napkins, or other organic matter.\n"
+    "- 'recycling' → clean plastics, metals, glass, paper, cardboard.\n"
+    "- 'trash' → everything else that cannot be recycled or composted.\n\n"
+    "**Rule:** If the item is clearly a fruit or vegetable (like a banana, apple, carrot, peel, etc.), classify as 'compost', regardless of packaging.\n"
+    "Return ONLY strict JSON in this format:\n"
+    "{ \"category\": \"trash/recycling/compost\", \"reason\": \"brief explanation\" }"
+)
 
 # -------------------------------------
 # IMAGE ENCODER
 # -------------------------------------
 def encode_image_to_base64(image_path):
-    with open(image_path, "rb") as f:
-        return base64.b64encode(f.read()).decode("utf-8")
+    frame = Frame.from_file(image_path)
+    if frame is None:
+        raise ValueError(f"Could not decode {image_path}")
+    return frame.b64
 
 # -------------------------------------
 # CLASSIFIER
 # -------------------------------------
-def classify_item(image_path):
-    img_b64 = encode_image_to_base64(image_path)
-
-
-    prompt = (
-        "You are an expert in waste management and sustainability. "
-        "Classify the item in the image as one of these categories: 'trash', 'recycling', or 'compost'.\n\n"
-        "- 'compost' → all fruits, vegetable scraps, peels, coffee grounds, napkins, or other organic matter.\n"
-        "- 'recycling' → clean plastics, metals, glass, paper, cardboard.\n"
-        "- 'trash' → everything else that cannot be recycled or composted.\n\n"
-        "**Rule:** If the item is clearly a fruit or vegetable (like a banana, apple, carrot, peel, etc.), classify as 'compost', regardless of packaging.\n"
-        "Return ONLY strict JSON in this format:\n"
-        "{ \"category\": \"trash/recycling/compost\", \"reason\": \"brief explanation\" }"
-    )
-
+def request_category(img_b64, client=OLLAMA):
+    """
+    One Ollama call for an already-encoded image.
+    Returns (category, raw_response); raises on transport errors.
+    """
     payload = {
         "model": MODEL,
-        "prompt": prompt,
+        "prompt": PROMPT,
         "images": [img_b64],
         "stream": False
     }
 
-    # Send request to Ollama
-    response = requests.post(OLLAMA_API_URL, json=payload)
-
-    try:
-        raw_response = response.json()["response"].strip()
-    except Exception as e:
-        print("Error:", e)
-        print("Full response:", response.text)
-        return "Error"
-
-    print(f"\n Raw model response for {os.path.basename(image_path)}:")
-    print(raw_response)
+    with metrics.span("request"):
+        raw_response = client.generate(payload)["response"].strip()
 
     # Extract classification
     result = raw_response.lower()
@@ -62,19 +72,204 @@ def classify_item(image_path):
     else:
         category = "Trash"
 
+    return category, raw_response
+
+
+def classify_item(image_path):
+    with metrics.trace(script="code", path=image_path) as item:
+        # Encode and send request to Ollama (an unreadable image is an error, not a crash)
+        try:
+            with metrics.span("encode"):
+                img_b64 = encode_image_to_base64(image_path)
+            category, raw_response = request_category(img_b64)
+        except Exception as e:
+            metrics.inc("request_errors_total", error=type(e).__name__)
+            print("Error:", e)
+            return "Error"
+        item.fields["category"] = category
+        metrics.inc("decisions_total", category=category)
+
+    print(f"\n Raw model response for {os.path.basename(image_path)}:")
+    print(raw_response)
+
     return category
 
+# -------------------------------------
+# BATCH MODE (asyncio, bounded concurrency, resumable)
+# Files are streamed from the folder, read/encoded and sent on worker
+# threads so the event loop only schedules; N requests stay in flight.
+# Each result is appended + flushed as soon as it arrives, and a re-run
+# skips every path that already has a successful row in the output.
+# -------------------------------------
+RESULT_FIELDS = ["path", "category", "seconds", "error", "raw"]
+
+
+def iter_image_paths(folder):
+    """Walk the folder lazily (no full listing held in memory)."""
+    stack = [folder]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in sorted(entries, key=lambda e: e.name):
+                if entry.is_dir():
+                    stack.append(entry.path)
+                elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    yield entry.path
+
+
+def load_done_paths(output_path):
+    """Paths with a non-error result from a previous (possibly interrupted) run."""
+    if not os.path.exists(output_path):
+        return set()
+
+    done = set()
+    with open(output_path, newline="", encoding="utf-8") as f:
+        if output_path.endswith(".csv"):
+            # a row cut short by a crash has missing (None) fields
+            rows = (row for row in csv.DictReader(f) if None not in row.values())
+        else:
+            rows = _json_rows(f)
+        for row in rows:
+            if not row.get("error"):
+                done.add(row["path"])
+    return done
+
+
+def _json_rows(f):
+    for line in f:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            # half-written by an interrupted run: that path is simply redone
+            continue
+
+
+def trim_partial_row(output_path, is_csv):
+    """Cut a half-written last row (interrupted run) so appends start on a row boundary."""
+    if not os.path.exists(output_path):
+        return
+    # csv rows end in \r\n (model text inside a quoted field only has \n); JSON escapes newlines
+    terminator = b"\r\n" if is_csv else b"\n"
+    with open(output_path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(terminator) + len(terminator) if terminator in data else 0
+        if end < len(data):
+            f.truncate(end)
+            print(f"⚠️ Dropped a half-written last row from {output_path}")
+
+
+class ResultWriter:
+    def __init__(self, output_path):
+        self.is_csv = output_path.endswith(".csv")
+        trim_partial_row(output_path, self.is_csv)
+        new_file = not os.path.exists(output_path) or os.path.getsize(output_path) == 0
+        self.f = open(output_path, "a", newline="", encoding="utf-8")
+        if self.is_csv:
+            self.csv = csv.DictWriter(self.f, fieldnames=RESULT_FIELDS)
+            if new_file:
+                self.csv.writeheader()
+
+    def write(self, row):
+        if self.is_csv:
+            self.csv.writerow(row)
+        else:
+            self.f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
+def _classify_path(path, client):
+    t0 = time.monotonic()
+    with metrics.trace(script="code", path=path) as item:
+        try:
+            with metrics.span("encode"):
+                img_b64 = encode_image_to_base64(path)
+            category, raw = request_category(img_b64, client=client)
+            error = ""
+            metrics.inc("decisions_total", category=category)
+        except Exception as e:
+            category, raw, error = "Error", "", f"{type(e).__name__}: {e}"
+            metrics.inc("request_errors_total", error=type(e).__name__)
+        item.fields.update(category=category, error=error)
+    return {
+        "path": path,
+        "category": category,
+        "seconds": round(time.monotonic() - t0, 3),
+        "error": error,
+        "raw": raw,
+    }
+
+
+async def classify_folder(folder, output_path, concurrency=4, resume=True):
+    done = load_done_paths(output_path) if resume else set()
+    client = make_client(OLLAMA_API_URLS, timeout=TIMEOUT, pool_size=concurrency)
+    writer = ResultWriter(output_path)
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    stats = {"done": 0, "errors": 0, "skipped": 0}
+    # to_thread() runs on the default executor; size it so N calls really overlap
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=concurrency))
+
+    async def producer():
+        for path in iter_image_paths(folder):
+            if path in done:
+                stats["skipped"] += 1
+                continue
+            await queue.put(path)
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async def worker():
+        while True:
+            path = await queue.get()
+            if path is None:
+                return
+            row = await asyncio.to_thread(_classify_path, path, client)
+            writer.write(row)
+            stats["done"] += 1
+            stats["errors"] += bool(row["error"])
+            print(f"{os.path.basename(path):<25} → {row['category']} ({row['seconds']:.1f}s)")
+
+    t0 = time.monotonic()
+    try:
+        await asyncio.gather(producer(), *(worker() for _ in range(concurrency)))
+    finally:
+        writer.close()
+        client.close()
+
+    elapsed = time.monotonic() - t0
+    print(f"\n Batch complete: {stats['done']} classified ({stats['errors']} errors), "
+          f"{stats['skipped']} already done, {elapsed:.1f}s")
+    return stats
+
 # -------------------------------------
 # MAIN TEST
 # -------------------------------------
 if __name__ == "__main__":
-    test_folder = "images"
+    parser = argparse.ArgumentParser(description="Classify a folder of images with LLaVA.")
+    parser.add_argument("folder", nargs="?", default="images")
+    parser.add_argument("--batch", metavar="OUTPUT",
+                        help="async batch mode; append results to OUTPUT (.jsonl or .csv)")
+    parser.add_argument("--concurrency", type=int, default=4, help="requests kept in flight")
+    parser.add_argument("--no-resume", action="store_true", help="re-classify paths already in OUTPUT")
+    parser.add_argument("--metrics-port", type=int, default=0, help="serve Prometheus /metrics on this port")
+    args = parser.parse_args()
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+
+    test_folder = args.folder
     print("\n Starting Waste Classifier using LLaVA...\n")
 
+    if args.batch:
+        asyncio.run(classify_folder(test_folder, args.batch, args.concurrency, resume=not args.no_resume))
+        raise SystemExit(0)
+
     for filename in os.listdir(test_folder):
-        if filename.lower().endswith((".jpg", ".jpeg", ".png")):
+        if filename.lower().endswith(IMAGE_EXTENSIONS):
             path = os.path.join(test_folder, filename)
             category = classify_item(path)
             print(f"{filename:<25} → {category}")
 
-    print("\n Classification complete!")
\ No newline at end of file
+    print("\n Classification complete!")
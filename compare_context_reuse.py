@@ -0,0 +1,89 @@
+import argparse
+import os
+import time
+
+import camera_classifier as cc
+from datasets import iter_frames
+
+# -------------------------------------
+# Prompt-eval time: two independent /api/generate calls (image sent and
+# prefilled twice) vs. two turns of one /api/chat conversation (image
+# prefilled once, turn 2 reuses the KV cache).
+# Streaming is switched off so every call runs to completion and reports
+# its server-side timings; both questions are always asked.
+#
+#   python compare_context_reuse.py images/
+#   python compare_context_reuse.py --mock        # against mock_ollama.py
+# -------------------------------------
+
+
+def run_independent(frame):
+    food_stats, flags_stats = {}, {}
+    t0 = time.monotonic()
+    food = cc.call_llava_food_only(frame, stats=food_stats)
+    raw = cc.call_llava_flags(frame, stats=flags_stats)
+    return time.monotonic() - t0, food_stats, flags_stats, food, cc.parse_flags(raw)
+
+
+def run_chat(frame):
+    food_stats, flags_stats = {}, {}
+    t0 = time.monotonic()
+    food, history = cc.chat_food_turn(frame, stats=food_stats)
+    raw = cc.chat_flags_turn(frame, history, stats=flags_stats)
+    return time.monotonic() - t0, food_stats, flags_stats, food, cc.parse_flags(raw)
+
+
+def ms(stats):
+    return stats.get("prompt_eval_duration", 0) / 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure prompt-eval time saved by the chat mode.")
+    parser.add_argument("folder", nargs="?", default="images")
+    parser.add_argument("--mock", action="store_true", help="run against an in-process mock Ollama")
+    args = parser.parse_args()
+
+    mock = None
+    if args.mock:
+        from mock_ollama import MockOllama
+        mock = MockOllama().start()
+    cc.configure(ollama=mock.url if mock is not None else None)
+    cc.STREAM_RESPONSES = False
+    cc.warmup()
+
+    print(f"\n{'image':<25}{'generate turn2':>16}{'chat turn2':>12}{'saved':>10}{'wall gen':>10}{'wall chat':>11}  same")
+    totals = {"gen": 0.0, "chat": 0.0, "gen_wall": 0.0, "chat_wall": 0.0, "gen_tokens": 0, "chat_tokens": 0}
+    count = same = 0
+    for frame in iter_frames(args.folder):
+        gen_wall, gen_food, gen_flags, gen_answer, gen_result = run_independent(frame)
+        chat_wall, chat_food, chat_flags, chat_answer, chat_result = run_chat(frame)
+
+        gen_ms = ms(gen_food) + ms(gen_flags)
+        chat_ms = ms(chat_food) + ms(chat_flags)
+        totals["gen"] += gen_ms
+        totals["chat"] += chat_ms
+        totals["gen_wall"] += gen_wall
+        totals["chat_wall"] += chat_wall
+        totals["gen_tokens"] += gen_flags.get("prompt_eval_count", 0)
+        totals["chat_tokens"] += chat_flags.get("prompt_eval_count", 0)
+        count += 1
+        agree = gen_answer == chat_answer and gen_result == chat_result
+        same += agree
+
+        print(f"{os.path.basename(str(frame.source)):<25}{ms(gen_flags):>14.0f}ms{ms(chat_flags):>10.0f}ms"
+              f"{gen_ms - chat_ms:>8.0f}ms{gen_wall:>9.2f}s{chat_wall:>10.2f}s  {'yes' if agree else 'NO'}")
+
+    if not count:
+        print("No images found.")
+        raise SystemExit(0)
+    if not totals["gen"]:
+        print("\nThe server reported no prompt_eval_duration; cannot compare.")
+        raise SystemExit(1)
+
+    saved = totals["gen"] - totals["chat"]
+    print(f"\nPrompt eval per item: generate {totals['gen'] / count:.0f}ms, chat {totals['chat'] / count:.0f}ms "
+          f"-> {saved / count:.0f}ms saved ({saved / totals['gen']:.0%})")
+    print(f"Turn-2 prompt tokens per item: generate {totals['gen_tokens'] / count:.0f}, "
+          f"chat {totals['chat_tokens'] / count:.0f}")
+    print(f"Wall time per item: generate {totals['gen_wall'] / count:.2f}s, chat {totals['chat_wall'] / count:.2f}s")
+    print(f"Same answers on {same}/{count} images")
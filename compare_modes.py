@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+
+import camera_classifier
+from frame import Frame
+from camera_classifier import warmup, classify_frame
+from datasets import iter_images, expected_label, normalise
+
+# -------------------------------------
+# Compare "two_stage" vs "single_pass" on a folder of images.
+# If an image sits in a folder named TRASH / RECYCLING / COMPOST,
+# that folder name is used as the expected label for accuracy.
+# -------------------------------------
+MODES = ["two_stage", "single_pass"]
+
+
+if __name__ == "__main__":
+    folder = sys.argv[1] if len(sys.argv) > 1 else "images"
+    print(f"\n Comparing {' vs '.join(MODES)} on {folder}/ ...\n")
+    camera_classifier.configure()      # each image is classified once per mode: not real decisions
+    warmup()
+
+    totals = {m: 0.0 for m in MODES}
+    correct = {m: 0 for m in MODES}
+    labelled = 0
+    agree = 0
+    count = 0
+
+    for path in iter_images(folder):
+        frame = Frame.from_file(path)
+        if frame is None:
+            continue
+
+        results = {}
+        for mode in MODES:
+            t0 = time.monotonic()
+            results[mode] = normalise(classify_frame(frame, mode=mode, use_cache=False, use_fast_tier=False))
+            totals[mode] += time.monotonic() - t0
+
+        count += 1
+        agree += len(set(results.values())) == 1
+        expected = expected_label(path)
+        if expected:
+            labelled += 1
+            for mode in MODES:
+                correct[mode] += results[mode] == expected
+
+        row = "  ".join(f"{m}={results[m]:<10}" for m in MODES)
+        print(f"{os.path.basename(path):<25} {row} expected={expected or '-'}")
+
+    if not count:
+        print("No images found.")
+        raise SystemExit(0)
+
+    print("\n Summary")
+    for mode in MODES:
+        line = f"{mode:<12} mean latency {totals[mode] / count:.2f}s"
+        if labelled:
+            line += f", accuracy {correct[mode]}/{labelled} ({correct[mode] / labelled:.0%})"
+        print(line)
+    print(f"modes agree on {agree}/{count} images")
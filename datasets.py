@@ -0,0 +1,54 @@
+import csv
+import json
+import os
+
+from frame import Frame
+
+# ============================================================
+# LABELLED IMAGE DATASETS
+# Image-folder and manifest readers shared by the benchmark, evaluation
+# and tuning scripts. Imports nothing from the classify pipeline, so a
+# CV-only tool does not load the model client just to list images.
+#
+# Labels come from the parent folder name (images/COMPOST/peel.jpg) or
+# from a manifest: CSV with path,label columns or JSONL with
+# {"path": ..., "label": ...}; paths are relative to the manifest.
+# ============================================================
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+LABELS = {"TRASH", "RECYCLING", "COMPOST"}
+
+
+def iter_images(folder):
+    for root, _dirs, files in os.walk(folder):
+        for filename in sorted(files):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(root, filename)
+
+
+def iter_frames(folder):
+    """Frames for iter_images(folder); files that don't decode are skipped."""
+    for path in iter_images(folder):
+        frame = Frame.from_file(path)
+        if frame is not None:
+            yield frame
+
+
+def read_manifest(path):
+    """[(image path, LABEL)] from a CSV (path,label) or JSONL manifest; paths are relative to it."""
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.lower().endswith((".jsonl", ".json")):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+    return [(os.path.join(base, row["path"]), row["label"].strip().upper()) for row in rows]
+
+
+def expected_label(path):
+    parent = os.path.basename(os.path.dirname(path)).upper()
+    return parent if parent in LABELS else None
+
+
+def normalise(label):
+    # NONE -> TRASH policy
+    return "TRASH" if label == "NONE" else label
@@ -0,0 +1,195 @@
+import json
+import os
+
+import numpy as np
+
+# ============================================================
+# COMPILED DECISION ENGINE
+# The bin policy is data: a rule set (built-in DEFAULT_RULES or a per-site
+# JSON file) is evaluated once for every combination of the 8 model flags
+# and the CV stain signal, and the answers are stored in a 512-entry
+# lookup table. Deciding an item is then one array index:
+#
+#   key = flags bitmask (bits 0-7, FLAG_KEYS order) | STAIN_BIT if stained
+#   label = LABELS[table[key]]
+#
+# and a whole history of stored items is re-decided with one numpy
+# fancy-index (see replay_decisions.py).
+#
+# Rule set format (first matching rule wins, else "default"):
+#   "groups": {"recycling": ["GLASS_PRESENT", ...], ...}
+#   "rules":  [{"any": [...], "all": [...], "none": [...], "min_groups": 2, "bin": "TRASH"}, ...]
+# Names in any/all/none are flags, group names, or "STAINED". A rule with
+# several conditions needs all of them to hold.
+# ============================================================
+FLAG_KEYS = [
+    "FOOD_PRESENT",
+    "GLASS_PRESENT",
+    "METAL_PRESENT",
+    "PAPER_PRESENT",
+    "PLASTIC_BOTTLE_OR_TUB_PRESENT",
+    "WRAPPER_OR_FILM_PRESENT",
+    "SMALL_RIGID_PLASTIC_PRESENT",
+    "CONTAINS_OTHER_ITEM",
+]
+FLAG_BIT = {key: 1 << i for i, key in enumerate(FLAG_KEYS)}
+FLAGS_MASK = (1 << len(FLAG_KEYS)) - 1
+STAIN_BIT = 1 << len(FLAG_KEYS)
+TABLE_SIZE = STAIN_BIT << 1
+
+LABELS = ["NONE", "TRASH", "RECYCLING", "COMPOST"]
+LABEL_CODE = {label: i for i, label in enumerate(LABELS)}
+
+# same policy decide_bin() always had
+DEFAULT_RULES = {
+    "name": "default",
+    "groups": {
+        "recycling": ["GLASS_PRESENT", "METAL_PRESENT", "PAPER_PRESENT", "PLASTIC_BOTTLE_OR_TUB_PRESENT"],
+        "trash": ["WRAPPER_OR_FILM_PRESENT", "SMALL_RIGID_PLASTIC_PRESENT"],
+        # Stage 2 food is mostly redundant (Stage 1 is primary), kept for visible scraps
+        "compost": ["FOOD_PRESENT", "STAINED"],
+    },
+    "rules": [
+        {"any": ["CONTAINS_OTHER_ITEM"], "bin": "TRASH"},      # packed container
+        {"min_groups": 2, "bin": "TRASH"},                      # any mix => trash
+        {"any": ["trash"], "bin": "TRASH"},
+        {"any": ["compost"], "bin": "COMPOST"},
+        {"any": ["recycling"], "bin": "RECYCLING"},
+    ],
+    "default": "NONE",
+}
+
+_ALL_FLAGS = np.arange(STAIN_BIT, dtype=np.int32)
+
+
+def flags_mask(flags):
+    """{"GLASS_PRESENT": "YES", ...} -> bitmask of the YES flags."""
+    mask = 0
+    for key, bit in FLAG_BIT.items():
+        if flags.get(key) == "YES":
+            mask |= bit
+    return mask
+
+
+def load_rules(path=None):
+    if not path:
+        return DEFAULT_RULES
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+class DecisionTable:
+    def __init__(self, rules=DEFAULT_RULES):
+        self.rules = rules
+        self.name = rules.get("name", "rules")
+        self.table = compile_rules(rules)
+        self._determined = {}          # (known bits, their values, paper_like, paper_stained) -> label/None
+
+    @classmethod
+    def from_file(cls, path):
+        return cls(load_rules(path))
+
+    def decide_key(self, key):
+        return LABELS[self.table[key]]
+
+    def decide(self, flags, paper_stained=False):
+        key = flags_mask(flags) | (STAIN_BIT if paper_stained else 0)
+        return LABELS[self.table[key]]
+
+    def decide_many(self, masks, stained):
+        """Vectorized: arrays of flag bitmasks and stain booleans -> array of label codes."""
+        keys = (np.asarray(masks, dtype=np.int64) & FLAGS_MASK) | (np.asarray(stained, dtype=bool) * STAIN_BIT)
+        return self.table[keys]
+
+    def determined(self, partial, paper_like=None, paper_stained=None):
+        """
+        Bin that `partial` flags lead to whatever the missing flags turn out
+        to be, or None. Unknown CV (None) counts as every possibility;
+        NONE and TRASH count as one outcome (same physical bin).
+        """
+        known = 0
+        values = 0
+        for key, value in partial.items():
+            bit = FLAG_BIT.get(key)
+            if bit is not None:
+                known |= bit
+                values |= bit if value == "YES" else 0
+        return self.determined_bits(known, values, paper_like, paper_stained)
+
+    def determined_bits(self, known, values, paper_like=None, paper_stained=None):
+        """determined() for bitmasks: `known` flag bits, of which `values` are YES."""
+        known &= FLAGS_MASK
+        values &= known
+        memo_key = (known, values, paper_like, paper_stained)
+        if memo_key not in self._determined:
+            self._determined[memo_key] = self._enumerate(known, values, paper_like, paper_stained)
+        return self._determined[memo_key]
+
+    def _enumerate(self, known, values, paper_like, paper_stained):
+        flags = _ALL_FLAGS[(_ALL_FLAGS & known) == values]
+        outcomes = set()
+        for like in ([False, True] if paper_like is None else [paper_like]):
+            # stain only counts on paper: CV paper-like, or the model's PAPER_PRESENT
+            paper = np.ones(len(flags), dtype=bool) if like else (flags & FLAG_BIT["PAPER_PRESENT"]) != 0
+            for stained in ([False, True] if paper_stained is None else [paper_stained]):
+                keys = flags | ((paper & stained) * STAIN_BIT)
+                outcomes.update(np.unique(self.table[keys]).tolist())
+        outcomes = {LABEL_CODE["TRASH"] if c == LABEL_CODE["NONE"] else c for c in outcomes}
+        return LABELS[outcomes.pop()] if len(outcomes) == 1 else None
+
+
+def compile_rules(rules):
+    groups = rules.get("groups", {})
+    compiled = [(_compile_rule(rule, groups), LABEL_CODE[rule["bin"]]) for rule in rules["rules"]]
+    default = LABEL_CODE[rules.get("default", "NONE")]
+
+    table = np.empty(TABLE_SIZE, dtype=np.uint8)
+    for key in range(TABLE_SIZE):
+        table[key] = next((code for matches, code in compiled if matches(key)), default)
+    return table
+
+
+def _compile_rule(rule, groups):
+    unknown = {k for k in rule if k not in ("any", "all", "none", "min_groups", "bin")}
+    if unknown:
+        raise ValueError(f"Unknown rule condition(s) {sorted(unknown)} in {rule}")
+    if rule.get("bin") not in LABEL_CODE:
+        raise ValueError(f"Rule bin must be one of {LABELS}: {rule}")
+
+    def bits(name):
+        if name == "STAINED":
+            return STAIN_BIT
+        if name in groups:
+            mask = 0
+            for member in groups[name]:
+                mask |= bits(member)
+            return mask
+        if name in FLAG_BIT:
+            return FLAG_BIT[name]
+        raise ValueError(f"Unknown flag or group {name!r}")
+
+    any_of = [bits(n) for n in rule.get("any", [])]
+    all_of = [bits(n) for n in rule.get("all", [])]
+    none_of = [bits(n) for n in rule.get("none", [])]
+    group_masks = [bits(g) for g in groups]
+    min_groups = rule.get("min_groups")
+
+    def matches(key):
+        if any_of and not any(key & m for m in any_of):
+            return False
+        if any(not key & m for m in all_of):
+            return False
+        if any(key & m for m in none_of):
+            return False
+        if min_groups is not None and sum(bool(key & m) for m in group_masks) < min_groups:
+            return False
+        return True
+
+    return matches
+
+
+def engine_from_config(path):
+    """DecisionTable for a site rules file, falling back to DEFAULT_RULES when there is none."""
+    if path and os.path.exists(path):
+        return DecisionTable.from_file(path)
+    return DecisionTable()
@@ -0,0 +1,169 @@
+import argparse
+import contextlib
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import camera_classifier as cc
+import metrics
+from datasets import iter_images, expected_label, normalise, read_manifest
+from decision_engine import DecisionTable, load_rules
+from frame import Frame
+from recorded_ollama import RecordedOllama, CASSETTE_PATH, backend_id
+
+# -------------------------------------
+# Accuracy evaluation over a labelled dataset.
+# Runs the full classify pipeline (no result cache, no fast tier) on every
+# image, in parallel, and prints a confusion matrix over
+# TRASH / RECYCLING / COMPOST plus per-stage latency.
+#
+# Labels come from the parent folder name (images/COMPOST/peel.jpg, as in
+# datasets.py) or from a manifest: CSV with path,label columns or
+# JSONL with {"path": ..., "label": ...}; paths are relative to the manifest.
+#
+# Every raw model response is kept in a cassette (recorded_ollama.py),
+# keyed by image hash + prompt, so after one recording run a rule change
+# (--rules) re-evaluates in seconds with --responses replay. A prompt
+# change misses the cassette for that prompt only and is recorded in auto mode.
+#
+#   python evaluate.py dataset/ --responses record
+#   python evaluate.py dataset/ --responses replay --rules site_rules.json
+#   python evaluate.py --manifest labels.csv --workers 4
+# -------------------------------------
+EVAL_LABELS = ["TRASH", "RECYCLING", "COMPOST"]
+EVAL_WORKERS = 4                   # match OLLAMA_NUM_PARALLEL when recording
+PERCENTILES = (50, 95)
+
+
+def load_manifest(path):
+    """[(image path, expected label)] from a CSV or JSONL manifest."""
+    items = []
+    for image, label in read_manifest(path):
+        if normalise(label) not in EVAL_LABELS:
+            raise ValueError(f"{path}: label must be one of {EVAL_LABELS}, got {label!r}")
+        items.append((image, normalise(label)))
+    return items
+
+
+def load_folder(folder):
+    return [(path, expected_label(path)) for path in iter_images(folder) if expected_label(path)]
+
+
+def evaluate_item(path, expected, mode):
+    frame = Frame.from_file(path)
+    if frame is None:
+        return None
+    with metrics.trace(script="evaluate", expected=expected) as item:
+        label, flags = cc.classify_frame_with_flags(frame, mode=mode, use_cache=False, use_fast_tier=False)
+    stages = {}
+    for s in item.spans:
+        stages[s["stage"]] = stages.get(s["stage"], 0.0) + s["seconds"]
+    return {"path": path, "expected": expected, "predicted": normalise(label),
+            "fallback": flags is None, "stages": stages}
+
+
+def confusion(results):
+    index = {label: i for i, label in enumerate(EVAL_LABELS)}
+    matrix = np.zeros((len(EVAL_LABELS), len(EVAL_LABELS)), dtype=np.int64)
+    for r in results:
+        matrix[index[r["expected"]], index[r["predicted"]]] += 1
+    return matrix
+
+
+def print_confusion(matrix):
+    corner = "expected / predicted"
+    print(f"\n{corner:<22}" + "".join(f"{label:>11}" for label in EVAL_LABELS) + f"{'recall':>9}")
+    for i, label in enumerate(EVAL_LABELS):
+        row_total = matrix[i].sum()
+        recall = f"{matrix[i, i] / row_total:.0%}" if row_total else "-"
+        print(f"{label:<22}" + "".join(f"{matrix[i, j]:>11}" for j in range(len(EVAL_LABELS))) + f"{recall:>9}")
+    precision = []
+    for j in range(len(EVAL_LABELS)):
+        col_total = matrix[:, j].sum()
+        precision.append(f"{matrix[j, j] / col_total:.0%}" if col_total else "-")
+    print(f"{'precision':<22}" + "".join(f"{p:>11}" for p in precision))
+
+
+def print_stages(results):
+    samples = {}
+    for r in results:
+        for stage, seconds in r["stages"].items():
+            samples.setdefault(stage, []).append(seconds)
+    print(f"\n{'stage':<14}{'n':>6}" + "".join(f"{'p' + str(p):>10}" for p in PERCENTILES))
+    for stage, values in sorted(samples.items()):
+        print(f"{stage:<14}{len(values):>6}" +
+              "".join(f"{np.percentile(values, p) * 1000:>8.1f}ms" for p in PERCENTILES))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate classification accuracy on a labelled dataset.")
+    parser.add_argument("folder", nargs="?", default="images",
+                        help="images under TRASH/ RECYCLING/ COMPOST/ sub-folders")
+    parser.add_argument("--manifest", help="CSV (path,label) or JSONL manifest instead of folder names")
+    parser.add_argument("--mode", default=cc.CLASSIFY_MODE, choices=["two_stage", "single_pass", "chat"])
+    parser.add_argument("--rules", help="decision rule set JSON to evaluate (default: the configured one)")
+    parser.add_argument("--workers", type=int, default=EVAL_WORKERS)
+    parser.add_argument("--responses", choices=["auto", "record", "replay", "live"],
+                        help="model responses: replay from the cassette, record to it, or neither "
+                             "(live); default auto, or live with --mock")
+    parser.add_argument("--cassette", default=CASSETTE_PATH, help="recorded responses (JSONL)")
+    parser.add_argument("--mock", action="store_true", help="use a local mock Ollama (smoke test)")
+    parser.add_argument("--verbose", action="store_true", help="show the pipeline's own output")
+    args = parser.parse_args()
+    # mock answers are canned: don't record them unless asked to
+    args.responses = args.responses or ("live" if args.mock else "auto")
+
+    items = load_manifest(args.manifest) if args.manifest else load_folder(args.folder)
+    if not items:
+        print("No labelled images found (expected TRASH/ RECYCLING/ COMPOST/ folders or a --manifest).")
+        raise SystemExit(0)
+
+    mock = None
+    if args.mock:
+        from mock_ollama import MockOllama
+        mock = MockOllama().start()
+    cc.configure(ollama=mock.url if mock is not None else None)
+    client = None
+    if args.responses != "live":
+        inner = None if args.responses == "replay" else cc.OLLAMA
+        urls = [mock.url] if mock is not None else cc.OLLAMA_API_URLS
+        client = RecordedOllama(inner, args.cassette, args.responses, backend_id(urls))
+        cc.configure(ollama=client)
+    if args.rules:
+        cc.DECISION_ENGINE = DecisionTable(load_rules(args.rules))
+
+    print(f"\n🧪 Evaluating {len(items)} image(s), mode={args.mode}, rules={cc.DECISION_ENGINE.name}, "
+          f"responses={args.responses}, {args.workers} worker(s)")
+    t0 = time.perf_counter()
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with quiet, ThreadPoolExecutor(max_workers=args.workers) as pool:
+        if args.responses != "replay":
+            cc.warmup()
+        futures = [pool.submit(evaluate_item, path, expected, args.mode) for path, expected in items]
+        results = [r for r in (f.result() for f in futures) if r is not None]
+    elapsed = time.perf_counter() - t0
+    if mock is not None:
+        mock.stop()
+
+    if not results:
+        print("No readable images.")
+        raise SystemExit(0)
+
+    correct = sum(r["expected"] == r["predicted"] for r in results)
+    fallbacks = sum(r["fallback"] for r in results)
+    print(f"\nAccuracy: {correct}/{len(results)} ({correct / len(results):.1%}) in {elapsed:.1f}s"
+          f"{f', {fallbacks} TRASH fallback(s) (model unavailable)' if fallbacks else ''}")
+    print_confusion(confusion(results))
+    print_stages(results)
+    if client is not None:
+        print(f"\nResponses: {client.hits} replayed, {client.recorded} recorded, {client.misses} missing "
+              f"({args.cassette})")
+
+    wrong = [r for r in results if r["expected"] != r["predicted"]]
+    if wrong:
+        print("\n Misclassified")
+        for r in wrong:
+            print(f"{r['path']:<50} expected {r['expected']:<10} got {r['predicted']}"
+                  f"{' (fallback)' if r['fallback'] else ''}")
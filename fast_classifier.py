@@ -0,0 +1,134 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+
+# ============================================================
+# ON-DEVICE FAST TIER
+# Colour-histogram features + a small softmax (multinomial logistic)
+# model, trained from our own logged LLaVA decisions. When it is
+# confident it answers directly; otherwise the LLaVA path runs.
+# NumPy/OpenCV only -> runs in ~1 ms on a Pi CPU.
+# ============================================================
+LABELS = ["COMPOST", "RECYCLING", "TRASH"]
+FEATURE_SIZE = 96                  # frames are shrunk to 96x96 before histograms
+HUE_BINS = 18
+SAT_BINS = 8
+VAL_BINS = 8
+
+
+def extract_features(image):
+    """
+    Fixed-length float32 vector:
+      hue histogram of saturated pixels, saturation + value histograms,
+      mean/std per HSV channel, edge density, share of grey pixels.
+    """
+    small = cv2.resize(image, (FEATURE_SIZE, FEATURE_SIZE), interpolation=cv2.INTER_AREA)
+    hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+    n = float(FEATURE_SIZE * FEATURE_SIZE)
+
+    colourful = cv2.inRange(hsv, (0, 50, 40), (179, 255, 255))
+    hue = cv2.calcHist([hsv], [0], colourful, [HUE_BINS], [0, 180]).ravel() / n
+    sat = cv2.calcHist([hsv], [1], None, [SAT_BINS], [0, 256]).ravel() / n
+    val = cv2.calcHist([hsv], [2], None, [VAL_BINS], [0, 256]).ravel() / n
+
+    mean, std = cv2.meanStdDev(hsv)
+    stats = np.concatenate([mean.ravel() / 255.0, std.ravel() / 255.0])
+
+    grey = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    edges = np.count_nonzero(cv2.Canny(grey, 60, 160)) / n
+    grey_share = 1.0 - np.count_nonzero(colourful) / n
+
+    return np.concatenate([hue, sat, val, stats, [edges, grey_share]]).astype(np.float32)
+
+
+def _softmax(z):
+    z = z - z.max(axis=1, keepdims=True)
+    e = np.exp(z)
+    return e / e.sum(axis=1, keepdims=True)
+
+
+class FastClassifier:
+    def __init__(self, weights, bias, mean, scale, labels=LABELS):
+        self.weights = weights
+        self.bias = bias
+        self.mean = mean
+        self.scale = scale
+        self.labels = list(labels)
+        self.served = 0            # answered without LLaVA
+        self.deferred = 0          # handed to the LLaVA path
+        self._lock = threading.Lock()
+
+    # ---- training
+    @classmethod
+    def train(cls, X, y, labels=LABELS, l2=1e-3, lr=0.5, epochs=400):
+        """
+        X: (n, d) features, y: (n,) integer class ids. Full-batch gradient
+        descent on standardised features; small enough to train in seconds.
+        """
+        mean = X.mean(axis=0)
+        scale = X.std(axis=0) + 1e-6
+        Xs = (X - mean) / scale
+        n, d = Xs.shape
+        k = len(labels)
+        onehot = np.eye(k, dtype=np.float32)[y]
+
+        W = np.zeros((d, k), np.float32)
+        b = np.zeros(k, np.float32)
+        for _ in range(epochs):
+            p = _softmax(Xs @ W + b)
+            grad = (p - onehot) / n
+            W -= lr * (Xs.T @ grad + l2 * W)
+            b -= lr * grad.sum(axis=0)
+        return cls(W, b, mean, scale, labels)
+
+    # ---- inference
+    def predict_proba(self, X):
+        X = np.atleast_2d(X)
+        return _softmax(((X - self.mean) / self.scale) @ self.weights + self.bias)
+
+    def predict(self, image):
+        """Returns (label, confidence) for one BGR frame."""
+        p = self.predict_proba(extract_features(image))[0]
+        i = int(p.argmax())
+        return self.labels[i], float(p[i])
+
+    def try_classify(self, image, threshold):
+        """
+        Label if confidence >= threshold, else None (caller falls back to LLaVA).
+        Updates the served/deferred counters.
+        """
+        label, confidence = self.predict(image)
+        with self._lock:
+            if confidence >= threshold:
+                self.served += 1
+                return label, confidence
+            self.deferred += 1
+            return None, confidence
+
+    def stats(self):
+        with self._lock:
+            total = self.served + self.deferred
+            return {
+                "served": self.served,
+                "deferred": self.deferred,
+                "served_fraction": self.served / total if total else 0.0,
+            }
+
+    # ---- persistence
+    def save(self, path):
+        np.savez(path, weights=self.weights, bias=self.bias, mean=self.mean, scale=self.scale,
+                 labels=np.array(self.labels))
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(data["weights"], data["bias"], data["mean"], data["scale"], [str(x) for x in data["labels"]])
+
+
+def load_if_present(path):
+    """The fast tier is optional: no model file -> None."""
+    if path and os.path.exists(path):
+        return FastClassifier.load(path)
+    return None
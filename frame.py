@@ -0,0 +1,159 @@
+import cv2
+import json
+import os
+import time
+import base64
+import threading
+
+import numpy as np
+
+# ============================================================
+# IN-MEMORY FRAME
+# Carries the decoded image plus ONE JPEG/base64 encoding that is
+# produced lazily the first time a stage needs it and then shared by
+# every other stage (no capture.jpg round-trip through the SD card).
+# ============================================================
+JPEG_QUALITY = 90                  # full-resolution encoding (save / side-output)
+
+# ============================================================
+# UPLOAD PREPROCESSING
+# LLaVA resizes every image to a few hundred pixels internally, so the
+# camera's full-resolution JPEG is wasted upload bytes, base64 work and
+# server-side decode time. The model gets a downsized (optionally
+# cropped) re-encode instead. tune_upload_size.py picks these values.
+# ============================================================
+UPLOAD_MAX_SIDE = 672              # longest side sent to the model (None/0 = no resize)
+UPLOAD_JPEG_QUALITY = 85
+UPLOAD_CROP = None                 # (x0, y0, x1, y1) as fractions, e.g. the tray area
+UPLOAD_CONFIG_PATH = "upload_config.json"
+
+
+def configure_upload(max_side=UPLOAD_MAX_SIDE, quality=UPLOAD_JPEG_QUALITY, crop=UPLOAD_CROP):
+    global UPLOAD_MAX_SIDE, UPLOAD_JPEG_QUALITY, UPLOAD_CROP
+    UPLOAD_MAX_SIDE = max_side
+    UPLOAD_JPEG_QUALITY = quality
+    UPLOAD_CROP = tuple(crop) if crop else None
+
+
+def load_upload_config(path=UPLOAD_CONFIG_PATH):
+    """Apply a config written by tune_upload_size.py, if there is one."""
+    if not os.path.exists(path):
+        return False
+    with open(path, encoding="utf-8") as f:
+        cfg = json.load(f)
+    configure_upload(cfg.get("max_side"), cfg.get("quality", UPLOAD_JPEG_QUALITY), cfg.get("crop"))
+    return True
+
+
+class Frame:
+    def __init__(self, image, timestamp=None, source=None, jpeg=None,
+                 upload_max_side=None, upload_quality=None, upload_crop=None, item_box=None):
+        self.image = image
+        self.timestamp = time.monotonic() if timestamp is None else timestamp
+        self.source = source
+        self.item_box = item_box       # (x, y, w, h) from the presence gate, None = whole frame
+        # per-frame overrides of the module-level upload settings (0 = no resize)
+        self.upload_max_side = upload_max_side
+        self.upload_quality = upload_quality
+        self.upload_crop = upload_crop
+        self._jpeg = jpeg
+        self._upload_jpeg = None
+        self._b64 = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        """
+        Load a JPEG/PNG from disk. The original file bytes are reused as the
+        full-resolution encoding, so nothing is re-encoded.
+        """
+        with open(path, "rb") as f:
+            data = f.read()
+        image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            return None
+        return cls(image, source=path, jpeg=data, **kwargs)
+
+    @property
+    def jpeg(self):
+        with self._lock:
+            if self._jpeg is None:
+                self._jpeg = _encode(self.image, JPEG_QUALITY)
+            return self._jpeg
+
+    def with_upload(self, max_side=None, quality=None, crop=None):
+        """Same image (and full-res bytes) with different upload settings."""
+        return Frame(self.image, timestamp=self.timestamp, source=self.source, jpeg=self._jpeg,
+                     upload_max_side=max_side, upload_quality=quality, upload_crop=crop, item_box=self.item_box)
+
+    @property
+    def item_image(self):
+        """The item's region (presence gate box), or the whole image when it is not known."""
+        if self.item_box is None:
+            return self.image
+        x, y, w, h = self.item_box
+        return self.image[y:y + h, x:x + w]
+
+    def upload_image(self):
+        """The image as the model should see it: cropped, then downsized."""
+        img = self.image
+        crop = self.upload_crop or UPLOAD_CROP
+        if crop:
+            h, w = img.shape[:2]
+            x0, y0, x1, y1 = crop
+            img = img[int(y0 * h):int(y1 * h), int(x0 * w):int(x1 * w)]
+
+        max_side = UPLOAD_MAX_SIDE if self.upload_max_side is None else self.upload_max_side
+        h, w = img.shape[:2]
+        if max_side and max(h, w) > max_side:
+            scale = max_side / max(h, w)
+            img = cv2.resize(img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+        return img
+
+    @property
+    def upload_jpeg(self):
+        if self._upload_jpeg is None:
+            img = self.upload_image()
+            if img is self.image and self._jpeg is not None:
+                data = self._jpeg            # already small enough: reuse the existing bytes
+            else:
+                data = _encode(img, self.upload_quality or UPLOAD_JPEG_QUALITY)
+            with self._lock:
+                if self._upload_jpeg is None:
+                    self._upload_jpeg = data
+        return self._upload_jpeg
+
+    @property
+    def b64(self):
+        """Base64 of the upload encoding (what every model call sends)."""
+        if self._b64 is None:
+            encoded = base64.b64encode(self.upload_jpeg).decode("utf-8")
+            with self._lock:
+                if self._b64 is None:
+                    self._b64 = encoded
+        return self._b64
+
+    def save(self, path="capture.jpg"):
+        """Optional side-output: write the full-resolution JPEG bytes."""
+        with open(path, "wb") as f:
+            f.write(self.jpeg)
+        return path
+
+
+def _encode(image, quality):
+    ok, buf = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    if not ok:
+        raise ValueError("cv2.imencode failed")
+    return buf.tobytes()
+
+
+def as_frame(item):
+    """
+    Accept a Frame, a BGR ndarray or an image path and return a Frame
+    (or None if the path cannot be decoded).
+    """
+    if isinstance(item, Frame):
+        return item
+    if isinstance(item, np.ndarray):
+        return Frame(item)
+    return Frame.from_file(item)
@@ -0,0 +1,124 @@
+import cv2
+import json
+import time
+import threading
+from collections import OrderedDict
+
+# ============================================================
+# PERCEPTUAL-HASH RESULT CACHE
+# Re-presented items (re-trigger, hand jitter) produce near-identical
+# frames; a 64-bit difference hash of the downscaled item region plus a
+# Hamming-distance lookup lets us reuse the previous flags/bin instead
+# of running LLaVA again. Hash the item, not the whole frame: at a fixed
+# station the static background dominates a whole-frame hash, and two
+# different items on it can be 0-1 bits apart. Entries are scoped (one
+# scope per station), so cameras never share hits.
+# ============================================================
+HASH_SIZE = 8                      # 8x8 comparisons -> 64-bit hash
+MAX_DISTANCE = 4                   # Hamming bits; tune with hits/misses
+TTL_SECONDS = 120.0                # an item is rarely re-presented after 2 min
+MAX_ENTRIES = 256
+MAX_BYTES = 256 * 1024             # rough cap on stored values
+
+
+def dhash(image, hash_size=HASH_SIZE):
+    """
+    Difference hash: shrink to (hash_size+1) x hash_size grey pixels and
+    record whether each pixel is brighter than its right-hand neighbour.
+    """
+    small = cv2.resize(image, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+class ResultCache:
+    """
+    LRU + TTL cache keyed by perceptual hash, with near-duplicate lookup.
+    Values are small dicts, e.g. {"label": "RECYCLING", "flags": {...}}.
+    """
+
+    def __init__(self, max_distance=MAX_DISTANCE, ttl_seconds=TTL_SECONDS,
+                 max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.max_distance = max_distance
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()      # (scope, hash) -> (stored_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _drop(self, key):
+        _stored_at, size, _value = self._entries.pop(key)
+        self._bytes -= size
+
+    def _expire(self, now):
+        for key in [k for k, (t, _s, _v) in self._entries.items() if now - t > self.ttl_seconds]:
+            self._drop(key)
+            self.expirations += 1
+
+    def get(self, key, scope=None):
+        """Closest entry in `scope` within max_distance, or None."""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            best_key, best_dist = None, self.max_distance + 1
+            for k in self._entries:
+                if k[0] != scope:
+                    continue
+                d = hamming(k[1], key)
+                if d < best_dist:
+                    best_key, best_dist = k, d
+                    if d == 0:
+                        break
+
+            if best_key is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            return self._entries[best_key][2]
+
+    def put(self, key, value, scope=None):
+        size = len(json.dumps(value, default=str))
+        key = (scope, key)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic(), size, value)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "max_distance": self.max_distance,
+            }
@@ -0,0 +1,188 @@
+import os
+import threading
+import time
+
+import metrics
+
+# ============================================================
+# HARDWARE BACKENDS (LEDs + camera)
+# Scripts ask for LEDs and a camera through make_leds() / make_camera()
+# instead of building gpiozero / OpenCV objects themselves:
+#
+#   "real": gpiozero LEDs, OpenCV CameraStream
+#   "fake": in-memory FakeLed / FakeCamera (laptops, CI, start-up benchmarks)
+#
+# Pick with SORTER_HARDWARE=fake or the backend argument. gpiozero, cv2 and
+# numpy are imported only when a backend that needs them is built, so
+# importing a script never touches GPIO and stays cheap. Without GPIO
+# (gpiozero missing or no pin factory) real LEDs fall back to fakes with
+# a warning; a missing camera is still an error.
+# ============================================================
+HARDWARE = os.environ.get("SORTER_HARDWARE", "real")
+LED_PINS = (17, 27, 22)            # BCM: red TRASH, yellow RECYCLING, green COMPOST
+FAKE_FRAME_SIZE = (480, 640)       # (height, width)
+FAKE_FPS = 15.0
+
+
+class FakeLed:
+    """gpiozero.LED stand-in that only remembers its state."""
+
+    def __init__(self, pin=None):
+        self.pin = pin
+        self.is_lit = False
+        self.changes = 0
+
+    def on(self):
+        self.is_lit = True
+        self.changes += 1
+
+    def off(self):
+        self.is_lit = False
+        self.changes += 1
+
+    def close(self):
+        pass
+
+
+def make_leds(pins=LED_PINS, backend=None):
+    """(trash, recycle, compost) LEDs for `pins`."""
+    if (backend or HARDWARE) != "fake":
+        try:
+            from gpiozero import LED
+            return tuple(LED(pin) for pin in pins)
+        except Exception as e:      # ImportError, or gpiozero without a pin factory
+            print("⚠️ GPIO not available, LEDs are simulated:", e)
+    return tuple(FakeLed(pin) for pin in pins)
+
+
+class FakeCamera:
+    """
+    CameraStream stand-in. Serves the current scene (an empty grey frame
+    until place() is called) at `fps`, with the same consumer API:
+    latest_frame(), wait_for_frame(after, timeout), running, source.
+    """
+
+    def __init__(self, source="fake", fps=FAKE_FPS, size=FAKE_FRAME_SIZE, settle_seconds=0.0):
+        self.source = source
+        self.fps = fps
+        self.size = size
+        self.settle_seconds = settle_seconds
+        self.ready_at = None
+        self.frames_read = 0
+        self.read_failures = 0
+        self._scene = None
+        self._running = False
+        self._opened = None
+
+    def start(self):
+        if not self._running:
+            import numpy as np
+            if self._scene is None:
+                self._scene = np.full(self.size + (3,), 128, np.uint8)
+            self._opened = time.monotonic()
+            self.ready_at = self._opened + self.settle_seconds
+            self._running = True
+        return self
+
+    def stop(self):
+        self._running = False
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def running(self):
+        return self._running
+
+    def place(self, image):
+        """Put an item (BGR ndarray, or an image path) in front of the camera."""
+        if isinstance(image, str):
+            import cv2
+            image = cv2.imread(image)
+        self._scene = image
+
+    def clear(self):
+        import numpy as np
+        self._scene = np.full(self.size + (3,), 128, np.uint8)
+
+    def _tick(self):
+        # frames arrive on a fixed clock: timestamp of the newest frame so far
+        n = int((time.monotonic() - self._opened) * self.fps)
+        return self._opened + n / self.fps
+
+    def latest_frame(self):
+        if not self._running:
+            return None, None
+        return self._tick(), self._scene
+
+    def wait_for_frame(self, after=None, timeout=3.0):
+        if after is None:
+            after = self.ready_at or 0.0
+        deadline = time.monotonic() + timeout
+        while self._running:
+            ts = self._tick()
+            if ts > after:
+                self.frames_read += 1
+                return ts, self._scene
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(remaining, 1.0 / self.fps))
+        return None, None
+
+
+def make_camera(source=None, backend=None, **kwargs):
+    """Started camera. Real: CameraStream (raises RuntimeError if it cannot open)."""
+    if (backend or HARDWARE) == "fake":
+        return FakeCamera("fake" if source is None else source, **kwargs).start()
+    from camera_stream import CameraStream, CAMERA_INDEX
+    return CameraStream(CAMERA_INDEX if source is None else source, **kwargs).start()
+
+
+class StartupJobs:
+    """
+    Run independent start-up jobs (camera open, LED init, pipeline import +
+    model warmup) on threads at once, so start-up costs the slowest job
+    instead of the sum. Job times go to the report and to the
+    startup_seconds histogram.
+    """
+
+    def __init__(self, started=None):
+        self.seconds = {}
+        self.results = {}
+        self.errors = {}
+        self._threads = []
+        self._t0 = time.perf_counter() if started is None else started    # perf_counter() at launch
+
+    def start(self, name, fn, *args):
+        def run():
+            t0 = time.perf_counter()
+            try:
+                self.results[name] = fn(*args)
+            except Exception as e:
+                self.errors[name] = e
+            self.seconds[name] = time.perf_counter() - t0
+
+        t = threading.Thread(target=run, name=f"startup-{name}", daemon=True)
+        t.start()
+        self._threads.append(t)
+        return self
+
+    def wait(self):
+        for t in self._threads:
+            t.join()
+        self.seconds["total"] = time.perf_counter() - self._t0
+        for name, seconds in self.seconds.items():
+            metrics.observe(name, seconds, name="startup_seconds")
+        return self.results
+
+    def report(self, budget=None):
+        jobs = ", ".join(f"{name} {s:.2f}s" for name, s in self.seconds.items() if name != "total")
+        total = self.seconds.get("total", 0.0)
+        over = budget is not None and total > budget
+        print(f"{'⚠️' if over else '⏱️'} Start-up {total:.2f}s ({jobs})"
+              f"{f' over the {budget:.1f}s budget' if over else ''}")
+        return not over
@@ -0,0 +1,122 @@
+import queue
+import threading
+import time
+
+# ============================================================
+# NON-BLOCKING LED ACTUATOR
+# One thread owns the LEDs and plays commands from a queue, so the
+# classification loop never sleeps on actuation. A new command preempts
+# whatever is currently displayed (the worker waits on the queue between
+# pattern steps instead of sleeping). The one exception: busy() does not
+# cut a result short; it starts once the current show() hold is over.
+#
+#   show(label, hold)  solid bin colour, then off
+#   busy()             chase pattern while an item is being classified
+#   error()            all LEDs blink
+#   off()
+# Patterns mirror led_blinker.py.
+# ============================================================
+FOREVER = None
+_STOP = object()
+
+
+class LedController:
+    def __init__(self, trash, recycle, compost):
+        self.trash = trash
+        self.recycle = recycle
+        self.compost = compost
+        self._commands = queue.Queue()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="led-controller", daemon=True)
+        self._thread.start()
+
+    # ---- public API (all return immediately)
+    def show(self, bin_label, hold_seconds=3.0):
+        self._send(("show", bin_label, hold_seconds))
+
+    def busy(self):
+        self._send(("busy",))
+
+    def error(self, seconds=3.0):
+        self._send(("error", seconds))
+
+    def off(self):
+        self._send(("off",))
+
+    def wait_idle(self, timeout=None):
+        """Block until the current display has finished (e.g. before a one-shot script exits)."""
+        return self._idle.wait(timeout)
+
+    def close(self):
+        self._send(_STOP)
+        self._thread.join(timeout=2.0)
+        self._set(False, False, False)
+
+    def _send(self, command):
+        with self._lock:
+            self._idle.clear()
+            self._commands.put(command)
+
+    # ---- worker
+    def _set(self, trash, recycle, compost):
+        for led, on in ((self.trash, trash), (self.recycle, recycle), (self.compost, compost)):
+            led.on() if on else led.off()
+
+    def _steps(self, command):
+        """Yield (trash, recycle, compost, seconds) steps; seconds=FOREVER holds until preempted."""
+        kind = command[0]
+        if kind == "show":
+            _, label, hold = command
+            b = (label or "").strip().upper()
+            if b == "RECYCLING":
+                yield False, True, False, hold
+            elif b == "COMPOST":
+                yield False, False, True, hold
+            else:
+                # TRASH / NONE / unknown => TRASH
+                yield True, False, False, hold
+        elif kind == "busy":
+            while True:
+                yield True, False, False, 0.25
+                yield False, True, False, 0.25
+                yield False, False, True, 0.25
+        elif kind == "error":
+            for _ in range(max(1, int(command[1]))):
+                yield True, True, True, 0.5
+                yield False, False, False, 0.5
+
+    def _run(self):
+        command = ("off",)
+        while command is not _STOP:
+            next_command = None
+            for trash, recycle, compost, seconds in self._steps(command):
+                self._set(trash, recycle, compost)
+                next_command = self._wait(seconds, holding_result=command[0] == "show")
+                if next_command is not None:
+                    break  # preempted
+
+            if next_command is None:
+                # pattern finished on its own: LEDs off, idle until the next command
+                self._set(False, False, False)
+                with self._lock:
+                    if self._commands.empty():
+                        self._idle.set()
+                next_command = self._commands.get()
+            command = next_command
+
+    def _wait(self, seconds, holding_result):
+        """Next command within `seconds`, or None. During a result hold a busy() waits for the hold to end."""
+        deadline = None if seconds is FOREVER else time.monotonic() + seconds
+        deferred = None
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                command = self._commands.get(timeout=remaining)
+            except queue.Empty:
+                return deferred
+            if holding_result and command is not _STOP and command[0] == "busy":
+                deferred = command
+                continue
+            return command
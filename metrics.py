@@ -0,0 +1,214 @@
+import contextlib
+import contextvars
+import json
+import socket
+import threading
+import time
+
+# ============================================================
+# STAGE METRICS
+# Monotonic timing spans, counters and one latency histogram per stage.
+#
+#   with span("food_only"): ...          time a stage
+#   inc("fallbacks_total", reason=...)   bump a counter
+#   with trace(source=...): ...          group one item's spans into a
+#                                        single JSONL line in TRACE_PATH
+#   observe("queue_wait", seconds)       record a duration measured elsewhere
+#   serve(9108)                          Prometheus text on /metrics
+#
+# Spans inside a trace are recorded with their offset from the start of
+# the item, so overlapping (concurrent) stages are visible in the JSONL.
+# ============================================================
+TRACE_PATH = "traces.jsonl"        # None = no JSONL traces
+METRICS_PORT = 9108
+STATION = socket.gethostname()
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_CURRENT = contextvars.ContextVar("trace", default=None)
+
+
+def configure(trace_path=TRACE_PATH, station=STATION):
+    global TRACE_PATH, STATION
+    TRACE_PATH = trace_path
+    STATION = station
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _fmt_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, edge in enumerate(self.buckets):
+            if value <= edge:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+class Trace:
+    def __init__(self, fields):
+        self.fields = fields
+        self.start = time.monotonic()
+        self.spans = []
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def add_span(self, stage, start, seconds):
+        with self._lock:
+            self.spans.append({"stage": stage, "start": round(start - self.start, 4),
+                               "seconds": round(seconds, 4), "thread": threading.current_thread().name})
+
+    def add_count(self, name, value):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def record(self):
+        return {"ts": time.time(), "station": STATION, **self.fields,
+                "total_seconds": round(time.monotonic() - self.start, 4),
+                "spans": self.spans, "counters": self.counters}
+
+
+class Registry:
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+        current = _CURRENT.get()
+        if current is not None:
+            current.add_count(name, value)
+
+    def observe(self, stage, seconds, name="stage_seconds", **labels):
+        key = _key(name, dict(labels, stage=stage))
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram()
+            hist.observe(seconds)
+
+    def render(self):
+        """Prometheus text exposition format."""
+        lines = []
+        typed = set()
+        with self._lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name}{_fmt_labels(labels)} {value}")
+            for (name, labels), hist in sorted(self.histograms.items()):
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# TYPE {name} histogram")
+                running = 0
+                for edge, count in zip(hist.buckets, hist.counts):
+                    running += count
+                    lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', edge)])} {running}")
+                lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', '+Inf')])} {hist.count}")
+                lines.append(f"{name}_sum{_fmt_labels(labels)} {hist.sum:.6f}")
+                lines.append(f"{name}_count{_fmt_labels(labels)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+REGISTRY = Registry()
+_write_lock = threading.Lock()
+
+
+def inc(name, value=1, **labels):
+    REGISTRY.inc(name, value, **labels)
+
+
+def observe(stage, seconds, name="stage_seconds", **labels):
+    """Record a duration measured elsewhere (e.g. time spent waiting in a queue)."""
+    REGISTRY.observe(stage, seconds, name, **labels)
+
+
+@contextlib.contextmanager
+def span(stage):
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        seconds = time.monotonic() - start
+        REGISTRY.observe(stage, seconds)
+        current = _CURRENT.get()
+        if current is not None:
+            current.add_span(stage, start, seconds)
+
+
+def current_trace():
+    return _CURRENT.get()
+
+
+@contextlib.contextmanager
+def trace(**fields):
+    """
+    One trace per item. Nested calls join the outer trace, so a script can
+    wrap capture + classify + actuate while classify_frame() alone still
+    produces a trace when called directly.
+    """
+    outer = _CURRENT.get()
+    if outer is not None:
+        outer.fields.update(fields)
+        yield outer
+        return
+
+    current = Trace(fields)
+    token = _CURRENT.set(current)
+    try:
+        yield current
+    finally:
+        _CURRENT.reset(token)
+        if TRACE_PATH:
+            line = json.dumps(current.record(), ensure_ascii=False)
+            with _write_lock, open(TRACE_PATH, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+def serve(port=METRICS_PORT, host="0.0.0.0"):
+    """Expose REGISTRY on http://host:port/metrics from a daemon thread."""
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler   # ~40ms, only when serving
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            data = REGISTRY.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
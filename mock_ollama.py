@@ -0,0 +1,320 @@
+import argparse
+import datetime
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# ============================================================
+# LOCAL OLLAMA STAND-IN
+# Speaks enough of /api/generate and /api/chat (streaming and
+# non-streaming) to drive the real pipeline without a GPU box: canned
+# answers picked by prompt type, and configurable latency distributions
+# per call type.
+#
+# Responses carry Ollama-style timings. The sampled latency is split into
+# prompt eval (PREFILL_SHARE, most of it the image) and generation; a chat
+# turn that continues a conversation whose image was already processed
+# skips the image part, like Ollama reusing its KV cache.
+#
+# Model residency is simulated too: a call to a model that is not loaded
+# first pays LOAD_SECONDS (reported as load_duration), the first image
+# call after a load also pays VISION_LOAD_SECONDS, and the model unloads
+# once its keep_alive runs out (or on unload()). GET /api/ps lists what
+# is loaded; a generate with no prompt just loads (or, with keep_alive 0,
+# unloads) the model, like Ollama.
+#
+# Latency spec strings:
+#   "fixed:0.8"             always 0.8 s
+#   "uniform:0.5:1.5"       uniform between 0.5 s and 1.5 s
+#   "lognormal:1.2:0.3"     median 1.2 s, sigma 0.3 (long right tail)
+# ============================================================
+DEFAULT_LATENCY = {
+    "warmup": "fixed:0.05",
+    "food": "lognormal:0.6:0.25",
+    "flags": "lognormal:1.8:0.3",
+    "single": "lognormal:2.0:0.3",
+}
+
+LOAD_SECONDS = 1.0                 # model load after an unload
+VISION_LOAD_SECONDS = 0.4          # first image call after a load (vision projector)
+DEFAULT_KEEP_ALIVE = 300.0         # Ollama's default: 5 minutes
+
+PREFILL_SHARE = 0.6                # share of a call spent in prompt eval
+IMAGE_PREFILL_SHARE = 0.5          # ... of which the image tokens
+IMAGE_TOKENS = 576                 # LLaVA-1.5 image tokens at 336px
+
+FOOD_ANSWERS = ["NO", "NO", "YES"]
+FLAG_SETS = [
+    {"PLASTIC_BOTTLE_OR_TUB_PRESENT": "YES"},
+    {"METAL_PRESENT": "YES"},
+    {"PAPER_PRESENT": "YES"},
+    {"WRAPPER_OR_FILM_PRESENT": "YES"},
+    {"FOOD_PRESENT": "YES"},
+    {"PLASTIC_BOTTLE_OR_TUB_PRESENT": "YES", "CONTAINS_OTHER_ITEM": "YES"},
+]
+FLAG_ORDER = [
+    "FOOD_PRESENT", "GLASS_PRESENT", "METAL_PRESENT", "PAPER_PRESENT",
+    "PLASTIC_BOTTLE_OR_TUB_PRESENT", "WRAPPER_OR_FILM_PRESENT",
+    "SMALL_RIGID_PLASTIC_PRESENT", "CONTAINS_OTHER_ITEM",
+]
+
+
+def parse_latency(spec):
+    kind, *args = spec.split(":")
+    args = [float(a) for a in args]
+    if kind == "fixed":
+        return lambda rng: args[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(args[0], args[1])
+    if kind == "lognormal":
+        mu = math.log(args[0])
+        return lambda rng: rng.lognormvariate(mu, args[1])
+    raise ValueError(f"Unknown latency spec {spec!r}")
+
+
+def parse_keep_alive(value):
+    """Ollama keep_alive ("10m", "30s", "1h", seconds; negative = forever) -> seconds."""
+    if value is None:
+        return DEFAULT_KEEP_ALIVE
+    if isinstance(value, (int, float)):
+        seconds = float(value)
+    else:
+        units = {"s": 1, "m": 60, "h": 3600}
+        seconds = float(value[:-1]) * units[value[-1]] if value[-1] in units else float(value)
+    return math.inf if seconds < 0 else seconds
+
+
+def call_type(prompt, images):
+    if not images or prompt.startswith("Reply with OK"):
+        return "warmup"
+    if "FOOD_MAIN_OBJECT" in prompt:
+        return "single"
+    if "ONE WORD" in prompt:
+        return "food"
+    return "flags"
+
+
+class MockOllama:
+    """
+    Canned answers are deterministic per image (hash of the base64 payload),
+    so repeated runs over images/ give the same decisions.
+    """
+
+    def __init__(self, latency=None, seed=0, canned=None, load_seconds=LOAD_SECONDS,
+                 vision_load_seconds=VISION_LOAD_SECONDS):
+        specs = dict(DEFAULT_LATENCY, **(latency or {}))
+        self.latency = {k: parse_latency(v) for k, v in specs.items()}
+        self.rng = random.Random(seed)
+        self.canned = canned or {}         # image sha1 -> {"food": "YES", "flags": {...}}
+        self.calls = {k: 0 for k in specs}
+        self.aborted = 0
+        self.context_reused = 0
+        self.load_seconds = load_seconds
+        self.vision_load_seconds = vision_load_seconds
+        self.loads = 0
+        self._loaded = {}                  # model -> (expires (monotonic), vision ready)
+        self._lock = threading.Lock()
+        self.server = None
+
+    def answer(self, kind, images):
+        key = hashlib.sha1(images[0].encode()).hexdigest() if images else ""
+        pick = int(key[:8], 16) if key else 0
+        item = self.canned.get(key, {})
+        food = item.get("food", FOOD_ANSWERS[pick % len(FOOD_ANSWERS)])
+        flags = item.get("flags", FLAG_SETS[pick % len(FLAG_SETS)])
+
+        if kind == "warmup":
+            return "OK"
+        if kind == "food":
+            return food
+        lines = [f"{k}={flags.get(k, 'NO')}" for k in FLAG_ORDER]
+        if kind == "single":
+            lines.insert(0, f"FOOD_MAIN_OBJECT={food}")
+        return "\n".join(lines)
+
+    def delay(self, kind):
+        with self._lock:
+            self.calls[kind] += 1
+            return self.latency[kind](self.rng)
+
+    # ---- model residency
+    def use_model(self, model, keep_alive, images=False):
+        """Seconds this call waits for loading, and renew the model's keep_alive."""
+        now = time.monotonic()
+        with self._lock:
+            expires, vision = self._loaded.get(model, (0.0, False))
+            load = 0.0
+            if expires <= now:
+                load, vision = self.load_seconds, False
+                self.loads += 1
+            if images and not vision:
+                load, vision = load + self.vision_load_seconds, True
+            keep = parse_keep_alive(keep_alive)
+            if keep == 0:
+                self._loaded.pop(model, None)
+            else:
+                self._loaded[model] = (now + load + keep, vision)
+            return load
+
+    def unload(self, model=None):
+        """Simulate an eviction (all models when model is None)."""
+        with self._lock:
+            if model is None:
+                self._loaded.clear()
+            else:
+                self._loaded.pop(model, None)
+
+    def running(self):
+        """/api/ps body."""
+        now = time.monotonic()
+        models = []
+        with self._lock:
+            for model, (expires, _vision) in self._loaded.items():
+                if expires > now:
+                    wall = time.time() + min(expires - now, 1e9)
+                    expires_at = datetime.datetime.fromtimestamp(wall, datetime.timezone.utc).isoformat()
+                    models.append({"name": model, "model": model, "expires_at": expires_at, "size_vram": 0})
+        return {"models": models}
+
+    # ---- HTTP server
+    def start(self, host="127.0.0.1", port=0):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _json(self, body, status=200):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path == "/api/version":
+                    self._json({"version": "mock"})
+                elif self.path == "/api/ps":
+                    self._json(mock.running())
+                else:
+                    self._json({"error": "not found"}, 404)
+
+            def do_POST(self):
+                if self.path not in ("/api/generate", "/api/chat"):
+                    self._json({"error": "not found"}, 404)
+                    return
+                req = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                chat = self.path == "/api/chat"
+                model = req.get("model")
+                if not req.get("prompt") and not req.get("messages"):
+                    # load / unload only
+                    load = mock.use_model(model, req.get("keep_alive"))
+                    time.sleep(load)
+                    reason = "unload" if parse_keep_alive(req.get("keep_alive")) == 0 else "load"
+                    self._json({"model": model, "response": "", "done": True, "done_reason": reason,
+                                "load_duration": int(load * 1e9), "total_duration": int(load * 1e9)})
+                    return
+                if chat:
+                    messages = req.get("messages") or []
+                    users = [m for m in messages if m.get("role") == "user"]
+                    prompt = users[-1].get("content", "") if users else ""
+                    images = [img for m in users for img in m.get("images") or []]
+                    # the image arrived in an earlier turn: its prefill is cached
+                    cached = bool(images) and not (users[-1].get("images") if users else None)
+                else:
+                    prompt = req.get("prompt", "")
+                    images = req.get("images") or []
+                    cached = False
+                kind = call_type(prompt, images)
+                text = mock.answer(kind, images)
+                seconds = mock.delay(kind)
+                load = mock.use_model(model, req.get("keep_alive"), bool(images))
+                prefill = seconds * PREFILL_SHARE
+                prompt_tokens = len(prompt) // 4
+                if images and not cached:
+                    prompt_tokens += IMAGE_TOKENS
+                if cached:
+                    prefill -= seconds * IMAGE_PREFILL_SHARE
+                    seconds -= seconds * IMAGE_PREFILL_SHARE
+                    with mock._lock:
+                        mock.context_reused += 1
+                stats = {"total_duration": int((load + seconds) * 1e9), "load_duration": int(load * 1e9),
+                         "prompt_eval_count": prompt_tokens,
+                         "prompt_eval_duration": int(prefill * 1e9), "eval_count": len(text) // 3 + 1,
+                         "eval_duration": int((seconds - prefill) * 1e9)}
+
+                def body(piece, done):
+                    if chat:
+                        out = {"message": {"role": "assistant", "content": piece}, "done": done}
+                    else:
+                        out = {"response": piece, "done": done}
+                    return dict(out, **stats) if done else out
+
+                if not req.get("stream", True):
+                    time.sleep(load + seconds)
+                    self._json(dict(body(text, True), model=req.get("model")))
+                    return
+
+                # stream one line per chunk; the prompt eval (image prefill)
+                # comes before the first chunk, the rest is spread over the tokens
+                chunks = [line + "\n" for line in text.split("\n")]
+                chunks[-1] = chunks[-1].rstrip("\n")
+                per_chunk = (seconds - prefill) / max(len(chunks), 1)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    time.sleep(load + prefill)
+                    for chunk in chunks:
+                        time.sleep(per_chunk)
+                        self._chunk(body(chunk, False))
+                    self._chunk(body("", True))
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    with mock._lock:
+                        mock.aborted += 1
+
+            def _chunk(self, body):
+                data = (json.dumps(body) + "\n").encode()
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="mock-ollama", daemon=True).start()
+        return self
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/api/generate"
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the Ollama API.")
+    parser.add_argument("--port", type=int, default=11434)
+    for kind in DEFAULT_LATENCY:
+        parser.add_argument(f"--{kind}-latency", default=DEFAULT_LATENCY[kind])
+    parser.add_argument("--load-seconds", type=float, default=LOAD_SECONDS, help="model load time")
+    args = parser.parse_args()
+
+    latency = {kind: getattr(args, f"{kind}_latency") for kind in DEFAULT_LATENCY}
+    mock = MockOllama(latency, load_seconds=args.load_seconds).start(port=args.port)
+    print(f"🧪 Mock Ollama listening on {mock.url} (Ctrl+C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        mock.stop()
@@ -0,0 +1,183 @@
+import argparse
+import datetime
+import re
+import threading
+import time
+
+import requests
+
+import metrics
+from ollama_client import backend_clients
+
+# ============================================================
+# MODEL RESIDENCY KEEPER
+# Ollama unloads a model KEEP_ALIVE after its last request (or earlier,
+# under memory pressure), and the next item then waits for a full
+# reload. A background thread checks GET /api/ps every `interval`
+# seconds on each backend:
+#
+#   model not listed     -> it was unloaded: reload it through `warm`
+#                           (the vision warmup), count model_unloads_total
+#   expires within margin -> idle: refresh keep_alive with an empty-prompt
+#                           request (loads nothing, generates nothing)
+#
+# Real traffic renews keep_alive by itself, so refreshes only happen in
+# idle periods. Servers without /api/ps are refreshed every interval.
+#
+#   python model_keeper.py               show what the server holds
+#   python model_keeper.py --compare     cold vs warm call latency
+# ============================================================
+KEEPER_INTERVAL = 30.0             # seconds between /api/ps checks
+REFRESH_MARGIN = 90.0              # refresh when the model would unload within this
+
+
+def parse_expires_at(value):
+    """Ollama's RFC 3339 timestamp (nanosecond fraction, Z or offset) -> epoch seconds."""
+    value = re.sub(r"(\.\d{6})\d+", r"\1", value.replace("Z", "+00:00"))
+    return datetime.datetime.fromisoformat(value).timestamp()
+
+
+def find_model(models, model):
+    """The /api/ps entry for `model` ("llava:7b"; a bare name means ":latest"), or None."""
+    wanted = model if ":" in model else model + ":latest"
+    for entry in models:
+        if wanted in (entry.get("name"), entry.get("model")):
+            return entry
+    return None
+
+
+class ModelKeeper:
+    def __init__(self, client, model, keep_alive, warm=None, interval=KEEPER_INTERVAL, margin=REFRESH_MARGIN):
+        self.clients = backend_clients(client)
+        self.model = model
+        self.keep_alive = keep_alive
+        self.warm = warm                   # warm(client) -> bool; None = plain load request
+        self.interval = interval
+        self.margin = margin
+        self.unloads = 0
+        self.refreshes = 0
+        self.errors = 0
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="model-keeper", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            for client in self.clients:
+                try:
+                    self.check(client)
+                except Exception as e:
+                    # server down, breaker open, odd /api/ps data: try again next round
+                    self.errors += 1
+                    metrics.inc("model_keeper_errors_total", backend=client.url, error=type(e).__name__)
+                    if not isinstance(e, requests.RequestException):
+                        print(f"⚠️ Model keeper check failed on {client.url}:", e)
+
+    def check(self, client):
+        """One residency check of one backend; returns what it did."""
+        models = client.ps()
+        if models is None:
+            self.refresh(client)
+            return "refreshed"
+        entry = find_model(models, self.model)
+        if entry is None:
+            self.unloads += 1
+            metrics.inc("model_unloads_total", backend=client.url)
+            print(f"⚠️ {self.model} is not loaded on {client.url}, reloading...")
+            if self.warm is not None:
+                self.warm(client)
+            else:
+                self.refresh(client)
+            return "reloaded"
+        expires_at = entry.get("expires_at")
+        if expires_at and parse_expires_at(expires_at) - time.time() < self.margin:
+            self.refresh(client)
+            return "refreshed"
+        return "resident"
+
+    def refresh(self, client):
+        client.generate({"model": self.model, "keep_alive": self.keep_alive})
+        self.refreshes += 1
+        metrics.inc("model_keepalive_refreshes_total", backend=client.url)
+
+
+def timed_call(fn, *args):
+    t0 = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - t0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Model residency status and cold vs warm latency.")
+    parser.add_argument("--compare", action="store_true",
+                        help="unload the model and time the first item after each warmup style")
+    parser.add_argument("--image", default="images/plastic_bottle.jpg", help="item used for the timed calls")
+    parser.add_argument("--warm-calls", type=int, default=5)
+    parser.add_argument("--mock", action="store_true", help="use a local mock Ollama")
+    args = parser.parse_args()
+
+    import camera_classifier as cc
+    from frame import Frame
+
+    mock = None
+    if args.mock:
+        from mock_ollama import MockOllama
+        mock = MockOllama().start()
+    cc.configure(ollama=mock.url if mock is not None else None)
+
+    for client in backend_clients(cc.OLLAMA):
+        models = client.ps()
+        entry = None if models is None else find_model(models, cc.MODEL)
+        if models is None:
+            status = "no /api/ps on this server"
+        elif entry is None:
+            status = "not loaded"
+        else:
+            left = parse_expires_at(entry["expires_at"]) - time.time() if entry.get("expires_at") else None
+            status = "loaded" + (f", unloads in {left:.0f}s" if left is not None else "")
+        print(f"{client.url}: {cc.MODEL} {status}")
+
+    if not args.compare:
+        raise SystemExit(0)
+
+    frame = Frame.from_file(args.image)
+    if frame is None:
+        print(f"❌ Could not read {args.image}")
+        raise SystemExit(1)
+
+    def unload():
+        cc.OLLAMA.generate({"model": cc.MODEL, "keep_alive": 0})
+
+    def text_warmup():
+        cc.OLLAMA.generate({"model": cc.MODEL, "prompt": "Reply with OK.", "stream": False,
+                            "keep_alive": cc.KEEP_ALIVE, "options": {"temperature": 0.0, "num_predict": 4}})
+
+    def first_item():
+        return timed_call(cc.call_llava_food_only, frame.with_upload())
+
+    print("\n Timing the first item after each start (model unloaded before each)...")
+    results = {}
+    unload()
+    results["no warmup"] = (0.0, first_item())
+    unload()
+    results["text-only warmup"] = (timed_call(text_warmup), first_item())
+    unload()
+    results["vision warmup"] = (timed_call(cc.warmup), first_item())
+    warm = sorted(first_item() for _ in range(args.warm_calls))
+    warm_p50 = warm[len(warm) // 2]
+
+    print(f"\n{'start':<20}{'warmup':>10}{'first item':>12}{'vs warm':>10}")
+    for name, (warmup_s, first_s) in results.items():
+        print(f"{name:<20}{warmup_s:>9.2f}s{first_s:>11.2f}s{first_s - warm_p50:>+9.2f}s")
+    print(f"{'warm (p50)':<20}{'':>10}{warm_p50:>11.2f}s")
+    if args.mock:
+        mock.stop()
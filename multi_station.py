@@ -0,0 +1,299 @@
+import argparse
+import signal
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+import metrics
+from frame import Frame
+from hardware import make_camera, make_leds
+from led_controller import LedController
+from presence_gate import PresenceGate, wait_for_placement
+from camera_classifier import warmup, start_model_keeper, classify_frame_with_flags, pretty
+from sorter_daemon import ConsoleActuator, POLL_SECONDS
+
+# ============================================================
+# MULTI-STATION SORTER
+# One process, several bins: each station has its own camera, presence
+# gate and LED set, and a capture thread feeding a shared inference pool.
+#
+#   capture (per station) -> rate limit -> FairQueue -> N workers -> LEDs
+#
+# - FairQueue keeps a small queue per station and hands items out
+#   round-robin, so a busy bin cannot starve a quiet one.
+# - Each station has a token bucket (items/minute + burst); placements
+#   over the limit are shed at the door.
+# - Under overload the oldest waiting item of a station is shed when a
+#   new one arrives, and items that waited longer than MAX_ITEM_AGE are
+#   shed at dequeue: by then the person has walked away.
+# - Per-station placement -> result latency goes to metrics
+#   (station_latency_seconds) and to the summary printed on exit.
+#
+#   python multi_station.py --station left=0:17,27,22 --station right=1:5,6,13
+#   python multi_station.py --station a=0 --station b=rtsp://cam-b/stream --no-leds
+# ============================================================
+INFERENCE_WORKERS = 2              # match OLLAMA_NUM_PARALLEL on the Ollama host
+STATION_QUEUE_SIZE = 2             # waiting items per station before shedding the oldest
+RATE_PER_MINUTE = 20.0             # sustained items/minute per station
+RATE_BURST = 3                     # placements allowed back-to-back
+MAX_ITEM_AGE = 15.0                # seconds; older items are shed instead of classified
+LATENCY_WINDOW = 500               # recent latencies kept per station for the summary
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute=RATE_PER_MINUTE, burst=RATE_BURST):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_take(self):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return True
+            return False
+
+
+class FairQueue:
+    """
+    Per-station bounded queues served round-robin.
+    put() returns the item it had to shed to make room (or None).
+    """
+
+    def __init__(self, per_station=STATION_QUEUE_SIZE):
+        self.per_station = per_station
+        self._queues = {}
+        self._order = []
+        self._next = 0
+        self._cond = threading.Condition()
+
+    def add_station(self, name):
+        with self._cond:
+            self._queues[name] = deque()
+            self._order.append(name)
+
+    def put(self, name, item):
+        with self._cond:
+            q = self._queues[name]
+            shed = q.popleft() if len(q) >= self.per_station else None
+            q.append(item)
+            self._cond.notify()
+            return shed
+
+    def get(self, timeout=None):
+        """Next (station, item) in round-robin order, or (None, None) on timeout."""
+        with self._cond:
+            if not self._cond.wait_for(self._pending, timeout):
+                return None, None
+            for i in range(len(self._order)):
+                name = self._order[(self._next + i) % len(self._order)]
+                if self._queues[name]:
+                    self._next = (self._next + i + 1) % len(self._order)
+                    return name, self._queues[name].popleft()
+        return None, None
+
+    def _pending(self):
+        return any(self._queues.values())
+
+    def depth(self):
+        with self._cond:
+            return {name: len(q) for name, q in self._queues.items()}
+
+
+class Station:
+    def __init__(self, name, camera, actuator, gate=None, limiter=None):
+        self.name = name
+        self.camera = camera
+        self.actuator = actuator
+        self.gate = gate or PresenceGate()
+        self.limiter = limiter or TokenBucket()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.counts = {"placed": 0, "classified": 0, "rate_limited": 0, "shed_overload": 0,
+                       "shed_stale": 0}
+        self._lock = threading.Lock()
+
+    def count(self, what):
+        with self._lock:
+            self.counts[what] += 1
+        if what != "classified":
+            metrics.inc("station_items_total", station=self.name, outcome=what)
+
+    def record_latency(self, seconds):
+        with self._lock:
+            self.latencies.append(seconds)
+        metrics.observe("end_to_end", seconds, name="station_latency_seconds", station=self.name)
+
+    def summary(self):
+        with self._lock:
+            lat = list(self.latencies)
+            counts = dict(self.counts)
+        if lat:
+            p50, p95 = np.percentile(lat, [50, 95])
+            latency = f"p50 {p50:.2f}s p95 {p95:.2f}s"
+        else:
+            latency = "no results"
+        return (f"{self.name:<12} {latency:<22} placed {counts['placed']}, classified {counts['classified']}, "
+                f"rate-limited {counts['rate_limited']}, shed {counts['shed_overload']} overload / "
+                f"{counts['shed_stale']} stale")
+
+
+class MultiStationSorter:
+    def __init__(self, stations, workers=INFERENCE_WORKERS, per_station=STATION_QUEUE_SIZE,
+                 max_item_age=MAX_ITEM_AGE, hold_seconds=3.0):
+        self.stations = {s.name: s for s in stations}
+        self.queue = FairQueue(per_station)
+        for name in self.stations:
+            self.queue.add_station(name)
+        self.workers = workers
+        self.max_item_age = max_item_age
+        self.hold_seconds = hold_seconds
+        self.stopping = threading.Event()
+        self._threads = []
+
+    # ---- stages
+    def _capture(self, station):
+        while not self.stopping.is_set() and station.camera.running:
+            ts, image = wait_for_placement(station.camera, station.gate, timeout=POLL_SECONDS * 5)
+            if image is None:
+                continue
+            station.count("placed")
+            if not station.limiter.try_take():
+                station.count("rate_limited")
+                print(f"⚠️ [{station.name}] over its rate limit, skipping placement")
+                continue
+            frame = Frame(image, timestamp=ts, source=station.camera.source, item_box=station.gate.item_box)
+            with metrics.span("encode"):
+                frame.b64
+            print(f"📥 [{station.name}] item placed (#{station.gate.placements})")
+            if self.queue.put(station.name, frame) is not None:
+                station.count("shed_overload")
+                print(f"⚠️ [{station.name}] inference backlog, shed the oldest waiting item")
+
+    def _worker(self):
+        while not self.stopping.is_set():
+            name, frame = self.queue.get(timeout=POLL_SECONDS)
+            if frame is None:
+                continue
+            station = self.stations[name]
+            if time.monotonic() - frame.timestamp > self.max_item_age:
+                station.count("shed_stale")
+                continue
+
+            metrics.observe("capture_to_classify", time.monotonic() - frame.timestamp, station=name)
+            station.actuator.busy()
+            try:
+                with metrics.trace(script="multi_station", station_name=name):
+                    label, _flags = classify_frame_with_flags(frame)
+            except Exception as e:
+                metrics.inc("fallbacks_total", reason="exception")
+                print(f"❌ [{name}] classification failed:", e)
+                label = "TRASH"
+            with metrics.span("actuate"):
+                station.actuator.show(label, self.hold_seconds)
+
+            seconds = time.monotonic() - frame.timestamp
+            station.count("classified")
+            station.record_latency(seconds)
+            print(f"🔎 [{name}] {pretty(label)} ({seconds:.2f}s after placement)")
+
+    # ---- lifecycle
+    def start(self):
+        for station in self.stations.values():
+            self._spawn(f"capture-{station.name}", self._capture, station)
+        for i in range(self.workers):
+            self._spawn(f"inference-{i}", self._worker)
+        return self
+
+    def _spawn(self, name, target, *args):
+        t = threading.Thread(target=target, args=args, name=name, daemon=True)
+        t.start()
+        self._threads.append(t)
+
+    def stop(self, *_signal_args):
+        self.stopping.set()
+
+    def run_forever(self):
+        self.start()
+        while not self.stopping.wait(1.0):
+            pass
+        print("\n🛑 Stopping stations...")
+        for t in self._threads:
+            t.join(timeout=5.0)
+        for station in self.stations.values():
+            station.camera.stop()
+            station.actuator.close()
+        print("\nPer-station summary")
+        for station in self.stations.values():
+            print(station.summary())
+
+
+class NamedConsoleActuator(ConsoleActuator):
+    def __init__(self, name):
+        self.name = name
+
+    def show(self, bin_label, hold_seconds=3.0):
+        print(f"💡 [{self.name}] {pretty(bin_label)}")
+
+
+def parse_station(spec):
+    """'name=source[:trash,recycle,compost]' -> (name, source, pins or None)."""
+    name, _, rest = spec.partition("=")
+    source, pins = rest, None
+    head, sep, tail = rest.rpartition(":")
+    if sep and tail.count(",") == 2 and all(p.strip().isdigit() for p in tail.split(",")):
+        source, pins = head, tuple(int(p) for p in tail.split(","))
+    if not name or not source:
+        raise argparse.ArgumentTypeError(f"bad station spec {spec!r}")
+    return name, int(source) if source.isdigit() else source, pins
+
+
+def make_station_actuator(name, pins):
+    if pins is None:
+        return NamedConsoleActuator(name)
+    return LedController(*make_leds(pins))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve several bins from one process.")
+    parser.add_argument("--station", action="append", type=parse_station, required=True,
+                        metavar="NAME=SOURCE[:TRASH,RECYCLE,COMPOST]",
+                        help="camera index or stream URL, optional BCM pins for its LEDs")
+    parser.add_argument("--workers", type=int, default=INFERENCE_WORKERS, help="concurrent inferences")
+    parser.add_argument("--rate", type=float, default=RATE_PER_MINUTE, help="items/minute per station")
+    parser.add_argument("--burst", type=int, default=RATE_BURST)
+    parser.add_argument("--no-leds", action="store_true", help="print results instead of driving LEDs")
+    parser.add_argument("--metrics-port", type=int, default=metrics.METRICS_PORT,
+                        help="Prometheus /metrics port (0 = off)")
+    args = parser.parse_args()
+
+    print(f"🚀 Starting {len(args.station)} station(s) (SIGTERM or Ctrl+C to stop)...")
+    stations = []
+    for name, source, pins in args.station:
+        try:
+            camera = make_camera(source)
+        except RuntimeError as e:
+            print(f"❌ [{name}] could not access camera:", e)
+            continue
+        actuator = make_station_actuator(name, None if args.no_leds else pins)
+        stations.append(Station(name, camera, actuator, limiter=TokenBucket(args.rate, args.burst)))
+    if not stations:
+        raise SystemExit(1)
+
+    warmup()
+    start_model_keeper()
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+        print(f"📈 Metrics on http://0.0.0.0:{args.metrics_port}/metrics")
+
+    sorter = MultiStationSorter(stations, workers=args.workers)
+    signal.signal(signal.SIGTERM, sorter.stop)
+    signal.signal(signal.SIGINT, sorter.stop)
+    print("👀 Learning the empty scenes, keep the areas clear...")
+    sorter.run_forever()
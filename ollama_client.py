@@ -0,0 +1,624 @@
+import json
+import time
+import queue
+import random
+import socket
+import threading
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# ============================================================
+# SHARED OLLAMA CLIENT
+# - one pooled keep-alive Session (no fresh TCP connect per call)
+# - bounded retries with jittered exponential backoff for transient errors
+# - circuit breaker: after repeated failures, fail fast for a cool-down
+#   period so callers drop straight to their TRASH fallback
+# ============================================================
+DEFAULT_TIMEOUT = (5, 25)          # (connect_timeout, read_timeout)
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# server-side timings Ollama reports on a finished response (nanoseconds / token counts)
+TIMING_FIELDS = ("total_duration", "load_duration", "prompt_eval_count", "prompt_eval_duration",
+                 "eval_count", "eval_duration")
+
+
+def timings(body):
+    """The TIMING_FIELDS present in a response body (or final stream chunk)."""
+    return {k: body[k] for k in TIMING_FIELDS if k in body}
+
+
+class OllamaUnavailable(RuntimeError):
+    """Raised without touching the network while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    closed    -> calls go through; `failure_threshold` consecutive failures open it
+    open      -> calls fail fast until `reset_seconds` have passed
+    half-open -> one trial call; success closes, failure re-opens
+    """
+
+    def __init__(self, failure_threshold=3, reset_seconds=15.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_in_flight or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+# ============================================================
+# HANGING UP ON A STREAMED CALL
+# Stopping between tokens is not enough for an abandoned call: during
+# prefill (image encoding) Ollama sends nothing at all, so the client is
+# blocked in post() with no Response to close. A CancelEvent passed to a
+# stream call shuts that call's socket from the cancelling thread instead,
+# which makes Ollama abort the request at once.
+# ============================================================
+_STREAM = threading.local()        # .connections: sockets of this thread's streamed call
+
+
+class CancelEvent(threading.Event):
+    """threading.Event whose set() also hangs up the stream calls it was passed to."""
+
+    def __init__(self):
+        super().__init__()
+        self._hang_ups = []
+        self._hang_up_lock = threading.Lock()
+
+    def set(self):
+        with self._hang_up_lock:
+            super().set()
+            hang_ups, self._hang_ups = self._hang_ups, []
+        for hang_up in hang_ups:
+            hang_up()
+
+    def on_set(self, fn):
+        """Run fn() when set (now, if it already is). Returns a function that unregisters it."""
+        with self._hang_up_lock:
+            if not self.is_set():
+                self._hang_ups.append(fn)
+                return lambda: self._unregister(fn)
+        fn()
+        return lambda: None
+
+    def _unregister(self, fn):
+        with self._hang_up_lock:
+            if fn in self._hang_ups:
+                self._hang_ups.remove(fn)
+
+
+class _TrackedConnection:
+    def request(self, *args, **kwargs):
+        connections = getattr(_STREAM, "connections", None)
+        if connections is not None:
+            connections.append(self)
+        return super().request(*args, **kwargs)
+
+
+class _TrackedHTTPConnection(_TrackedConnection, HTTPConnection):
+    pass
+
+
+class _TrackedHTTPSConnection(_TrackedConnection, HTTPSConnection):
+    pass
+
+
+class _TrackedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TrackedHTTPConnection
+
+
+class _TrackedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TrackedHTTPSConnection
+
+
+class _HangUpAdapter(HTTPAdapter):
+    """HTTPAdapter whose connections a CancelEvent can shut from another thread."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _TrackedHTTPConnectionPool,
+                                                   "https": _TrackedHTTPSConnectionPool}
+
+
+def _shut(connections):
+    for conn in list(connections):
+        sock = conn.sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)   # wakes the blocked reader; the pool drops the conn
+            except OSError:
+                pass
+
+
+class OllamaClient:
+    def __init__(self, url, timeout=DEFAULT_TIMEOUT, retries=2, backoff=0.25, max_backoff=2.0,
+                 pool_size=4, breaker=None):
+        self.url = url
+        self.chat_url = url.split("/api/")[0] + "/api/chat"
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker()
+
+        self.session = requests.Session()
+        adapter = _HangUpAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _sleep_before_retry(self, attempt):
+        # full jitter: uniform(0, min(max_backoff, backoff * 2^attempt))
+        time.sleep(random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt))))
+
+    def generate(self, payload, timeout=None):
+        """
+        POST payload and return the decoded JSON body.
+
+        Connection errors and 429/5xx are retried up to `retries` times.
+        Read timeouts are not retried (the model is busy; retrying would
+        just burn another full read timeout) but do count towards the breaker.
+        """
+        return self._post(self.url, payload, timeout)
+
+    def chat(self, payload, timeout=None):
+        """/api/chat counterpart of generate(); the reply is body["message"]["content"]."""
+        return self._post(self.chat_url, payload, timeout)
+
+    def generate_stream(self, payload, stop=None, timeout=None, stats=None, cancel=None):
+        """
+        Streaming variant: POST with "stream": true, accumulate the tokens and
+        call stop(text_so_far) after every chunk. As soon as it returns True the
+        response is closed, which makes Ollama abort the generation and frees
+        the model for the next request.
+        `cancel` (a CancelEvent) abandons the call from another thread: its
+        set() shuts the connection at once, even before the first token, and
+        the call returns what it has so far as stopped early.
+        If `stats` is a dict, the server's timings (TIMING_FIELDS) from the
+        final chunk are copied into it (an early stop gets none), plus the
+        client-side first_token_seconds and call_seconds, which are always set.
+        Returns (text, stopped_early).
+        """
+        return self._post_stream(self.url, payload, stop, timeout, stats,
+                                 lambda chunk: chunk.get("response", ""), cancel)
+
+    def chat_stream(self, payload, stop=None, timeout=None, stats=None, cancel=None):
+        """/api/chat counterpart of generate_stream()."""
+        return self._post_stream(self.chat_url, payload, stop, timeout, stats,
+                                 lambda chunk: (chunk.get("message") or {}).get("content", ""), cancel)
+
+    def ps(self, timeout=(1, 2)):
+        """Models the server holds in memory (GET /api/ps), or None if it has no /api/ps."""
+        r = self.session.get(self.url.split("/api/")[0] + "/api/ps", timeout=timeout)
+        if r.status_code == 404:
+            return None
+        r.raise_for_status()
+        return r.json().get("models") or []
+
+    def _post(self, url, payload, timeout):
+        if not self.breaker.allow():
+            raise OllamaUnavailable(f"Ollama circuit open ({self.url}); skipping call")
+
+        timeout = timeout or self.timeout
+        attempt = 0
+        while True:
+            try:
+                r = self.session.post(url, json=payload, timeout=timeout)
+                if r.status_code in RETRY_STATUS and attempt < self.retries:
+                    attempt += 1
+                    self._sleep_before_retry(attempt)
+                    continue
+                r.raise_for_status()
+                body = r.json()
+            except requests.ConnectionError:
+                if attempt < self.retries:
+                    attempt += 1
+                    self._sleep_before_retry(attempt)
+                    continue
+                self.breaker.record_failure()
+                raise
+            except requests.HTTPError as e:
+                # a 4xx means the server is up and answering; only 429/5xx count as failures
+                if e.response is not None and e.response.status_code in RETRY_STATUS:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                raise
+            except (requests.RequestException, ValueError):
+                self.breaker.record_failure()
+                raise
+
+            self.breaker.record_success()
+            return body
+
+    def _post_stream(self, url, payload, stop, timeout, stats, text_of, cancel=None):
+        if cancel is None or not hasattr(cancel, "on_set"):
+            return self._stream(url, payload, stop, timeout, stats, text_of, cancel)
+        connections = _STREAM.connections = []
+        unregister = cancel.on_set(lambda: _shut(connections))
+        try:
+            return self._stream(url, payload, stop, timeout, stats, text_of, cancel)
+        finally:
+            unregister()
+            _STREAM.connections = None
+
+    def _stream(self, url, payload, stop, timeout, stats, text_of, cancel):
+        if not self.breaker.allow():
+            raise OllamaUnavailable(f"Ollama circuit open ({self.url}); skipping call")
+
+        payload = dict(payload, stream=True)
+        timeout = timeout or self.timeout
+        stats = {} if stats is None else stats
+        parts = []
+
+        def stopped_early():
+            stats["call_seconds"] = time.monotonic() - t0
+            self.breaker.record_success()
+            return "".join(parts), True
+
+        def cancelled():
+            return cancel is not None and cancel.is_set()
+
+        attempt = 0
+        while True:
+            t0 = time.monotonic()
+            if cancelled():
+                return stopped_early()
+            try:
+                r = self.session.post(url, json=payload, timeout=timeout, stream=True)
+                if r.status_code in RETRY_STATUS and attempt < self.retries:
+                    r.close()
+                    attempt += 1
+                    self._sleep_before_retry(attempt)
+                    continue
+                r.raise_for_status()
+                break
+            except requests.ConnectionError:
+                if cancelled():
+                    return stopped_early()       # we hung up ourselves
+                # only reached before any body was read, so retrying is safe
+                if attempt < self.retries:
+                    attempt += 1
+                    self._sleep_before_retry(attempt)
+                    continue
+                self.breaker.record_failure()
+                raise
+            except requests.HTTPError as e:
+                if e.response is not None and e.response.status_code in RETRY_STATUS:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                raise
+            except requests.RequestException:
+                self.breaker.record_failure()
+                raise
+
+        try:
+            for line in r.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                stats.setdefault("first_token_seconds", time.monotonic() - t0)
+                parts.append(text_of(chunk))
+                if chunk.get("done"):
+                    stats.update(timings(chunk))
+                    break
+                if cancelled() or (stop is not None and stop("".join(parts))):
+                    return stopped_early()
+            else:
+                if cancelled():
+                    return stopped_early()
+        except (requests.RequestException, ValueError):
+            if cancelled():
+                return stopped_early()
+            self.breaker.record_failure()
+            raise
+        finally:
+            r.close()
+
+        stats["call_seconds"] = time.monotonic() - t0
+        self.breaker.record_success()
+        return "".join(parts), False
+
+    def close(self):
+        self.session.close()
+
+
+# ============================================================
+# MULTIPLE BACKENDS: ROUTING + HEDGED REQUESTS
+# OllamaPool has the same call API as OllamaClient, over several hosts:
+# - a health thread pings every backend (/api/version) every few seconds
+# - each call goes to the healthy backend with the lowest
+#   latency x (1 + requests in flight); new backends get tried first
+# - hedging: when the primary has not answered by its own p95 for this
+#   kind of call, the same request goes to the next-best backend; the
+#   first answer wins and the loser is hung up on (its connection is shut,
+#   which makes Ollama abort it)
+# - a failed call fails over to the next backend
+# Latency windows are kept per call kind (endpoint + num_predict), so a
+# 5-token food check is never compared with a 120-token flags call.
+# ============================================================
+HEALTH_INTERVAL = 10.0             # seconds between backend health checks
+HEALTH_TIMEOUT = (1, 2)
+HEDGE_MIN_SAMPLES = 20             # calls of a kind before its p95 is trusted for hedging
+LATENCY_WINDOW = 200
+EWMA_ALPHA = 0.2
+LATENCY_HALF_LIFE = 120.0          # seconds: an unused backend's latency estimate halves, so it gets retried
+
+
+class Backend:
+    def __init__(self, client):
+        self.client = client
+        self.healthy = True
+        self.in_flight = 0
+        self.ewma = {}                 # call kind -> smoothed seconds
+        self.updated = {}              # call kind -> monotonic time of the last sample
+        self.window = {}               # call kind -> recent seconds (for p95)
+        self.calls = 0
+        self.wins = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return self.client.url
+
+    def record(self, kind, seconds, lower_bound=False):
+        """
+        One latency sample. lower_bound: the call was hung up on after
+        `seconds` (a hedge loser), so it would have taken at least that long;
+        it only ever raises the estimate and stays out of the p95 window.
+        """
+        with self._lock:
+            old = self._decayed(kind)
+            if lower_bound and old is not None and old >= seconds:
+                return
+            self.ewma[kind] = seconds if old is None else old + EWMA_ALPHA * (seconds - old)
+            self.updated[kind] = time.monotonic()
+            if not lower_bound:
+                self.window.setdefault(kind, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+
+    def _decayed(self, kind):
+        # estimates fade while a backend goes unused: one slow spell (a reload,
+        # a busy GPU) doesn't keep it out of rotation forever
+        latency = self.ewma.get(kind)
+        if latency is None:
+            return None
+        age = time.monotonic() - self.updated.get(kind, time.monotonic())
+        return latency * 0.5 ** (age / LATENCY_HALF_LIFE)
+
+    def score(self, kind):
+        with self._lock:
+            latency = self._decayed(kind)
+            if latency is None and self.ewma:
+                known = [self._decayed(k) for k in self.ewma]
+                latency = sum(known) / len(known)
+            return (latency or 0.0) * (1 + self.in_flight)
+
+    def p95(self, kind):
+        with self._lock:
+            samples = self.window.get(kind)
+            if not samples or len(samples) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(samples)
+            return ordered[int(0.95 * (len(ordered) - 1))]
+
+    def acquire(self, delta):
+        with self._lock:
+            self.in_flight += delta
+
+
+class OllamaPool:
+    def __init__(self, urls, timeout=DEFAULT_TIMEOUT, retries=2, hedge=True, breaker_failures=3,
+                 breaker_reset_seconds=15.0, pool_size=4, health_interval=HEALTH_INTERVAL):
+        self.backends = [
+            Backend(OllamaClient(url, timeout=timeout, retries=retries, pool_size=pool_size,
+                                 breaker=CircuitBreaker(breaker_failures, breaker_reset_seconds)))
+            for url in urls
+        ]
+        self.url = self.backends[0].url
+        self.timeout = timeout
+        self.hedge = hedge
+        self.hedges = 0
+        self.failovers = 0
+        self._stopping = threading.Event()
+        if len(self.backends) > 1 and health_interval:
+            threading.Thread(target=self._health_loop, args=(health_interval,), name="ollama-health",
+                             daemon=True).start()
+
+    # ---- same API as OllamaClient
+    def generate(self, payload, timeout=None):
+        if not self._hedging():
+            return self._route("generate", payload, lambda c, p, cancel, st: c.generate(p, timeout))
+
+        # hedged calls are streamed so the loser can be hung up on
+        def call(client, p, cancel, st):
+            text, _early = client.generate_stream(p, timeout=timeout, stats=st, cancel=cancel)
+            return dict(st, response=text, done=True)
+        return self._route("generate", payload, call)
+
+    def chat(self, payload, timeout=None):
+        if not self._hedging():
+            return self._route("chat", payload, lambda c, p, cancel, st: c.chat(p, timeout))
+
+        def call(client, p, cancel, st):
+            text, _early = client.chat_stream(p, timeout=timeout, stats=st, cancel=cancel)
+            return dict(st, message={"role": "assistant", "content": text}, done=True)
+        return self._route("chat", payload, call)
+
+    def generate_stream(self, payload, stop=None, timeout=None, stats=None, cancel=None):
+        def call(client, p, attempt_cancel, st):
+            return client.generate_stream(p, stop=stop, timeout=timeout, stats=st, cancel=attempt_cancel)
+        return self._route("generate", payload, call, stats, cancel)
+
+    def chat_stream(self, payload, stop=None, timeout=None, stats=None, cancel=None):
+        def call(client, p, attempt_cancel, st):
+            return client.chat_stream(p, stop=stop, timeout=timeout, stats=st, cancel=attempt_cancel)
+        return self._route("chat", payload, call, stats, cancel)
+
+    def close(self):
+        self._stopping.set()
+        for backend in self.backends:
+            backend.client.close()
+
+    def stats(self):
+        return [{"url": b.url, "healthy": b.healthy, "breaker": b.client.breaker.state, "calls": b.calls,
+                 "wins": b.wins, "in_flight": b.in_flight,
+                 "latency": {k: round(v, 3) for k, v in b.ewma.items()}} for b in self.backends]
+
+    # ---- routing
+    def _hedging(self):
+        return self.hedge and len(self.backends) > 1
+
+    def _ranked(self, kind):
+        usable = [b for b in self.backends if b.healthy and b.client.breaker.state != "open"]
+        # nothing usable: try them all anyway (an open breaker fails fast)
+        return sorted(usable or self.backends, key=lambda b: b.score(kind))
+
+    def _route(self, endpoint, payload, call, stats=None, caller_cancel=None):
+        kind = (endpoint, (payload.get("options") or {}).get("num_predict"))
+        ranked = self._ranked(kind)
+        results = queue.Queue()
+        attempts = []                      # (backend, cancel, started) per launched attempt
+        unregister = []
+
+        def launch(backend):
+            cancel = CancelEvent()
+            if caller_cancel is not None and hasattr(caller_cancel, "on_set"):
+                # the caller hanging up hangs up every attempt
+                unregister.append(caller_cancel.on_set(cancel.set))
+            attempts.append((backend, cancel, time.monotonic()))
+            backend.acquire(+1)
+            backend.calls += 1
+
+            def run():
+                own_stats = {}
+                t0 = time.monotonic()
+                try:
+                    out = call(backend.client, payload, cancel, own_stats)
+                    if not cancel.is_set():
+                        # a cold call's model load says nothing about the backend's speed
+                        reported = own_stats or (out if isinstance(out, dict) else {})
+                        load = reported.get("load_duration", 0) / 1e9
+                        # a stream stopped early only shows a full call takes at least this
+                        # long: keep it out of the p95 window so hedging doesn't fire early
+                        stopped_early = isinstance(out, tuple) and out[1]
+                        backend.record(kind, max(0.0, time.monotonic() - t0 - load), lower_bound=stopped_early)
+                    results.put((backend, cancel, out, None, own_stats))
+                except Exception as e:
+                    results.put((backend, cancel, None, e, own_stats))
+                finally:
+                    backend.acquire(-1)
+
+            threading.Thread(target=run, name="ollama-attempt", daemon=True).start()
+
+        try:
+            start = time.monotonic()
+            launch(ranked[0])
+            tried, pending = 1, 1
+            hedge_after = ranked[0].p95(kind) if self.hedge and len(ranked) > 1 else None
+            last_error = None
+            finished = set()
+            while pending:
+                wait = None
+                if hedge_after is not None and tried < len(ranked):
+                    wait = max(0.0, start + hedge_after - time.monotonic())
+                try:
+                    backend, cancel, out, error, own_stats = results.get(timeout=wait)
+                except queue.Empty:
+                    # primary is slower than its own p95: race a duplicate on the next backend
+                    launch(ranked[tried])
+                    tried, pending = tried + 1, pending + 1
+                    hedge_after = None
+                    self.hedges += 1
+                    continue
+
+                pending -= 1
+                finished.add(cancel)
+                if error is None and caller_cancel is not None and caller_cancel.is_set():
+                    return out                 # the caller hung up: no winner, no failover
+                if error is None and not cancel.is_set():
+                    now = time.monotonic()
+                    for other, other_cancel, started in attempts:
+                        if other_cancel not in finished:
+                            other.record(kind, now - started, lower_bound=True)
+                        other_cancel.set()     # hang up on the loser
+                    backend.wins += 1
+                    if stats is not None:
+                        stats.update(own_stats)
+                    return out
+                if error is not None:
+                    last_error = error
+                if pending == 0 and tried < len(ranked):
+                    self.failovers += 1
+                    launch(ranked[tried])
+                    tried, pending = tried + 1, 1
+            raise last_error or OllamaUnavailable("no Ollama backend answered")
+        finally:
+            for fn in unregister:
+                fn()
+
+    def _health_loop(self, interval):
+        while not self._stopping.wait(interval):
+            for backend in self.backends:
+                base = backend.url.split("/api/")[0]
+                try:
+                    r = backend.client.session.get(base + "/api/version", timeout=HEALTH_TIMEOUT)
+                    backend.healthy = r.ok
+                except requests.RequestException:
+                    backend.healthy = False
+
+
+def backend_clients(client):
+    """The OllamaClient(s) behind `client`: every backend of a pool, or the client itself."""
+    return [b.client for b in client.backends] if isinstance(client, OllamaPool) else [client]
+
+
+def make_client(urls, **kwargs):
+    """OllamaClient for one URL, OllamaPool for several."""
+    if isinstance(urls, str):
+        urls = [urls]
+    if len(urls) == 1:
+        kwargs.pop("hedge", None)
+        failures = kwargs.pop("breaker_failures", 3)
+        reset = kwargs.pop("breaker_reset_seconds", 15.0)
+        kwargs.pop("health_interval", None)
+        return OllamaClient(urls[0], breaker=CircuitBreaker(failures, reset), **kwargs)
+    return OllamaPool(urls, **kwargs)
@@ -0,0 +1,169 @@
+import cv2
+import time
+import numpy as np
+
+# ============================================================
+# MOTION / PRESENCE GATE
+# Cheap frame differencing on a tiny grey thumbnail, at camera frame rate:
+#   - background model = running average of the empty scene
+#   - presence = share of pixels that differ from the background
+#   - motion   = share of pixels that differ from the previous frame
+# An item "arrives" when presence appears, "settles" when motion stays
+# low for a few frames -> exactly one classification per placement.
+# Empty scenes never reach Ollama. On SETTLED, item_box is where the item
+# is (what differs from the background), so later stages can look at the
+# item instead of the whole scene.
+# ============================================================
+GATE_WIDTH = 160                   # thumbnail width used for differencing
+DIFF_THRESHOLD = 25                # grey-level change that counts as "different"
+PRESENCE_RATIO = 0.02              # >2% of pixels differ from background -> something is there
+MOTION_RATIO = 0.004               # <0.4% of pixels changed since last frame -> still
+SETTLE_FRAMES = 6                  # consecutive still frames before triggering
+LEARN_FRAMES = 15                  # frames used to learn the empty background at start
+BACKGROUND_ALPHA = 0.02            # background adaptation speed while empty
+
+EMPTY = "EMPTY"                    # nothing in front of the camera
+MOTION = "MOTION"                  # something is entering / moving
+SETTLED = "SETTLED"                # returned once per placement -> classify now
+PRESENT = "PRESENT"                # item still there, already classified
+
+
+class PresenceGate:
+    def __init__(self, width=GATE_WIDTH, diff_threshold=DIFF_THRESHOLD, presence_ratio=PRESENCE_RATIO,
+                 motion_ratio=MOTION_RATIO, settle_frames=SETTLE_FRAMES, learn_frames=LEARN_FRAMES,
+                 background_alpha=BACKGROUND_ALPHA):
+        self.width = width
+        self.diff_threshold = diff_threshold
+        self.presence_ratio = presence_ratio
+        self.motion_ratio = motion_ratio
+        self.settle_frames = settle_frames
+        self.learn_frames = learn_frames
+        self.background_alpha = background_alpha
+
+        self.state = EMPTY
+        self.placements = 0
+        self.last_presence = 0.0
+        self.last_motion = 0.0
+        self.item_box = None       # (x, y, w, h) in full-frame pixels, set on SETTLED
+        self.last_frame_ts = 0.0   # camera timestamp of the last frame fed by wait_for_placement
+        self._seen = 0
+        self._still = 0
+        self._background = None    # float32 running average
+        self._prev = None
+        self._settled = None       # thumbnail at the last trigger
+        # reusable buffers (allocated on the first frame)
+        self._diff = None
+        self._mask = None
+        self._background_u8 = None
+
+    def _thumbnail(self, image):
+        h, w = image.shape[:2]
+        size = (self.width, max(1, int(h * self.width / w)))
+        small = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def _changed_ratio(self, a, b):
+        cv2.absdiff(a, b, dst=self._diff)
+        cv2.threshold(self._diff, self.diff_threshold, 255, cv2.THRESH_BINARY, dst=self._mask)
+        return cv2.countNonZero(self._mask) / self._mask.size
+
+    def _item_box(self, grey, shape, pad=2):
+        """Bounding box of the pixels that differ from the background, scaled to the full frame."""
+        self._changed_ratio(grey, self._background_u8)
+        x, y, w, h = cv2.boundingRect(self._mask)
+        if w == 0 or h == 0:
+            return None
+        x0, y0 = max(0, x - pad), max(0, y - pad)
+        x1, y1 = min(grey.shape[1], x + w + pad), min(grey.shape[0], y + h + pad)
+        sx, sy = shape[1] / grey.shape[1], shape[0] / grey.shape[0]
+        return int(x0 * sx), int(y0 * sy), int((x1 - x0) * sx), int((y1 - y0) * sy)
+
+    @property
+    def ready(self):
+        return self._seen >= self.learn_frames
+
+    def reset_background(self):
+        """Re-learn the empty scene (e.g. after the camera was moved)."""
+        self._seen = 0
+        self._background = None
+        self._settled = None
+        self.state = EMPTY
+
+    def update(self, image):
+        """
+        Feed one BGR frame; returns EMPTY, MOTION, SETTLED (once per placement) or PRESENT.
+        """
+        grey = self._thumbnail(image)
+
+        if self._background is None:
+            self._background = grey.astype(np.float32)
+            self._prev = grey
+            self._diff = np.empty_like(grey)
+            self._mask = np.empty_like(grey)
+            self._background_u8 = np.empty_like(grey)
+            self._seen = 1
+            return EMPTY
+
+        motion = self._changed_ratio(grey, self._prev)
+        self._prev = grey
+
+        # ---- learn the empty scene first
+        if not self.ready:
+            cv2.accumulateWeighted(grey, self._background, 1.0 / (self._seen + 1))
+            self._seen += 1
+            return EMPTY
+
+        cv2.convertScaleAbs(self._background, dst=self._background_u8)
+        presence = self._changed_ratio(grey, self._background_u8)
+        self.last_presence, self.last_motion = presence, motion
+        still = motion < self.motion_ratio
+        self._still = self._still + 1 if still else 0
+
+        if presence < self.presence_ratio:
+            # empty scene: slowly follow lighting changes, but only when nothing moves
+            if still:
+                cv2.accumulateWeighted(grey, self._background, self.background_alpha)
+            self.state = EMPTY
+            self._settled = None
+            return EMPTY
+
+        if self.state == PRESENT and still:
+            return PRESENT
+
+        # something is there and either arriving, moving, or was swapped
+        if self._still >= self.settle_frames:
+            # nudged but the same item settled back -> no new classification
+            if self._settled is not None and self._changed_ratio(grey, self._settled) < self.presence_ratio:
+                self.state = PRESENT
+                return PRESENT
+            self.state = PRESENT
+            self._settled = grey
+            self.placements += 1
+            self.item_box = self._item_box(grey, image.shape)
+            return SETTLED
+
+        self.state = MOTION
+        return MOTION
+
+
+def wait_for_placement(camera, gate, timeout=None):
+    """
+    Pull frames from a CameraStream through the gate until an item settles.
+    Returns (timestamp, frame) of the settled frame, or (None, None) on timeout
+    or when the camera stops. Frames the gate has already seen (in an earlier
+    call) are skipped, so a timeout-and-retry loop never feeds one twice.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while camera.running:
+        remaining = 3.0 if deadline is None else min(3.0, deadline - time.monotonic())
+        if remaining <= 0:
+            break
+        ts, image = camera.wait_for_frame(after=gate.last_frame_ts, timeout=remaining)
+        if image is None:
+            continue
+        gate.last_frame_ts = ts
+        if gate.update(image) == SETTLED:
+            return ts, image
+    return None, None
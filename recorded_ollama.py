@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+import threading
+
+from ollama_client import timings, backend_clients
+
+# ============================================================
+# RECORD / REPLAY OLLAMA RESPONSES
+# Drop-in for OllamaClient / OllamaPool (same call API). Every response
+# is keyed by the Ollama host(s) + the request's images + prompt/messages +
+# model + options and appended to a JSONL cassette, so a later run can
+# replay it without the model (but never one host's answers, e.g. a mock's,
+# as another's):
+#
+#   "record"  always call the model, store the full response
+#   "replay"  only answer from the cassette (a miss raises ReplayMiss)
+#   "auto"    replay when recorded, otherwise record
+#
+# Streaming calls are recorded as the full (non-streamed) response and
+# the caller's stop() is replayed over it line by line, so an early stop
+# under today's rules does not leave a truncated recording behind for
+# tomorrow's.
+# ============================================================
+CASSETTE_PATH = "eval_responses.jsonl"
+
+
+class ReplayMiss(RuntimeError):
+    """No recorded response for this request in replay mode."""
+
+
+def request_key(endpoint, payload, backend=None):
+    """sha256 over what determines the answer: backend, model, prompt/messages, image hashes, options."""
+    if endpoint == "chat":
+        text = [(m.get("role"), m.get("content"), [_sha(i) for i in m.get("images") or []])
+                for m in payload.get("messages", [])]
+    else:
+        text = [payload.get("prompt"), [_sha(i) for i in payload.get("images") or []]]
+    material = json.dumps([backend, endpoint, payload.get("model"), text, payload.get("options")], sort_keys=True)
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+def backend_id(urls):
+    """The Ollama host(s) behind a set of API URLs, as used in request keys ("http://host:11434,...")."""
+    return ",".join(sorted({url.split("/api/")[0] for url in urls}))
+
+
+def _sha(image_b64):
+    return hashlib.sha256(image_b64.encode()).hexdigest()
+
+
+class RecordedOllama:
+    """`backend`: backend_id() of the hosts answering; defaults to inner's, needed for replay without one."""
+
+    def __init__(self, inner=None, path=CASSETTE_PATH, mode="auto", backend=None):
+        if mode not in ("record", "replay", "auto"):
+            raise ValueError(f"Unknown mode {mode!r}")
+        if inner is None and mode != "replay":
+            raise ValueError("recording needs a real client")
+        if backend is None and inner is None:
+            raise ValueError("replaying without a client needs the backend it was recorded from")
+        self.inner = inner
+        self.backend = backend or backend_id([c.url for c in backend_clients(inner)])
+        self.path = path
+        self.mode = mode
+        self.url = getattr(inner, "url", "replay")
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries[entry["key"]] = entry
+
+    # ---- same API as OllamaClient
+    def generate(self, payload, timeout=None):
+        entry = self._lookup("generate", payload, timeout)
+        return dict(entry["timings"], response=entry["text"], done=True)
+
+    def chat(self, payload, timeout=None):
+        entry = self._lookup("chat", payload, timeout)
+        return dict(entry["timings"], message={"role": "assistant", "content": entry["text"]}, done=True)
+
+    # cancel is accepted for the API; a miss is recorded as a full (unstreamed) answer anyway
+    def generate_stream(self, payload, stop=None, timeout=None, stats=None, cancel=None):
+        return self._replay_stream(self._lookup("generate", payload, timeout), stop, stats)
+
+    def chat_stream(self, payload, stop=None, timeout=None, stats=None, cancel=None):
+        return self._replay_stream(self._lookup("chat", payload, timeout), stop, stats)
+
+    def close(self):
+        if self.inner is not None:
+            self.inner.close()
+
+    # ---- cassette
+    def _lookup(self, endpoint, payload, timeout):
+        key = request_key(endpoint, payload, self.backend)
+        if self.mode != "record":
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is not None:
+                with self._lock:
+                    self.hits += 1
+                return entry
+            if self.mode == "replay":
+                with self._lock:
+                    self.misses += 1
+                raise ReplayMiss(f"no recorded {endpoint} response for request {key[:12]}")
+
+        body = getattr(self.inner, endpoint)(dict(payload, stream=False), timeout)
+        if endpoint == "chat":
+            text = (body.get("message") or {}).get("content", "")
+        else:
+            text = body.get("response", "")
+        entry = {"key": key, "backend": self.backend, "endpoint": endpoint, "model": payload.get("model"),
+                 "text": text, "timings": timings(body)}
+        with self._lock:
+            self._entries[key] = entry
+            self.recorded += 1
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+        return entry
+
+    @staticmethod
+    def _replay_stream(entry, stop, stats):
+        text = entry["text"]
+        if stop is not None:
+            # feed the recorded text back one line at a time, as the stream would arrive
+            pos = 0
+            while pos < len(text):
+                nl = text.find("\n", pos)
+                pos = len(text) if nl < 0 else nl + 1
+                if pos < len(text) and stop(text[:pos]):
+                    return text[:pos], True
+        if stats is not None:
+            stats.update(entry["timings"])
+        return text, False
@@ -0,0 +1,248 @@
+import argparse
+import atexit
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from decision_engine import FLAG_KEYS
+
+# ============================================================
+# RESULTS STORE (append-only, SQLite in WAL mode)
+# One row per classified item: wall-clock time, station, bin label,
+# which tier answered, the model flags as a bitmask, CV stain metrics,
+# per-stage timings and the sha256 of the uploaded JPEG. The JPEG itself
+# goes to a content-addressed folder (frames/ab/abcd....jpg), so a
+# repeated frame is stored once.
+#
+# record() only puts a dict on a queue. A background thread writes
+# batches (one transaction per batch) and hashes/saves the frames, so
+# logging never adds latency to classification. If the queue is full
+# the row is dropped and counted instead of blocking.
+# ============================================================
+DB_PATH = "results.db"
+FRAMES_DIR = "frames"              # None = don't keep frames
+BATCH_SIZE = 64
+FLUSH_SECONDS = 1.0
+QUEUE_SIZE = 10000
+
+# bit i of flags_mask = FLAG_BITS[i] == "YES"; bits 0-7 are the decision
+# engine's flag bits, so stored masks index its lookup table directly
+FLAG_BITS = FLAG_KEYS + ["FOOD_MAIN_OBJECT", "FOOD_ONLY", "FAST_TIER"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS decisions (
+    id            INTEGER PRIMARY KEY,
+    ts            REAL NOT NULL,
+    station       TEXT,
+    source        TEXT,
+    label         TEXT NOT NULL,
+    tier          TEXT,
+    mode          TEXT,
+    flags_mask    INTEGER,
+    unknown_mask  INTEGER,
+    paper_like    INTEGER,
+    paper_stained INTEGER,
+    paper_pixels  INTEGER,
+    stain_pixels  INTEGER,
+    stain_ratio   REAL,
+    total_seconds REAL,
+    timings       TEXT,
+    frame_sha256  TEXT
+);
+CREATE INDEX IF NOT EXISTS decisions_ts ON decisions (ts);
+CREATE INDEX IF NOT EXISTS decisions_label_ts ON decisions (label, ts);
+"""
+COLUMNS = ["ts", "station", "source", "label", "tier", "mode", "flags_mask", "unknown_mask", "paper_like",
+           "paper_stained", "paper_pixels", "stain_pixels", "stain_ratio", "total_seconds", "timings", "frame_sha256"]
+# columns added after the first release: (name, type), added to older databases on connect
+ADDED_COLUMNS = [("unknown_mask", "INTEGER")]
+
+
+def encode_flags(flags):
+    """flags dict -> int bitmask of the YES answers (None stays None)."""
+    if flags is None:
+        return None
+    mask = 0
+    for i, key in enumerate(FLAG_BITS):
+        if flags.get(key) == "YES":
+            mask |= 1 << i
+    return mask
+
+
+def decode_flags(mask):
+    return {key: "YES" if mask >> i & 1 else "NO" for i, key in enumerate(FLAG_BITS)}
+
+
+def connect(path=DB_PATH):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")       # WAL + NORMAL: durable across app crashes
+    conn.executescript(SCHEMA)
+    have = {row[1] for row in conn.execute("PRAGMA table_info(decisions)")}
+    for name, kind in ADDED_COLUMNS:
+        if name not in have:
+            conn.execute(f"ALTER TABLE decisions ADD COLUMN {name} {kind}")
+    return conn
+
+
+class ResultStore:
+    def __init__(self, path=DB_PATH, frames_dir=FRAMES_DIR, batch_size=BATCH_SIZE,
+                 flush_seconds=FLUSH_SECONDS, queue_size=QUEUE_SIZE):
+        self.path = path
+        self.frames_dir = frames_dir
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.written = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    # ---- hot path
+    def record(self, row, frame=None):
+        """Queue one row (keys from COLUMNS); `frame` is hashed/saved on the writer thread."""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((row, frame))
+        except queue.Full:
+            self.dropped += 1
+
+    def record_item(self, frame, label, flags, tier, mode, item, station=None):
+        """
+        Build a row from a classify call and its metrics trace (spans + CV
+        info). A station_name trace field (multi_station) names the station.
+        """
+        timings = {}
+        for s in item.spans:
+            timings[s["stage"]] = round(timings.get(s["stage"], 0.0) + s["seconds"], 4)
+        cv = item.fields.get("cv") or {}
+        unanswered = item.fields.get("flags_unanswered") or []
+        row = {
+            "ts": time.time(),
+            "station": item.fields.get("station_name") or station,
+            "source": None if frame.source is None else str(frame.source),
+            "label": label,
+            "tier": tier,
+            "mode": mode,
+            "flags_mask": encode_flags(flags),
+            # flags the model never answered (early-stopped stream); stored as NO in flags_mask
+            "unknown_mask": None if flags is None else encode_flags(dict.fromkeys(unanswered, "YES")),
+            "paper_like": cv.get("paper_like"),
+            "paper_stained": cv.get("paper_stained"),
+            "paper_pixels": cv.get("paper_pixels"),
+            "stain_pixels": cv.get("stain_pixels"),
+            "stain_ratio": cv.get("stain_ratio"),
+            "total_seconds": timings.get("classify"),
+            "timings": json.dumps(timings),
+        }
+        self.record(row, frame)
+
+    # ---- writer thread
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="results-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self):
+        conn = connect(self.path)
+        insert = f"INSERT INTO decisions ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = time.monotonic() + self.flush_seconds
+            while len(batch) < self.batch_size:
+                try:
+                    entry = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stopping = True
+                    break
+                batch.append(entry)
+            if not batch:
+                continue
+
+            rows = []
+            for row, frame in batch:
+                row = dict(row, frame_sha256=self._save_frame(frame))
+                rows.append([row.get(c) for c in COLUMNS])
+            try:
+                with conn:
+                    conn.executemany(insert, rows)
+                self.written += len(rows)
+            except sqlite3.Error as e:
+                self.dropped += len(rows)
+                print("⚠️ Results store write failed:", e)
+        conn.close()
+
+    def _save_frame(self, frame):
+        if frame is None:
+            return None
+        data = frame.upload_jpeg
+        digest = hashlib.sha256(data).hexdigest()
+        if self.frames_dir:
+            folder = os.path.join(self.frames_dir, digest[:2])
+            path = os.path.join(folder, digest + ".jpg")
+            if not os.path.exists(path):
+                os.makedirs(folder, exist_ok=True)
+                tmp = path + ".tmp"
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, path)
+        return digest
+
+    def close(self, timeout=5.0):
+        """Flush everything queued so far and stop the writer."""
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        self._queue.put(None)
+        thread.join(timeout)
+
+
+def frame_path(digest, frames_dir=FRAMES_DIR):
+    return os.path.join(frames_dir, digest[:2], digest + ".jpg")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarise the decisions recorded in the results store.")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--days", type=float, default=7.0, help="look back this many days")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"No results store at {args.db}.")
+        raise SystemExit(0)
+    conn = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+    since = time.time() - args.days * 86400
+
+    print(f"\n Decisions in the last {args.days:g} day(s)")
+    rows = conn.execute(
+        "SELECT date(ts, 'unixepoch', 'localtime') AS day, label, COUNT(*), AVG(total_seconds) "
+        "FROM decisions WHERE ts >= ? GROUP BY day, label ORDER BY day, label", (since,)).fetchall()
+    for day, label, count, avg in rows:
+        print(f"{day}  {label:<10} {count:>6}  avg {avg or 0:.2f}s")
+
+    print("\n By tier")
+    for tier, count in conn.execute(
+            "SELECT tier, COUNT(*) FROM decisions WHERE ts >= ? GROUP BY tier", (since,)):
+        print(f"{tier or '-':<10} {count:>6}")
+
+    print("\n Most common YES flags")
+    masks = conn.execute("SELECT flags_mask, COUNT(*) FROM decisions WHERE ts >= ? AND flags_mask IS NOT NULL "
+                         "GROUP BY flags_mask", (since,)).fetchall()
+    totals = {}
+    for mask, count in masks:
+        for key, value in decode_flags(mask).items():
+            if value == "YES":
+                totals[key] = totals.get(key, 0) + count
+    for key, count in sorted(totals.items(), key=lambda kv: -kv[1]):
+        print(f"{key:<32} {count:>6}")
@@ -0,0 +1,192 @@
+import argparse
+import queue
+import signal
+import threading
+import time
+
+import metrics
+from camera_stream import CAMERA_INDEX
+from hardware import make_camera, StartupJobs
+from frame import Frame
+from presence_gate import PresenceGate, wait_for_placement
+from camera_classifier import warmup, start_model_keeper, classify_frame_with_flags, pretty
+
+# ============================================================
+# CONTINUOUS SORTER SERVICE
+# Everything (Python, imports, model warmup, camera, LEDs) stays resident;
+# a model keeper reloads the model if Ollama unloads it while idle.
+# Three stages connected by bounded queues run as a pipeline:
+#
+#   capture  : camera -> presence gate -> Frame, JPEG/base64 pre-encoded
+#              (a full queue drops its oldest waiting item, not the new one)
+#   classify : cache / fast tier / LLaVA -> bin label
+#   actuate  : LEDs (or console)
+#
+# so item N+1 is captured and encoded while item N is in inference and
+# item N-1 is being displayed. SIGTERM / SIGINT stop it cleanly.
+# ============================================================
+QUEUE_SIZE = 2                     # items waiting between stages
+POLL_SECONDS = 0.2                 # how often idle stages re-check the stop flag
+
+
+class ConsoleActuator:
+    """Stand-in when the service runs without GPIO LEDs."""
+
+    def busy(self):
+        pass
+
+    def show(self, bin_label, hold_seconds=3.0):
+        print(f"💡 {pretty(bin_label)}")
+
+    def error(self, seconds=3.0):
+        print("💡 error")
+
+    def close(self):
+        pass
+
+
+class SorterDaemon:
+    def __init__(self, camera, actuator, gate=None, queue_size=QUEUE_SIZE, hold_seconds=3.0):
+        self.camera = camera
+        self.actuator = actuator
+        self.gate = gate or PresenceGate()
+        self.hold_seconds = hold_seconds
+        self.to_classify = queue.Queue(maxsize=queue_size)
+        self.to_actuate = queue.Queue(maxsize=queue_size)
+        self.stopping = threading.Event()
+        self.dropped = 0
+        self.processed = 0
+        self._threads = []
+
+    # ---- stages
+    def _capture_stage(self):
+        while not self.stopping.is_set():
+            ts, image = wait_for_placement(self.camera, self.gate, timeout=POLL_SECONDS * 5)
+            if image is None:
+                continue
+            frame = Frame(image, timestamp=ts, source=self.camera.source, item_box=self.gate.item_box)
+            with metrics.span("encode"):
+                frame.b64  # pre-process (crop/resize/encode) while the previous item is in inference
+            print(f"\n📥 Item placed (#{self.gate.placements})")
+            if self._put_latest(frame):
+                self.dropped += 1
+                metrics.inc("fallbacks_total", reason="queue_full")
+                print("⚠️ Classifier busy, dropped the oldest waiting placement")
+
+    def _classify_stage(self):
+        while not self.stopping.is_set():
+            try:
+                frame = self.to_classify.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                continue
+            metrics.observe("capture_to_classify", time.monotonic() - frame.timestamp)
+            self.actuator.busy()
+            try:
+                with metrics.trace(script="sorter_daemon"):
+                    label, _flags = classify_frame_with_flags(frame)
+            except Exception as e:
+                metrics.inc("fallbacks_total", reason="exception")
+                print("❌ Classification failed:", e)
+                label = "TRASH"
+            print(f"🔎 Classification result → {pretty(label)} "
+                  f"({time.monotonic() - frame.timestamp:.2f}s after placement)")
+            self.processed += 1
+            self._put(self.to_actuate, label)
+
+    def _actuate_stage(self):
+        while not self.stopping.is_set():
+            try:
+                label = self.to_actuate.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                continue
+            with metrics.span("actuate"):
+                self.actuator.show(label, self.hold_seconds)
+
+    def _put_latest(self, frame):
+        """
+        Queue frame for classification; when the queue is full the oldest waiting
+        placement makes room (the newest item is the one in front of the camera).
+        Returns True if one was dropped.
+        """
+        dropped = False
+        while True:
+            try:
+                self.to_classify.put_nowait(frame)
+                return dropped
+            except queue.Full:
+                try:
+                    self.to_classify.get_nowait()
+                    dropped = True
+                except queue.Empty:
+                    pass
+
+    def _put(self, q, item):
+        while not self.stopping.is_set():
+            try:
+                q.put(item, timeout=POLL_SECONDS)
+                return
+            except queue.Full:
+                continue
+
+    # ---- lifecycle
+    def start(self):
+        for name, target in [("capture", self._capture_stage),
+                             ("classify", self._classify_stage),
+                             ("actuate", self._actuate_stage)]:
+            t = threading.Thread(target=target, name=f"sorter-{name}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def stop(self, *_signal_args):
+        self.stopping.set()
+
+    def run_forever(self):
+        self.start()
+        while not self.stopping.wait(1.0):
+            pass
+        print("\n🛑 Stopping sorter...")
+        for t in self._threads:
+            t.join(timeout=5.0)
+        self.camera.stop()
+        self.actuator.close()
+        print(f"Processed {self.processed} item(s), dropped {self.dropped}.")
+
+
+def make_actuator(use_leds):
+    if not use_leds:
+        return ConsoleActuator()
+    from camera_classifier_led import get_leds
+    return get_leds()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the sorter as a long-lived service.")
+    parser.add_argument("--camera", type=int, default=CAMERA_INDEX, help="camera device index")
+    parser.add_argument("--no-leds", action="store_true", help="print results instead of driving GPIO LEDs")
+    parser.add_argument("--metrics-port", type=int, default=metrics.METRICS_PORT,
+                        help="Prometheus /metrics port (0 = off)")
+    args = parser.parse_args()
+
+    print("🚀 Starting sorter service (SIGTERM or Ctrl+C to stop)...")
+    startup = StartupJobs()
+    startup.start("camera", make_camera, args.camera)
+    startup.start("leds", make_actuator, not args.no_leds)
+    startup.start("warmup", warmup)
+    startup.wait()
+    startup.report()
+    if "camera" in startup.errors:
+        print("❌ Could not access camera:", startup.errors["camera"])
+        raise SystemExit(1)
+    camera = startup.results["camera"]
+    actuator = startup.results["leds"]
+    start_model_keeper()
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+        print(f"📈 Metrics on http://0.0.0.0:{args.metrics_port}/metrics")
+
+    daemon = SorterDaemon(camera, actuator)
+    signal.signal(signal.SIGTERM, daemon.stop)
+    signal.signal(signal.SIGINT, daemon.stop)
+    print("👀 Learning the empty scene, keep the area clear...")
+    daemon.run_forever()
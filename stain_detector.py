@@ -0,0 +1,142 @@
+import cv2
+import json
+import os
+import threading
+import numpy as np
+
+# ============================================================
+# FAST-PATH PAPER / STAIN DETECTOR
+# Same contract as camera_classifier.cv_detect_paper_and_stains, but:
+#   - every pixel is classified in one pass: per-channel lookup tables map
+#     H, S and V to bit flags (bit 0 = paper, bit 1 = stain) and the three
+#     channel codes are ANDed together -> 1 = paper, 3 = stain on paper
+#     (replaces three inRange passes + bitwise_or + bitwise_and)
+#   - all intermediate images live in buffers reused across frames
+#     (re-allocated only when the frame size changes)
+#   - optional fast_resize: downscale by an integer factor (OpenCV's cheap
+#     box-filter path) instead of a fractional INTER_AREA resize, which is
+#     the single most expensive step at camera resolution
+# ============================================================
+MAX_SIDE = 700                     # downscale target; None = full resolution
+STAIN_CONFIG_PATH = "stain_config.json"
+
+# StainDetector settings tune_stain_detector.py may pick
+TUNABLE = ("ratio_threshold", "min_paper_pixels", "paper_s_max", "paper_v_min",
+           "stain_s_min", "stain_v_min", "stain_h_ranges")
+
+PAPER = 1
+STAIN = 2
+
+
+class StainDetector:
+    def __init__(self, ratio_threshold=0.012, min_paper_pixels=2500,
+                 paper_s_max=70, paper_v_min=120,
+                 stain_s_min=60, stain_v_min=50, stain_h_ranges=((0, 25), (160, 179)),
+                 max_side=MAX_SIDE, fast_resize=False):
+        self.ratio_threshold = ratio_threshold
+        self.min_paper_pixels = min_paper_pixels
+        self.paper_s_max = paper_s_max
+        self.paper_v_min = paper_v_min
+        self.stain_s_min = stain_s_min
+        self.stain_v_min = stain_v_min
+        self.stain_h_ranges = tuple(tuple(r) for r in stain_h_ranges)
+        self.max_side = max_side
+        self.fast_resize = fast_resize
+
+        self.h_lut, self.s_lut, self.v_lut = self._build_luts()
+        self._kernel = np.ones((3, 3), np.uint8)
+        self._shape = None
+        self._lock = threading.Lock()
+
+    def _build_luts(self):
+        """
+        One 256-entry table per HSV channel. A pixel is paper when all three
+        channels carry the PAPER bit, a stain when all three carry STAIN.
+        """
+        values = np.arange(256)
+
+        h_bits = np.full(256, PAPER, np.uint8)
+        for lo, hi in self.stain_h_ranges:
+            h_bits[(values >= lo) & (values <= hi)] |= STAIN
+
+        s_bits = np.where(values <= self.paper_s_max, PAPER, 0).astype(np.uint8)
+        s_bits |= np.where(values >= self.stain_s_min, STAIN, 0).astype(np.uint8)
+
+        v_bits = np.where(values >= self.paper_v_min, PAPER, 0).astype(np.uint8)
+        v_bits |= np.where(values >= self.stain_v_min, STAIN, 0).astype(np.uint8)
+
+        return h_bits, s_bits, v_bits
+
+    def _buffers(self, h, w):
+        if self._shape != (h, w):
+            self._shape = (h, w)
+            self._small = np.empty((h, w, 3), np.uint8)
+            self._hsv = np.empty((h, w, 3), np.uint8)
+            self._channels = [np.empty((h, w), np.uint8) for _ in range(3)]
+            self._codes = self._channels[0]
+            self._paper = np.empty((h, w), np.uint8)
+            self._stain = np.empty((h, w), np.uint8)
+            self._opened = np.empty((h, w), np.uint8)
+
+    def detect(self, img):
+        """
+        img: BGR ndarray. Returns (paper_like_present, stained, info_dict).
+        """
+        src_h, src_w = img.shape[:2]
+        h, w = src_h, src_w
+        scale = 1.0 if self.max_side is None else self.max_side / max(h, w)
+        min_paper_pixels = self.min_paper_pixels
+        if scale < 1.0:
+            ref_h, ref_w = int(h * scale), int(w * scale)
+            if self.fast_resize:
+                factor = -(-max(h, w) // self.max_side)     # ceil
+                h, w = h // factor, w // factor
+                img = img[:h * factor, :w * factor]         # view; keeps the ratio integral
+                # the paper-area threshold was tuned for the INTER_AREA size
+                min_paper_pixels = self.min_paper_pixels * (h * w) / (ref_h * ref_w)
+            else:
+                h, w = ref_h, ref_w
+
+        with self._lock:
+            self._buffers(h, w)
+            if (h, w) != (src_h, src_w):
+                cv2.resize(img, (w, h), dst=self._small, interpolation=cv2.INTER_AREA)
+                img = self._small
+
+            cv2.cvtColor(img, cv2.COLOR_BGR2HSV, dst=self._hsv)
+            hue, sat, val = self._channels
+            cv2.split(self._hsv, self._channels)
+            cv2.LUT(hue, self.h_lut, dst=hue)
+            cv2.LUT(sat, self.s_lut, dst=sat)
+            cv2.LUT(val, self.v_lut, dst=val)
+            cv2.bitwise_and(hue, sat, dst=self._codes)
+            cv2.bitwise_and(self._codes, val, dst=self._codes)
+
+            cv2.bitwise_and(self._codes, PAPER, dst=self._paper)
+            paper_pixels = cv2.countNonZero(self._paper)
+
+            cv2.compare(self._codes, PAPER | STAIN, cv2.CMP_EQ, dst=self._stain)
+            # remove tiny specks
+            cv2.morphologyEx(self._stain, cv2.MORPH_OPEN, self._kernel, dst=self._opened, iterations=1)
+            stain_pixels = cv2.countNonZero(self._opened)
+
+        paper_like_present = paper_pixels > min_paper_pixels
+        ratio = stain_pixels / max(paper_pixels, 1)
+        stained = paper_like_present and (ratio >= self.ratio_threshold)
+
+        info = {
+            "paper_pixels": paper_pixels,
+            "stain_pixels": stain_pixels,
+            "stain_ratio": ratio,
+            "threshold": self.ratio_threshold,
+        }
+        return paper_like_present, stained, info
+
+
+def load_stain_config(path=STAIN_CONFIG_PATH):
+    """StainDetector kwargs written by tune_stain_detector.py ({} when there is none)."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        cfg = json.load(f)
+    return {key: cfg[key] for key in TUNABLE if key in cfg}
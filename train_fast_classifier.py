@@ -0,0 +1,110 @@
+import argparse
+import json
+import os
+
+import cv2
+import numpy as np
+
+from fast_classifier import FastClassifier, LABELS, extract_features
+
+# -------------------------------------
+# Train the on-device fast tier from labelled frames.
+#
+# Labels come from either
+#   - a folder of frames filed as <folder>/<COMPOST|RECYCLING|TRASH>/*.jpg, or
+#   - a JSONL log of LLaVA decisions with "path" and "category"/"label"
+#     (e.g. the output of `python code.py --batch results.jsonl`).
+#
+# Prints held-out accuracy and, per confidence threshold, the fraction of
+# items the fast tier would serve without LLaVA and its accuracy on them.
+# -------------------------------------
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def normalise_label(label):
+    label = (label or "").strip().upper()
+    return "TRASH" if label == "NONE" else label
+
+
+def samples_from_folder(folder):
+    for label in os.listdir(folder):
+        sub = os.path.join(folder, label)
+        if not os.path.isdir(sub) or normalise_label(label) not in LABELS:
+            continue
+        for filename in sorted(os.listdir(sub)):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(sub, filename), normalise_label(label)
+
+
+def samples_from_log(log_path):
+    with open(log_path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            label = normalise_label(row.get("label") or row.get("category"))
+            if label in LABELS and not row.get("error"):
+                yield row["path"], label
+
+
+def build_dataset(samples):
+    X, y, skipped = [], [], 0
+    for path, label in samples:
+        img = cv2.imread(path)
+        if img is None:
+            skipped += 1
+            continue
+        X.append(extract_features(img))
+        y.append(LABELS.index(label))
+    return np.array(X, np.float32), np.array(y, np.int64), skipped
+
+
+def coverage_report(model, X, y, thresholds):
+    p = model.predict_proba(X)
+    pred = p.argmax(axis=1)
+    conf = p.max(axis=1)
+    print(f"\n held-out accuracy (all items): {(pred == y).mean():.1%} on {len(y)} items\n")
+    print(f"{'threshold':>10}{'served':>10}{'served acc':>12}")
+    for t in thresholds:
+        served = conf >= t
+        acc = (pred[served] == y[served]).mean() if served.any() else float("nan")
+        print(f"{t:>10.2f}{served.mean():>10.1%}{acc:>12.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the fast colour-histogram classifier.")
+    parser.add_argument("folder", nargs="?", help="labelled frames: <folder>/<LABEL>/*.jpg")
+    parser.add_argument("--log", help="JSONL log of LLaVA decisions (path + category)")
+    parser.add_argument("--out", default="fast_classifier.npz")
+    parser.add_argument("--holdout", type=float, default=0.2, help="share of items held out for the report")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if not args.folder and not args.log:
+        parser.error("give a labelled folder and/or --log")
+
+    samples = []
+    if args.folder:
+        samples += list(samples_from_folder(args.folder))
+    if args.log:
+        samples += list(samples_from_log(args.log))
+
+    X, y, skipped = build_dataset(samples)
+    print(f"\n Loaded {len(y)} frames ({skipped} unreadable): " +
+          ", ".join(f"{label}={int((y == i).sum())}" for i, label in enumerate(LABELS)))
+    if len(y) < 2:
+        print("Not enough labelled frames to train.")
+        raise SystemExit(1)
+
+    order = np.random.default_rng(args.seed).permutation(len(y))
+    n_test = int(len(y) * args.holdout)
+    test, train = order[:n_test], order[n_test:]
+
+    if n_test:
+        model = FastClassifier.train(X[train], y[train])
+        coverage_report(model, X[test], y[test], [0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99])
+
+    # final model uses every labelled frame
+    model = FastClassifier.train(X, y)
+    model.save(args.out)
+    print(f"\n✅ Saved model to {args.out}")
@@ -0,0 +1,245 @@
+import argparse
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from datasets import iter_images, read_manifest
+from stain_detector import StainDetector, MAX_SIDE, STAIN_CONFIG_PATH, TUNABLE, load_stain_config
+
+# -------------------------------------
+# Tune the CV stain detector (ratio threshold, minimum paper area and the
+# paper / stain HSV ranges) on labelled images and write stain_config.json,
+# which camera_classifier loads at start-up (stain_detector.load_stain_config).
+#
+# Labels: parent folder STAINED / CLEAN / NO_PAPER, or a CSV/JSONL manifest
+# with path,label columns (paths relative to the manifest).
+#
+# 1. Every image is reduced ONCE to a small 3-D HSV histogram whose bin
+#    edges are exactly the candidate bounds below, so the paper and stain
+#    pixel counts of any candidate are box sums over a cumulative
+#    histogram. All range candidates x thresholds x min paper areas are
+#    then scored with a few numpy operations, without touching pixels.
+# 2. The histogram ignores the detector's speck-removing opening, so the
+#    TOP_K candidates are re-checked with the real StainDetector and the
+#    best exact accuracy wins (it must not be worse than the current one).
+#
+#   python tune_stain_detector.py stain_dataset/
+#   python tune_stain_detector.py --manifest stains.csv --cache stain_hist.npz
+# -------------------------------------
+TARGETS = ["NO_PAPER", "CLEAN", "STAINED"]
+
+PAPER_S_MAX = [50, 60, 70, 80, 90]         # paper: S <= paper_s_max
+PAPER_V_MIN = [100, 120, 140, 160]         #        V >= paper_v_min
+STAIN_S_MIN = [40, 50, 60]                 # stain: S >= stain_s_min
+STAIN_V_MIN = [30, 50, 70]                 #        V >= stain_v_min
+STAIN_H_LOW = [15, 20, 25, 30]             #        H in [0, low] (red / orange / brown) ...
+STAIN_H_HIGH = [150, 160, 170]             #        ... or [high, 179] (red wrapping round)
+RATIO_THRESHOLDS = np.geomspace(0.002, 0.1, 40)
+MIN_PAPER_PIXELS = [1500, 2500, 4000]
+TOP_K = 20
+RANGE_CHUNK = 256                          # range candidates scored per numpy step
+
+
+def load_labelled(folder=None, manifest=None):
+    """[(path, target index)]"""
+    if manifest:
+        pairs = read_manifest(manifest)
+    else:
+        pairs = [(p, os.path.basename(os.path.dirname(p)).upper()) for p in iter_images(folder)]
+    return [(path, TARGETS.index(label)) for path, label in pairs if label in TARGETS]
+
+
+def load_image(path, max_side=MAX_SIDE):
+    """BGR image at the size the detector works on (same INTER_AREA downscale)."""
+    img = cv2.imread(path)
+    if img is None:
+        return None
+    h, w = img.shape[:2]
+    scale = 1.0 if max_side is None else max_side / max(h, w)
+    if scale < 1.0:
+        img = cv2.resize(img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+    return img
+
+
+# ---- 1. histograms
+def bin_edges():
+    """Per-channel bin edges: every candidate bound starts a new bin (upper bounds are inclusive)."""
+    h = sorted({0, 180} | {v + 1 for v in STAIN_H_LOW} | set(STAIN_H_HIGH))
+    s = sorted({0, 256} | {v + 1 for v in PAPER_S_MAX} | set(STAIN_S_MIN))
+    v = sorted({0, 256} | set(PAPER_V_MIN) | set(STAIN_V_MIN))
+    return h, s, v
+
+
+def hsv_histogram(img, edges):
+    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+    values = np.arange(256)
+    luts = [(np.searchsorted(e, values, side="right") - 1).astype(np.int32) for e in edges]
+    n_s, n_v = len(edges[1]) - 1, len(edges[2]) - 1
+    index = (luts[0][hsv[..., 0]] * n_s + luts[1][hsv[..., 1]]) * n_v + luts[2][hsv[..., 2]]
+    size = (len(edges[0]) - 1) * n_s * n_v
+    return np.bincount(index.ravel(), minlength=size).reshape(len(edges[0]) - 1, n_s, n_v)
+
+
+def build_histograms(items, edges, cache=None):
+    key = json.dumps([[(p, os.path.getmtime(p)) for p, _ in items], edges])
+    if cache and os.path.exists(cache):
+        data = np.load(cache)
+        if str(data["key"]) == key:
+            return data["hists"], data["valid"]
+    hists, valid = [], []
+    shape = tuple(len(e) - 1 for e in edges)
+    for path, _target in items:
+        img = load_image(path)
+        valid.append(img is not None)
+        hists.append(hsv_histogram(img, edges) if img is not None else np.zeros(shape, np.int64))
+    hists, valid = np.array(hists, dtype=np.int64), np.array(valid)
+    if cache:
+        np.savez_compressed(cache, key=key, hists=hists, valid=valid)
+    return hists, valid
+
+
+# ---- 2. vectorized sweep
+def range_candidates():
+    grid = np.array(np.meshgrid(PAPER_S_MAX, PAPER_V_MIN, STAIN_S_MIN, STAIN_V_MIN, STAIN_H_LOW, STAIN_H_HIGH,
+                                indexing="ij")).reshape(6, -1).T
+    return grid
+
+
+def pixel_counts(hists, edges, candidates):
+    """(paper, stain-on-paper) pixel counts, each (images, candidates), from cumulative histograms."""
+    cum = np.zeros((len(hists),) + tuple(len(e) for e in edges), dtype=np.int64)
+    cum[:, 1:, 1:, 1:] = hists.cumsum(1).cumsum(2).cumsum(3)
+    h_at, s_at, v_at = ({value: i for i, value in enumerate(e)} for e in edges)
+    n_h = len(edges[0]) - 1
+
+    def box(h0, h1, s0, s1, v0, v1):
+        s1 = np.maximum(s0, s1)            # empty S window -> 0 pixels
+        return (cum[:, h1, s1, v1] - cum[:, h0, s1, v1] - cum[:, h1, s0, v1] - cum[:, h1, s1, v0]
+                + cum[:, h0, s0, v1] + cum[:, h0, s1, v0] + cum[:, h1, s0, v0] - cum[:, h0, s0, v0])
+
+    def idx(lookup, values):
+        return np.array([lookup[v] for v in values])
+
+    s_max, v_min, st_s, st_v, h_low, h_high = candidates.T
+    zeros = np.zeros(len(candidates), dtype=np.int64)
+    s_paper = idx(s_at, s_max + 1)
+    v_paper = idx(v_at, v_min)
+    paper = box(zeros, zeros + n_h, zeros, s_paper, v_paper, zeros + len(edges[2]) - 1)
+
+    # stain pixels only count on paper: S in [stain_s_min, paper_s_max], V above both minimums
+    s_stain = idx(s_at, st_s)
+    v_stain = np.maximum(v_paper, idx(v_at, st_v))
+    v_top = zeros + len(edges[2]) - 1
+    stain = (box(zeros, idx(h_at, h_low + 1), s_stain, s_paper, v_stain, v_top)
+             + box(idx(h_at, h_high), zeros + n_h, s_stain, s_paper, v_stain, v_top))
+    return paper, stain
+
+
+def sweep(paper, stain, targets):
+    """Correct counts, shape (candidates, thresholds, min paper areas)."""
+    thresholds = RATIO_THRESHOLDS[:, None, None].astype(np.float32)
+    min_paper = np.array(MIN_PAPER_PIXELS)[:, None, None]
+    is_none, is_clean, is_stained = ((targets == i).astype(np.float32)[:, None] for i in range(3))
+    scores = []
+    for lo in range(0, paper.shape[1], RANGE_CHUNK):
+        p = paper[:, lo:lo + RANGE_CHUNK]
+        ratio = (stain[:, lo:lo + RANGE_CHUNK] / np.maximum(p, 1)).astype(np.float32)
+        has_paper = (p[None] > min_paper).astype(np.float32)                  # (M, N, R)
+        stained = (ratio[None] >= thresholds).astype(np.float32)              # (T, N, R)
+        correct = (np.einsum("mnr,tnr->rtm", has_paper * is_stained, stained)
+                   + np.einsum("mnr,tnr->rtm", has_paper * is_clean, 1.0 - stained)
+                   + ((1.0 - has_paper) * is_none).sum(1).T[:, None, :])
+        scores.append(correct)
+    return np.concatenate(scores)
+
+
+def drift(candidates, current):
+    """How far each setting moves from the current one, shape (candidates, thresholds, min paper areas)."""
+    grid = [PAPER_S_MAX, PAPER_V_MIN, STAIN_S_MIN, STAIN_V_MIN, STAIN_H_LOW, STAIN_H_HIGH]
+    now = [current["paper_s_max"], current["paper_v_min"], current["stain_s_min"], current["stain_v_min"],
+           current["stain_h_ranges"][0][1], current["stain_h_ranges"][-1][0]]
+    ranges = sum(np.abs(candidates[:, i] - now[i]) / (max(g) - min(g)) for i, g in enumerate(grid))
+    log_thr = np.log(RATIO_THRESHOLDS)
+    thresholds = np.abs(log_thr - np.log(current["ratio_threshold"])) / (log_thr[-1] - log_thr[0])
+    min_paper = np.abs(np.array(MIN_PAPER_PIXELS) - current["min_paper_pixels"]) / np.ptp(MIN_PAPER_PIXELS)
+    return ranges[:, None, None] + thresholds[None, :, None] + min_paper[None, None, :]
+
+
+def detector_kwargs(candidate, threshold, min_paper):
+    s_max, v_min, st_s, st_v, h_low, h_high = (int(x) for x in candidate)
+    return {"ratio_threshold": round(float(threshold), 5), "min_paper_pixels": int(min_paper),
+            "paper_s_max": s_max, "paper_v_min": v_min, "stain_s_min": st_s, "stain_v_min": st_v,
+            "stain_h_ranges": [[0, h_low], [h_high, 179]]}
+
+
+# ---- 3. exact check
+def exact_accuracy(kwargs_list, items):
+    detectors = [StainDetector(**kw) for kw in kwargs_list]
+    correct = np.zeros(len(detectors), dtype=np.int64)
+    for path, target in items:
+        img = load_image(path)
+        if img is None:
+            continue
+        for i, detector in enumerate(detectors):
+            paper_like, stained, _info = detector.detect(img)
+            correct[i] += (2 if stained else 1 if paper_like else 0) == target
+    return correct
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tune the stain detector's threshold and HSV ranges.")
+    parser.add_argument("folder", nargs="?", default="images",
+                        help="images under STAINED/ CLEAN/ NO_PAPER/ sub-folders")
+    parser.add_argument("--manifest", help="CSV (path,label) or JSONL manifest instead of folder names")
+    parser.add_argument("--cache", help="keep the per-image histograms in this .npz between runs")
+    parser.add_argument("--out", default=STAIN_CONFIG_PATH)
+    args = parser.parse_args()
+
+    items = load_labelled(args.folder, args.manifest)
+    if not items:
+        print("No labelled images found (expected STAINED/ CLEAN/ NO_PAPER/ folders or a --manifest).")
+        raise SystemExit(0)
+
+    t0 = time.perf_counter()
+    edges = bin_edges()
+    hists, valid = build_histograms(items, edges, args.cache)
+    items = [item for item, ok in zip(items, valid) if ok]
+    hists = hists[valid]
+    targets = np.array([t for _p, t in items])
+    t_hist = time.perf_counter()
+
+    candidates = range_candidates()
+    paper, stain = pixel_counts(hists, edges, candidates)
+    scores = sweep(paper, stain, targets)
+    t_sweep = time.perf_counter()
+    print(f"\n {len(items)} image(s): histograms {t_hist - t0:.1f}s, "
+          f"{scores.size:,} settings scored in {t_sweep - t_hist:.2f}s")
+
+    # best TOP_K by histogram accuracy (ties: smallest change from the current settings), then the real detector
+    # the settings in use now: a previous run's config on top of the defaults
+    current = {key: getattr(StainDetector(**load_stain_config(args.out)), key) for key in TUNABLE}
+    flat = np.lexsort((drift(candidates, current).ravel(), -scores.ravel()))[:TOP_K]
+    shortlist = []
+    for r, t, m in zip(*np.unravel_index(flat, scores.shape)):
+        shortlist.append(detector_kwargs(candidates[r], RATIO_THRESHOLDS[t], MIN_PAPER_PIXELS[m]))
+    exact = exact_accuracy([current] + shortlist, items)
+    print(f"Current settings: {exact[0]}/{len(items)} ({exact[0] / len(items):.1%})")
+
+    best = 1 + int(np.argmax(exact[1:]))
+    print(f"\n{'histogram':>10}{'exact':>8}  settings")
+    for i, kw in enumerate(shortlist, start=1):
+        marker = " <" if i == best else ""
+        print(f"{scores.ravel()[flat[i - 1]] / len(items):>10.1%}{exact[i] / len(items):>8.1%}  {kw}{marker}")
+
+    if exact[best] < exact[0]:
+        print("\nNo candidate beats the current settings; leaving the config unchanged.")
+        raise SystemExit(1)
+
+    chosen = dict(shortlist[best - 1], accuracy=round(exact[best] / len(items), 4), validation_images=len(items))
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(chosen, f, indent=2)
+    print(f"\n✅ Accuracy {exact[0] / len(items):.1%} -> {chosen['accuracy']:.1%}, written to {args.out} "
+          f"({time.perf_counter() - t0:.1f}s total)")
@@ -0,0 +1,70 @@
+import argparse
+import json
+
+from frame import UPLOAD_CONFIG_PATH
+import camera_classifier
+from camera_classifier import warmup, classify_frame_with_flags
+from datasets import iter_frames
+
+# -------------------------------------
+# Adaptive upload size: find the smallest (max_side, JPEG quality) whose
+# decisions match the full-resolution upload on a validation folder, and
+# write it to upload_config.json (loaded by frame.load_upload_config()).
+# Candidates are tried from the smallest average payload upwards, so we
+# stop after the first one that is stable.
+# -------------------------------------
+MAX_SIDES = [224, 336, 448, 560, 672, 896]
+QUALITIES = [60, 75, 85]
+
+
+def decide(frame):
+    label, _flags = classify_frame_with_flags(frame, use_cache=False, use_fast_tier=False)
+    return label
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pick the smallest upload size that keeps decisions stable.")
+    parser.add_argument("folder", nargs="?", default="images", help="validation images")
+    parser.add_argument("--min-agreement", type=float, default=1.0,
+                        help="share of images that must match the full-resolution decision")
+    parser.add_argument("--out", default=UPLOAD_CONFIG_PATH)
+    args = parser.parse_args()
+
+    frames = list(iter_frames(args.folder))
+    if not frames:
+        print("No images found.")
+        raise SystemExit(0)
+    warmup()
+    camera_classifier.configure()      # tuning runs are not real decisions
+
+    print(f"\n Reference decisions at full resolution for {len(frames)} image(s)...")
+    reference = [decide(f.with_upload(0, 95)) for f in frames]
+    full_bytes = sum(len(f.with_upload(0, 95).upload_jpeg) for f in frames) / len(frames)
+
+    # order candidates by average payload size (cheap: encode only, no model calls)
+    candidates = []
+    for max_side in MAX_SIDES:
+        for quality in QUALITIES:
+            size = sum(len(f.with_upload(max_side, quality).upload_jpeg) for f in frames) / len(frames)
+            candidates.append((size, max_side, quality))
+    candidates.sort()
+
+    print(f"\n{'max_side':>9}{'quality':>9}{'avg bytes':>12}{'vs full':>9}{'agreement':>11}")
+    chosen = None
+    for size, max_side, quality in candidates:
+        labels = [decide(f.with_upload(max_side, quality)) for f in frames]
+        agreement = sum(a == b for a, b in zip(labels, reference)) / len(frames)
+        print(f"{max_side:>9}{quality:>9}{size:>12.0f}{size / full_bytes:>9.0%}{agreement:>11.0%}")
+        if agreement >= args.min_agreement:
+            chosen = {"max_side": max_side, "quality": quality, "avg_bytes": round(size),
+                      "agreement": agreement, "validation_images": len(frames)}
+            break
+
+    if chosen is None:
+        print("\nNo candidate kept decisions stable; leaving the current config unchanged.")
+        raise SystemExit(1)
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(chosen, f, indent=2)
+    print(f"\n✅ max_side={chosen['max_side']} quality={chosen['quality']} "
+          f"({chosen['avg_bytes']} bytes/image) written to {args.out}")